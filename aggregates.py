@@ -0,0 +1,221 @@
+"""
+Live scan counts per branch, per user and per day.
+
+The CSV backend keeps them in scans.counts.json, updated by db.py in the
+same locked section that appends scans or tombstones, so a dashboard reads a
+small file instead of the scans table. The file is a journal of JSON lines:
+the first holds the full counts, each later one the delta of one write
+(a few [branch, user, day, n] entries), so a write appends one short line
+instead of rewriting every count. Readers fold new lines into their cached
+counts as they appear; once the deltas outgrow the counts they are folded
+into a fresh first line.
+
+Each update records a watermark (sizes of scans.csv / scans.deleted and the
+snapshot version) of what it covers. If a writer finds the watermark does not
+match the files before applying its delta (a crash between the append and
+the counts update, or a writer that predates this file), the counts are
+rebuilt from the table first. Readers (get_scan_counts) make the same check,
+so after a failed update they recount from the table instead of serving
+stale counts. `python manage.py rebuild-counts` recomputes everything from
+scratch.
+
+The SQLite backend keeps the same counts in a table maintained by triggers
+(see db_sqlite.py); both return the shape produced by empty_counts().
+"""
+import json
+import os
+import threading
+from collections import Counter
+
+COUNTS_FILE = 'scans.counts.json'
+# Fold the deltas into a new first line once they are this much larger than it
+COMPACT_RATIO = 4
+COMPACT_MIN_BYTES = 1024 * 1024
+
+def empty_counts():
+    return {
+        'total': 0,
+        'by_branch': {},
+        'by_user': {},
+        'by_day': {},
+        'by_branch_user': {},  # branch -> {user: n}
+        'by_branch_day': {},   # branch -> {day: n}
+    }
+
+def _bump(d, key, delta):
+    n = d.get(key, 0) + delta
+    if n > 0:
+        d[key] = n
+    else:
+        d.pop(key, None)
+
+def delta_from_rows(rows, sign=1):
+    """
+    rows: dicts with created_by, branch_code, created_date ('YYYY-MM-DD HH:MM:SS').
+    Returns [[branch, user, day, n], ...], one entry per distinct key, n signed.
+    """
+    delta = Counter((str(row['branch_code']), str(row['created_by']), str(row['created_date'])[:10])
+                    for row in rows)
+    return [[branch, user, day, n * sign] for (branch, user, day), n in delta.items()]
+
+def apply_delta(counts, delta):
+    """
+    Returns new counts with delta applied. Only the dicts the delta touches are
+    copied; the per-branch breakdowns of other branches are shared with `counts`,
+    which readers may still hold.
+    """
+    counts = dict(counts)
+    for key in ('by_branch', 'by_user', 'by_day', 'by_branch_user', 'by_branch_day'):
+        counts[key] = dict(counts[key])
+    copied = set()
+    for branch, user, day, n in delta:
+        counts['total'] += n
+        _bump(counts['by_branch'], branch, n)
+        _bump(counts['by_user'], user, n)
+        _bump(counts['by_day'], day, n)
+        for nested, key in (('by_branch_user', user), ('by_branch_day', day)):
+            if (nested, branch) not in copied:
+                counts[nested][branch] = dict(counts[nested].get(branch, {}))
+                copied.add((nested, branch))
+            inner = counts[nested].setdefault(branch, {})
+            _bump(inner, key, n)
+            if not inner:
+                del counts[nested][branch]
+    return counts
+
+def counts_from_frame(df):
+    """Full recount from a scans DataFrame (vectorized)."""
+    counts = empty_counts()
+    if df is None or df.empty:
+        return counts
+    frame = df[['created_by', 'branch_code']].astype(str)
+    frame = frame.assign(day=df['created_date'].astype(str).str[:10])
+    counts['total'] = int(len(frame))
+    for key, col in (('by_branch', 'branch_code'), ('by_user', 'created_by'), ('by_day', 'day')):
+        counts[key] = {k: int(v) for k, v in frame[col].value_counts().items()}
+    for key, col in (('by_branch_user', 'created_by'), ('by_branch_day', 'day')):
+        nested = {}
+        for (branch, value), n in frame.groupby(['branch_code', col]).size().items():
+            nested.setdefault(branch, {})[value] = int(n)
+        counts[key] = nested
+    return counts
+
+def for_branch(counts, branch):
+    """The same shape restricted to one branch."""
+    by_user = dict(counts['by_branch_user'].get(branch, {}))
+    by_day = dict(counts['by_branch_day'].get(branch, {}))
+    return {
+        'total': counts['by_branch'].get(branch, 0),
+        'by_branch': {branch: counts['by_branch'][branch]} if branch in counts['by_branch'] else {},
+        'by_user': by_user,
+        'by_day': by_day,
+        'by_branch_user': {branch: by_user} if by_user else {},
+        'by_branch_day': {branch: by_day} if by_day else {},
+    }
+
+class CountsFile:
+    """
+    Process-wide cache of the counts journal; writers must hold db's scans lock.
+    get() never changes a dict it has returned, so callers can read it while
+    writers move on.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._file_id = None
+        self._offset = 0
+        self._counts = None
+        self._watermark = None
+        self._torn = False
+        self._snapshot_bytes = 0
+
+    def _load(self):
+        # Folds in only the lines appended since the last call; a replaced file starts over
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            self._reset()
+            return
+        if (st.st_dev, st.st_ino) != self._file_id or st.st_size < self._offset:
+            self._reset()
+            self._file_id = (st.st_dev, st.st_ino)
+        if st.st_size == self._offset:
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            data = f.read(st.st_size - self._offset)
+        end = data.rfind(b'\n') + 1
+        if self._offset == 0 and end == 0:
+            end = len(data)  # written before the journal format: one object, no newline
+        for line in data[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # Torn append from a crashed writer: the counts past it are unknown,
+                # and no watermark makes the next write rebuild them
+                self._torn = True
+                continue
+            if 'counts' in entry:
+                self._counts = entry['counts']
+                self._snapshot_bytes = len(line)
+            elif self._counts is not None:
+                self._counts = apply_delta(self._counts, entry['delta'])
+            self._watermark = entry['watermark']
+        self._offset += end
+
+    def get(self):
+        """Current counts, or None if they have never been built."""
+        with self._lock:
+            self._load()
+            return self._counts
+
+    def watermark(self):
+        with self._lock:
+            self._load()
+            return None if self._torn else self._watermark
+
+    def save(self, counts, watermark):
+        """Replaces the journal with one line holding the full counts."""
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'watermark': watermark, 'counts': counts}, f, separators=(',', ':'))
+            f.write('\n')
+        os.replace(tmp_path, self.path)
+        with self._lock:
+            self._reset()
+            self._load()
+
+    def append(self, delta, watermark):
+        """Appends the delta of one write (see delta_from_rows)."""
+        line = json.dumps({'watermark': watermark, 'delta': delta}, separators=(',', ':')) + '\n'
+        if os.path.exists(self.path) and os.path.getsize(self.path):
+            with open(self.path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    line = '\n' + line  # start on a fresh line after a torn one
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(line)
+        with self._lock:
+            self._load()
+            counts, watermark = self._counts, None if self._torn else self._watermark
+            journal_bytes = self._offset - self._snapshot_bytes
+        # Compact once replaying the deltas costs more than reading the counts
+        if counts is not None and watermark is not None \
+                and journal_bytes > max(COMPACT_MIN_BYTES, COMPACT_RATIO * self._snapshot_bytes):
+            self.save(counts, watermark)
+
+_files = {}
+_files_lock = threading.Lock()
+
+def get_counts_file(path=COUNTS_FILE):
+    key = os.path.abspath(path)
+    with _files_lock:
+        counts_file = _files.get(key)
+        if counts_file is None:
+            counts_file = _files[key] = CountsFile(path)
+        return counts_file
@@ -0,0 +1,266 @@
+"""
+Offline re-decode and audit of the scanned_images archive.
+
+Walks scanned_images/ (lazily, so tens of thousands of photos never sit in
+memory as a list), decodes every photo again through decode_pool with the
+strongest settings (full ladder, no time budget, larger working size, multi
+mode) on all cores, and compares what it reads with what was recorded:
+
+  - content-addressed photos (see image_store.py): the barcodes linked to the
+    photo in scanned_images/manifest.csv;
+  - legacy photos named {barcode}_{YYYYmmdd}_{HHMMSS}.jpg: the filename.
+
+Each decoded photo is appended to a checkpoint CSV as it finishes, so an
+interrupted run picks up where it stopped. At the end the report lists
+every photo whose status is not 'ok':
+
+    mismatch        decoded code(s) differ from the recorded barcode
+    partial         multi-code photo where some recorded barcodes were not read
+    multiple_codes  the recorded barcode was read, plus other codes
+    no_code         nothing decoded at all
+    unreadable      not a decodable image, or its decode timed out / crashed
+    unrecorded      no manifest entry and no barcode in the filename
+    not_in_scans    the recorded barcode is no longer in the scans table
+
+Usage:
+    python audit_images.py
+    python audit_images.py --workers 8 --report audit_report.csv
+    python audit_images.py --restart          # ignore the previous checkpoint
+"""
+import csv
+import os
+import re
+import sys
+import time
+from collections import deque
+
+import image_store
+
+CHECKPOINT_FILE = 'scanned_images.audit.csv'
+REPORT_FILE = 'audit_report.csv'
+CHECKPOINT_COLUMNS = ['image_path', 'codes', 'symbologies', 'strategy', 'error', 'decode_ms']
+REPORT_COLUMNS = ['image_path', 'source', 'expected', 'decoded', 'strategy', 'status', 'detail']
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+# Slower than the camera path on purpose: nobody is waiting on an audit
+AUDIT_ENGINE_OPTIONS = {'budget_ms': None, 'max_side': 2560}
+AUDIT_JOB_TIMEOUT = 60
+UNREADABLE = "Could not decode image data"  # DecoderEngine.decode's message for non-images
+_LEGACY_NAME = re.compile(r'^(?P<barcode>.+)_\d{8}_\d{6}\.jpe?g$', re.IGNORECASE)
+
+def iter_images(root):
+    """Yields photo paths under root, depth first; thumbnails and temp files are skipped."""
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            entries = sorted(os.scandir(directory), key=lambda e: e.name)
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                stack.append(entry.path)
+            elif entry.name.lower().endswith(IMAGE_EXTENSIONS) and '.thumb.' not in entry.name:
+                yield entry.path
+
+def _key(path):
+    return os.path.normpath(os.path.abspath(path))
+
+def load_manifest(root):
+    """image path -> list of barcodes linked to it (several for multi-code photos)."""
+    expected = {}
+    path = os.path.join(root, image_store.MANIFEST_NAME)
+    if not os.path.exists(path):
+        return expected
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            codes = expected.setdefault(_key(row['image_path']), [])
+            if row['barcode'] not in codes:
+                codes.append(row['barcode'])
+    return expected
+
+def expected_for(path, manifest):
+    """Returns (source, [barcodes])."""
+    codes = manifest.get(_key(path))
+    if codes:
+        return 'manifest', codes
+    match = _LEGACY_NAME.match(os.path.basename(path))
+    if match:
+        return 'filename', [match.group('barcode')]
+    return 'unknown', []
+
+class Checkpoint:
+    """Append-only CSV of decoded photos; the set of paths in it is what a resumed run skips."""
+    def __init__(self, path, restart=False):
+        self.path = path
+        if restart and os.path.exists(path):
+            os.remove(path)
+        self.done = set()
+        if os.path.exists(path):
+            self._drop_partial_line()
+            with open(path, newline='', encoding='utf-8') as f:
+                self.done = {_key(row['image_path']) for row in csv.DictReader(f)}
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, 'a', newline='', encoding='utf-8')
+        self._writer = csv.DictWriter(self._file, fieldnames=CHECKPOINT_COLUMNS)
+        if new_file:
+            self._writer.writeheader()
+
+    def _drop_partial_line(self):
+        # A run killed mid-write can leave half a row; cut back to the last newline
+        with open(self.path, 'rb+') as f:
+            data = f.read()
+            if data and not data.endswith(b'\n'):
+                f.truncate(data.rfind(b'\n') + 1)
+
+    def record(self, path, result, error=''):
+        self._writer.writerow({
+            'image_path': path,
+            'codes': '|'.join(code for code, _ in result.codes) if result else '',
+            'symbologies': '|'.join(sym for _, sym in result.codes) if result else '',
+            'strategy': (result.strategy or '') if result else '',
+            'error': error,
+            'decode_ms': f"{result.total_ms:.0f}" if result else '',
+        })
+        self.done.add(_key(path))
+
+    def flush(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+def decode_archive(root, checkpoint, workers=None, progress_every=500):
+    """
+    Decodes every photo under root that the checkpoint does not already have.
+    Keeps at most a few jobs per worker in flight. Returns (decoded, skipped).
+    """
+    import decode_pool
+    workers = workers or decode_pool.DEFAULT_WORKERS
+    window = workers * 4
+    pool = decode_pool.DecodePool(workers=workers, max_queue=window, job_timeout=AUDIT_JOB_TIMEOUT,
+                                  engine_options=AUDIT_ENGINE_OPTIONS)
+    in_flight = deque()
+    decoded = skipped = 0
+    started = time.perf_counter()
+
+    def collect(path, future):
+        result = future.result()
+        # Timeouts and crashed workers are recorded too: they are findings, and --restart retries them
+        if result.retryable or (not result.strategy and any(d.startswith(UNREADABLE) for d in result.debug)):
+            checkpoint.record(path, None, '; '.join(result.debug))
+        else:
+            checkpoint.record(path, result)
+
+    try:
+        for path in iter_images(root):
+            if _key(path) in checkpoint.done:
+                skipped += 1
+                continue
+            try:
+                with open(path, 'rb') as f:
+                    image_bytes = f.read()
+            except OSError as e:
+                checkpoint.record(path, None, str(e))
+                continue
+            in_flight.append((path, pool.submit(image_bytes, multi=True, submit_timeout=AUDIT_JOB_TIMEOUT)))
+            while len(in_flight) >= window:
+                collect(*in_flight.popleft())
+                decoded += 1
+                if decoded % progress_every == 0:
+                    checkpoint.flush()
+                    rate = decoded / (time.perf_counter() - started)
+                    print(f"{decoded} decoded ({rate:.1f}/s), {skipped} already in checkpoint")
+        while in_flight:
+            collect(*in_flight.popleft())
+            decoded += 1
+    finally:
+        checkpoint.flush()
+        pool.shutdown()
+    return decoded, skipped
+
+def classify(expected, decoded, error):
+    """Returns (status, detail) for one photo."""
+    if error:
+        return 'unreadable', error
+    if not decoded:
+        return 'no_code', ''
+    if not expected:
+        return 'unrecorded', ''
+    found = [c for c in expected if c in decoded]
+    if not found:
+        return 'mismatch', f"recorded {', '.join(expected)}, read {', '.join(decoded)}"
+    if len(found) < len(expected):
+        missing = [c for c in expected if c not in decoded]
+        return 'partial', f"not read: {', '.join(missing)}"
+    extra = [c for c in decoded if c not in expected]
+    if extra:
+        return 'multiple_codes', f"also read: {', '.join(extra)}"
+    return 'ok', ''
+
+def build_report(root, checkpoint_path, report_path):
+    """Writes the rows with a status other than 'ok'; returns {status: count} over all photos."""
+    import pandas as pd
+
+    import db
+    manifest = load_manifest(root)
+    frame = pd.read_csv(checkpoint_path, dtype=str, keep_default_na=False)
+    # Keep the latest row per photo if the checkpoint was ever shared by two runs
+    frame = frame.drop_duplicates('image_path', keep='last')
+
+    rows = []
+    for path, codes, strategy, error in frame[['image_path', 'codes', 'strategy', 'error']].itertuples(index=False):
+        source, expected = expected_for(path, manifest)
+        decoded = codes.split('|') if codes else []
+        status, detail = classify(expected, decoded, error)
+        rows.append({'image_path': path, 'source': source, 'expected': '|'.join(expected),
+                     'decoded': codes, 'strategy': strategy, 'status': status, 'detail': detail})
+    report = pd.DataFrame(rows, columns=REPORT_COLUMNS)
+
+    # Recorded barcodes that were later deleted from the table (one batch lookup)
+    ok = report['status'] == 'ok'
+    recorded = report.loc[ok, 'expected'].str.split('|').explode()
+    in_db, err = db.check_duplicate_barcodes(recorded.unique().tolist())
+    if err:
+        raise RuntimeError(err)
+    gone = recorded[~recorded.isin(in_db)]
+    if not gone.empty:
+        detail = gone.groupby(level=0).agg(', '.join)
+        report.loc[detail.index, 'status'] = 'not_in_scans'
+        report.loc[detail.index, 'detail'] = detail
+
+    report[report['status'] != 'ok'].to_csv(report_path, index=False)
+    return report['status'].value_counts().to_dict()
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Re-decode the scanned_images archive and report misreads.")
+    parser.add_argument('--root', default=image_store.IMAGES_DIR)
+    parser.add_argument('--checkpoint', default=CHECKPOINT_FILE)
+    parser.add_argument('--report', default=REPORT_FILE)
+    parser.add_argument('--workers', type=int, help="decode processes (default: usable CPUs)")
+    parser.add_argument('--restart', action='store_true', help="discard the checkpoint and decode everything")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.root):
+        print(f"No image directory at {args.root}")
+        return 1
+    checkpoint = Checkpoint(args.checkpoint, restart=args.restart)
+    started = time.perf_counter()
+    try:
+        decoded, skipped = decode_archive(args.root, checkpoint, workers=args.workers)
+    except KeyboardInterrupt:
+        print(f"Interrupted; rerun to resume from {args.checkpoint}")
+        return 130
+    finally:
+        checkpoint.close()
+    print(f"Decoded {decoded} photos ({skipped} from checkpoint) in {time.perf_counter() - started:.1f} s")
+
+    counts = build_report(args.root, args.checkpoint, args.report)
+    print(", ".join(f"{status}: {n}" for status, n in sorted(counts.items())))
+    print(f"Report written to {args.report}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
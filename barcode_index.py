@@ -0,0 +1,112 @@
+"""
+Process-wide barcode index over the append-only scans log.
+
+The index keeps barcode -> scan_id for every live row in a dict and tails
+scans.csv / scans.deleted from the last byte offset it has seen, so a
+duplicate check costs a stat() and a hash lookup instead of a CSV parse.
+If either file is replaced or truncated (compaction, manual edit) the index
+is rebuilt from scratch.
+"""
+import os
+import threading
+
+import pandas as pd
+
+import columnar
+import csv_tail
+
+class BarcodeIndex:
+    """
+    Hash index of live barcodes, shared by every session in the process.
+    Use get_index() rather than constructing one directly.
+    """
+    def __init__(self, scans_file, tombstone_file, snapshot_dir=None):
+        self.snapshot_dir = snapshot_dir
+        self.scans = csv_tail.CsvTail(scans_file)
+        self.tombstones = csv_tail.CsvTail(tombstone_file)
+        self._barcodes = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._barcodes)
+
+    def _rebuild(self):
+        # Retry if a compaction swaps the snapshot while we are loading
+        for _ in range(3):
+            self.scans = csv_tail.CsvTail(self.scans.path)
+            self.tombstones = csv_tail.CsvTail(self.tombstones.path)
+            self._barcodes = {}
+
+            # Columnar base first (just the two columns we need, memory-mapped)
+            version = columnar.current_version(self.snapshot_dir) if self.snapshot_dir else None
+            if version is not None:
+                base = columnar.read_snapshot(['scan_id', 'barcode'], root=self.snapshot_dir, version=version)
+                self._barcodes = dict(zip(base['barcode'], base['scan_id'].tolist()))
+
+            # Bulk load with the C parser, then tail from where it stopped
+            df = self.scans.read_all(usecols=['scan_id', 'barcode'], dtype={'barcode': str})
+            if df is not None:
+                # A torn or garbled scan_id makes the column object; such rows are dropped
+                df = df.assign(scan_id=pd.to_numeric(df['scan_id'], errors='coerce'))
+                df = df.dropna(subset=['scan_id', 'barcode'])
+                self._barcodes.update(zip(df['barcode'], df['scan_id'].astype(int)))
+
+            if version is None or columnar.current_version(self.snapshot_dir) == version:
+                break
+
+        self._apply_tombstones(self.tombstones.read_new_rows(self.tombstones.stat()))
+
+    def _add_rows(self, rows):
+        cols = self.scans.columns or []
+        if 'scan_id' not in cols or 'barcode' not in cols:
+            return
+        id_pos, code_pos = cols.index('scan_id'), cols.index('barcode')
+        for row in rows:
+            # Same rule as _apply_tombstones: a malformed row is skipped, not fatal
+            if len(row) <= max(id_pos, code_pos) or not row[id_pos].isdigit():
+                continue
+            self._barcodes[row[code_pos]] = int(row[id_pos])
+
+    def _apply_tombstones(self, rows):
+        for row in rows:
+            if len(row) < 2 or not row[0].isdigit():
+                continue
+            scan_id, barcode = int(row[0]), row[1]
+            # Only drop the barcode if it still points at the deleted row
+            if self._barcodes.get(barcode) == scan_id:
+                del self._barcodes[barcode]
+
+    def refresh(self):
+        """Picks up rows appended (or tombstoned) since the last refresh."""
+        with self._lock:
+            scans_st, tomb_st = self.scans.stat(), self.tombstones.stat()
+            if self.scans.replaced(scans_st) or self.tombstones.replaced(tomb_st) \
+                    or self.scans.file_id is None:
+                self._rebuild()
+                return
+            if not self.scans.unchanged(scans_st):
+                self._add_rows(self.scans.read_new_rows(scans_st))
+            if not self.tombstones.unchanged(tomb_st):
+                self._apply_tombstones(self.tombstones.read_new_rows(tomb_st))
+
+    def contains(self, barcode, refresh=True):
+        with self._lock:
+            if refresh:
+                self.refresh()
+            return str(barcode) in self._barcodes
+
+    def scan_id_for(self, barcode):
+        with self._lock:
+            return self._barcodes.get(str(barcode))
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def get_index(scans_file, tombstone_file, snapshot_dir=None):
+    """Returns the shared index for a scans file, creating it on first use."""
+    key = (os.path.abspath(scans_file), os.path.abspath(tombstone_file), snapshot_dir)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = BarcodeIndex(scans_file, tombstone_file, snapshot_dir)
+        return index
@@ -0,0 +1,394 @@
+"""
+Benchmarks for the storage and decode hot paths.
+
+Generates synthetic users.csv / scans.csv at each requested size in a
+scratch directory, times the db.py API against them, times the decoder
+ladder on synthetic QR and EAN-13 images, measures cold-start import cost
+of the login path in fresh interpreters, and writes everything as JSON.
+
+Usage:
+    python bench.py                                  # 1k and 100k rows + images
+    python bench.py --sizes 1k,100k,1m,10m --out bench_results.json
+    python bench.py --skip-decode --compare bench_results_old.json
+    python bench.py --skip-storage --skip-decode     # import times only
+
+Set DB_BACKEND / SCANS_STORAGE as usual to benchmark another storage mode.
+"""
+import argparse
+import hashlib
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+SIZE_SUFFIXES = {'k': 1_000, 'm': 1_000_000}
+
+def parse_size(text):
+    text = text.strip().lower()
+    if text[-1] in SIZE_SUFFIXES:
+        return int(float(text[:-1]) * SIZE_SUFFIXES[text[-1]])
+    return int(text)
+
+def peak_rss_mb():
+    """High-water mark of the whole process so far (never goes down)."""
+    # ru_maxrss is KB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+def current_rss_mb():
+    """Resident set size right now; None where /proc is not available."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError):
+        return None
+
+def summarize(samples, rss=None, errors=None):
+    """
+    rss: current_rss_mb() readings taken before the first call and after each one.
+    errors: the errors the calls reported (see call_error).
+    """
+    arr = np.asarray(samples, dtype=float) * 1000
+    total_s = arr.sum() / 1000
+    entry = {
+        'n': len(arr),
+        'p50_ms': round(float(np.percentile(arr, 50)), 4),
+        'p95_ms': round(float(np.percentile(arr, 95)), 4),
+        'max_ms': round(float(arr.max()), 4),
+        'ops_per_s': round(len(arr) / total_s, 2) if total_s else None,
+    }
+    if rss and None not in rss:
+        entry['rss_max_mb'] = round(max(rss), 1)
+        entry['rss_growth_mb'] = round(rss[-1] - rss[0], 1)
+    if errors is not None:
+        entry['errors'] = len(errors)
+        if errors:
+            entry['first_error'] = str(errors[0])
+    return entry
+
+def call_error(result):
+    """
+    The error a db call reported, or None. Handles (value, error),
+    (page, total, error) and (success, message) results.
+    """
+    if not isinstance(result, tuple) or not result:
+        return None
+    if len(result) == 2 and isinstance(result[0], bool) and isinstance(result[1], str):
+        return None if result[0] else result[1]
+    return result[-1]
+
+def timed(fn, repeat, budget_s=10.0):
+    """
+    Calls fn() up to `repeat` times (or until the time budget runs out).
+    Returns (latencies, rss readings, reported errors) for summarize(); a run
+    of failing calls is fast, so the errors matter as much as the latencies.
+    """
+    samples, rss, errors = [], [current_rss_mb()], []
+    deadline = time.perf_counter() + budget_s
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        result = fn(i)
+        samples.append(time.perf_counter() - t0)
+        rss.append(current_rss_mb())
+        err = call_error(result)
+        if err:
+            errors.append(err)
+        if time.perf_counter() > deadline:
+            break
+    return samples, rss, errors
+
+# ---------------------------------------------------------------- data generation
+
+def generate_users(path, n_users=300, n_branches=80, rng=None):
+    import pandas as pd
+    rng = rng or np.random.default_rng(0)
+    branches = [f"BR{i:03d}" for i in range(n_branches)]
+    rows = []
+    for i in range(n_users):
+        k = int(rng.integers(1, 61)) if i % 20 == 0 else int(rng.integers(1, 4))
+        picked = rng.choice(branches, size=k, replace=False)
+        rows.append((f"user{i:04d}", hashlib.md5(f"pw{i}".encode()).hexdigest(), "|".join(picked)))
+    pd.DataFrame(rows, columns=['username', 'password', 'branches']).to_csv(path, index=False)
+    return [(f"user{i:04d}", f"pw{i}") for i in range(n_users)], branches
+
+def generate_scans(path, n_rows, branches, rng=None):
+    import pandas as pd
+    rng = rng or np.random.default_rng(1)
+    ids = np.arange(1, n_rows + 1)
+    start = np.datetime64('2024-01-01T08:00:00')
+    df = pd.DataFrame({
+        'scan_id': ids,
+        'barcode': np.char.add('BAT', ids.astype(str)),
+        'created_by': np.char.add('user', np.char.zfill(rng.integers(0, 300, n_rows).astype(str), 4)),
+        'branch_code': np.asarray(branches)[rng.integers(0, len(branches), n_rows)],
+        'created_date': pd.Series(start + np.sort(rng.integers(0, 86400 * 180, n_rows)).astype('timedelta64[s]'))
+                          .dt.strftime("%Y-%m-%d %H:%M:%S"),
+    })
+    df.to_csv(path, index=False)
+
+# EAN-13 parity and digit patterns
+_EAN_L = ['0001101', '0011001', '0010011', '0111101', '0100011', '0110001', '0101111', '0111011', '0110111', '0001011']
+_EAN_G = ['0100111', '0110011', '0011011', '0100001', '0011101', '0111001', '0000101', '0010001', '0001001', '0010111']
+_EAN_R = ['1110010', '1100110', '1101100', '1000010', '1011100', '1001110', '1010000', '1000100', '1001000', '1110100']
+_EAN_PARITY = ['LLLLLL', 'LLGLGG', 'LLGGLG', 'LLGGGL', 'LGLLGG', 'LGGLLG', 'LGGGLL', 'LGLGLG', 'LGLGGL', 'LGGLGL']
+
+def ean13_modules(digits12):
+    digits = [int(d) for d in digits12]
+    check = (10 - (sum(digits[::2]) + 3 * sum(digits[1::2])) % 10) % 10
+    digits.append(check)
+    parity = _EAN_PARITY[digits[0]]
+    bits = '101'
+    for d, p in zip(digits[1:7], parity):
+        bits += (_EAN_L if p == 'L' else _EAN_G)[d]
+    bits += '01010'
+    for d in digits[7:]:
+        bits += _EAN_R[d]
+    bits += '101'
+    return bits, ''.join(map(str, digits))
+
+def synthetic_image(kind, width, height, noise, rng, payload):
+    import cv2
+    canvas = np.full((height, width), 255, np.uint8)
+    side = min(width, height) // 3
+    if kind == 'qr':
+        qr = cv2.QRCodeEncoder.create().encode(payload)
+        code = cv2.resize(qr, (side, side), interpolation=cv2.INTER_NEAREST)
+    else:
+        bits, payload = ean13_modules(payload)
+        module = max(2, side // len(bits) * 2)
+        row = np.array([0 if b == '1' else 255 for b in bits], np.uint8).repeat(module)
+        quiet = np.full(module * 10, 255, np.uint8)
+        row = np.concatenate([quiet, row, quiet])
+        code = np.tile(row, (side // 2, 1))
+    h, w = code.shape
+    h, w = min(h, height), min(w, width)
+    y, x = (height - h) // 2, (width - w) // 2
+    canvas[y:y + h, x:x + w] = code[:h, :w]
+    img = canvas.astype(np.float32)
+    if noise:
+        img += rng.normal(0, noise, img.shape)
+    img = cv2.cvtColor(np.clip(img, 0, 255).astype(np.uint8), cv2.COLOR_GRAY2BGR)
+    ok, buf = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    return buf.tobytes(), payload
+
+# ---------------------------------------------------------------- benchmarks
+
+def bench_storage(n_rows, repeat):
+    import db
+    rng = np.random.default_rng(n_rows)
+    result = {'rows': n_rows}
+
+    t0 = time.perf_counter()
+    creds, branches = generate_users(db.USERS_FILE, rng=rng)
+    generate_scans(db.SCANS_FILE, n_rows, branches, rng=rng)
+    result['generate_s'] = round(time.perf_counter() - t0, 3)
+    db.init_db()
+
+    result['validate_db_user'] = summarize(*timed(
+        lambda i: db.validate_db_user(*creds[i % len(creds)]), repeat * 10))
+
+    # The first duplicate check pays for building the shared index
+    t0 = time.perf_counter()
+    db.check_duplicate_barcode('BAT1')
+    result['check_duplicate_barcode_cold_ms'] = round((time.perf_counter() - t0) * 1000, 3)
+    result['check_duplicate_barcode_hit'] = summarize(*timed(
+        lambda i: db.check_duplicate_barcode(f"BAT{(i * 7919) % n_rows + 1}"), repeat * 10))
+    result['check_duplicate_barcode_miss'] = summarize(*timed(
+        lambda i: db.check_duplicate_barcode(f"NEW{i}"), repeat * 10))
+
+    batch_size = 50
+    result['insert_scan_batch'] = summarize(*timed(
+        lambda i: db.insert_scan_batch([
+            {'barcode': f"INS{i}_{j}", 'username': creds[0][0], 'branch': branches[0]}
+            for j in range(batch_size)
+        ]), repeat))
+    result['insert_scan_batch']['rows_per_call'] = batch_size
+
+    result['get_all_scans'] = summarize(*timed(lambda i: db.get_all_scans(), max(1, repeat // 10)))
+    result['query_scans'] = summarize(*timed(
+        lambda i: db.query_scans(page=1 + i % 5, branch=branches[i % len(branches)]), repeat))
+
+    result['delete_scan'] = summarize(*timed(lambda i: db.delete_scan(i + 1), repeat))
+    result['delete_scans_100'] = summarize(*timed(
+        lambda i: db.delete_scans(range(n_rows // 2 + i * 100, n_rows // 2 + (i + 1) * 100)),
+        max(1, repeat // 10)))
+    return result
+
+def bench_decode(resolutions, noise_levels, repeat):
+    import decoder
+    engine = decoder.DecoderEngine()
+    rng = np.random.default_rng(42)
+    results = []
+    for kind in ('qr', 'ean13'):
+        for width, height in resolutions:
+            for noise in noise_levels:
+                samples, hits, strategies = [], 0, {}
+                rss = [current_rss_mb()]
+                for i in range(repeat):
+                    payload = f"BATT-{i:06d}" if kind == 'qr' else f"{629104150000 + i:012d}"
+                    image_bytes, expected = synthetic_image(kind, width, height, noise, rng, payload)
+                    t0 = time.perf_counter()
+                    res = engine.decode(image_bytes)
+                    samples.append(time.perf_counter() - t0)
+                    rss.append(current_rss_mb())
+                    if res.data == expected:
+                        hits += 1
+                    strategies[res.strategy or 'none'] = strategies.get(res.strategy or 'none', 0) + 1
+                entry = summarize(samples, rss)
+                entry.update({'kind': kind, 'resolution': f"{width}x{height}", 'noise': noise,
+                              'success_rate': round(hits / len(samples), 3), 'strategies': strategies})
+                results.append(entry)
+                print(f"  decode {kind} {width}x{height} noise={noise}: "
+                      f"p50={entry['p50_ms']}ms p95={entry['p95_ms']}ms ok={entry['success_rate']:.0%}")
+    return results
+
+# Each scenario runs in a fresh interpreter, the way a new Streamlit process starts
+IMPORT_SCENARIOS = {
+    'login_path': "import db; db.init_db(); db.validate_db_user('admin', 'admin')",
+    'decode_stack': "import decoder",
+    'dataframe_stack': "import pandas",
+    'admin_query': "import db; db.init_db(); db.query_scans()",
+}
+HEAVY_MODULES = ('pandas', 'numpy', 'cv2', 'pyzbar')
+
+def parse_importtime(stderr, top=5):
+    # -X importtime lines: "import time: self [us] | cumulative | imported package"
+    costs = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if not name.startswith(' ') or name.startswith('  '):
+            continue  # only top-level imports; nested ones are inside these totals
+        costs.append((name.strip(), int(cumulative) / 1000))
+    costs.sort(key=lambda c: c[1], reverse=True)
+    return [{'module': name, 'cumulative_ms': round(ms, 2)} for name, ms in costs[:top]]
+
+def bench_imports(repeat):
+    repo = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, PYTHONPATH=repo + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    results = {}
+    for name, code in IMPORT_SCENARIOS.items():
+        workdir = tempfile.mkdtemp(prefix="bench_imports_")
+        probe = (f"{code}\nimport sys, json\n"
+                 f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))")
+        samples, stderr, loaded = [], '', []
+        try:
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', probe], cwd=workdir,
+                                      env=env, capture_output=True, text=True)
+                samples.append(time.perf_counter() - t0)
+                if proc.returncode != 0:
+                    raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+                stderr, loaded = proc.stderr, json.loads(proc.stdout.strip().splitlines()[-1])
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        entry = summarize(samples)
+        entry['heavy_modules_loaded'] = loaded
+        entry['top_imports'] = parse_importtime(stderr)
+        results[name] = entry
+        print(f"  {name:<16} p50={entry['p50_ms']}ms heavy={','.join(loaded) or '-'}")
+    return results
+
+def compare(current, baseline_path):
+    """Prints p50/p95 ratios against an earlier run (>1 means slower now)."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    old = {s['rows']: s for s in baseline.get('storage', [])}
+    for entry in current.get('storage', []):
+        prev = old.get(entry['rows'])
+        if not prev:
+            continue
+        for op, stats in entry.items():
+            if isinstance(stats, dict) and isinstance(prev.get(op), dict) and 'p95_ms' in stats:
+                ratio = stats['p95_ms'] / prev[op]['p95_ms'] if prev[op]['p95_ms'] else float('inf')
+                flag = "  <-- regression" if ratio > 1.2 else ""
+                print(f"  {entry['rows']:>10} {op:<32} p95 {prev[op]['p95_ms']:>10.3f} -> "
+                      f"{stats['p95_ms']:>10.3f} ms ({ratio:.2f}x){flag}")
+    for name, stats in current.get('imports', {}).items():
+        prev = baseline.get('imports', {}).get(name)
+        if prev:
+            print(f"  cold start {name:<21} p50 {prev['p50_ms']:>10.1f} -> {stats['p50_ms']:>10.1f} ms "
+                  f"({stats['p50_ms'] / prev['p50_ms']:.2f}x)")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='1k,100k', help="scan table sizes, e.g. 1k,100k,1m,10m")
+    parser.add_argument('--repeat', type=int, default=200, help="iterations per storage operation")
+    parser.add_argument('--decode-repeat', type=int, default=10, help="images per decode configuration")
+    parser.add_argument('--resolutions', default='640x480,1920x1080,4032x3024')
+    parser.add_argument('--noise', default='0,12,30', help="gaussian noise sigmas")
+    parser.add_argument('--skip-storage', action='store_true')
+    parser.add_argument('--skip-decode', action='store_true')
+    parser.add_argument('--skip-imports', action='store_true')
+    parser.add_argument('--import-repeat', type=int, default=5, help="fresh interpreters per import scenario")
+    parser.add_argument('--out', default='bench_results.json')
+    parser.add_argument('--compare', help="earlier results JSON to compare against")
+    args = parser.parse_args(argv)
+
+    report = {
+        'started': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'db_backend': os.environ.get('DB_BACKEND', 'csv'),
+        'scans_storage': os.environ.get('SCANS_STORAGE', 'csv'),
+        'storage': [],
+        'decode': [],
+        'imports': {},
+    }
+
+    here = os.getcwd()
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    if not args.skip_storage:
+        for size in [parse_size(s) for s in args.sizes.split(',')]:
+            workdir = tempfile.mkdtemp(prefix=f"bench_{size}_")
+            # db.py uses paths relative to the working directory
+            os.chdir(workdir)
+            try:
+                print(f"storage: {size} rows in {workdir}")
+                entry = bench_storage(size, args.repeat)
+                report['storage'].append(entry)
+                for op, stats in entry.items():
+                    if isinstance(stats, dict):
+                        failed = f", {stats['errors']} errors ({stats['first_error']})" if stats['errors'] else ""
+                        print(f"  {op:<32} p50={stats['p50_ms']}ms p95={stats['p95_ms']}ms "
+                              f"{stats['ops_per_s']} ops/s{failed}")
+            finally:
+                os.chdir(here)
+                shutil.rmtree(workdir, ignore_errors=True)
+
+    if not args.skip_decode:
+        resolutions = [tuple(int(x) for x in r.split('x')) for r in args.resolutions.split(',')]
+        noise_levels = [float(n) for n in args.noise.split(',')]
+        print("decode:")
+        report['decode'] = bench_decode(resolutions, noise_levels, args.decode_repeat)
+
+    if not args.skip_imports:
+        print("imports (cold start):")
+        report['imports'] = bench_imports(args.import_repeat)
+
+    report['process_peak_rss_mb'] = round(peak_rss_mb(), 1)  # lifetime high-water mark
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.out}")
+
+    if args.compare:
+        compare(report, args.compare)
+    failures = [(entry['rows'], op, stats['errors']) for entry in report['storage']
+                for op, stats in entry.items() if isinstance(stats, dict) and stats.get('errors')]
+    for rows, op, n in failures:
+        print(f"FAILED: {op} at {rows} rows reported {n} error(s); its latencies are not meaningful")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,165 @@
+"""
+Bulk import of barcode lists (handheld scanner exports, ERP dumps).
+
+A file of thousands of barcodes is parsed and normalized, then deduplicated
+in three vectorized steps: within the file, against the session's pending
+list, and against the database (one check_duplicate_barcodes call for the
+whole list). The survivors go to db.insert_scan_batch_results in chunks, so
+a large file never builds one giant write and a concurrent insert of the
+same barcode is still caught by the insert itself.
+"""
+import csv
+import io
+import re
+
+import pandas as pd
+
+import db
+
+DEFAULT_CHUNK_SIZE = 1000
+# A header cell naming the barcode column contains one of these once lower-cased and
+# stripped of spaces and punctuation ('Serial Number', 'EAN_Code', 'Barcode #'), in this order
+BARCODE_HEADER_KEYS = ('barcode', 'serial', 'sku', 'ean', 'upc', 'gtin', 'imei', 'code')
+_EXCEL_FLOAT = re.compile(r'^(\d+)\.0+$')
+
+def normalize(code):
+    """
+    Strips whitespace, quotes and control characters, and undoes Excel's
+    '1234567890123.0' float rendering. Case is kept (QR payloads are case-sensitive).
+    """
+    code = str(code)
+    if not code.isprintable():
+        code = ''.join(ch for ch in code if ch.isprintable())
+    code = code.strip().strip('"\'').strip()
+    if code.endswith('0') and '.' in code:
+        match = _EXCEL_FLOAT.match(code)
+        if match:
+            return match.group(1)
+    return code
+
+def header_key(cell):
+    """'Serial Number' -> 'serialnumber', ' BAR_CODE ' -> 'barcode'."""
+    return re.sub(r'[\W_]+', '', str(cell).lower())
+
+def match_column(row, keys, exclude=()):
+    """Index of the first cell of row that names a column like keys (by substring), or None."""
+    cells = [header_key(c) for c in row]
+    for key in keys:
+        for i, cell in enumerate(cells):
+            if key in cell and i not in exclude:
+                return i
+    return None
+
+def looks_like_header(rows):
+    """
+    True if rows[0] can be a header row: none of its cells contains a digit
+    ('QRCODE-0001' and 'BEAN0001' are barcodes that happen to match a key) and
+    none of them occurs again further down its column.
+    """
+    header = rows[0]
+    if any(ch.isdigit() for cell in header for ch in cell):
+        return False
+    for i, cell in enumerate(header):
+        if cell.strip() and any(len(r) > i and r[i] == cell for r in rows[1:]):
+            return False
+    return True
+
+def parse_barcodes(data, has_header=None):
+    """
+    Reads barcodes from CSV or plain-text bytes. has_header=None detects a header
+    row (a cell like 'Barcode' or 'Serial Number', which also picks the column);
+    True / False force it. Without a named column the first one is used.
+    Returns (raw values in file order, not yet normalized; the skipped header row or None).
+    """
+    text = data.decode('utf-8-sig', errors='replace') if isinstance(data, bytes) else data
+    try:
+        delimiter = csv.Sniffer().sniff(text[:4096], delimiters=',;\t|').delimiter
+    except csv.Error:
+        delimiter = ','
+    rows = [r for r in csv.reader(io.StringIO(text), delimiter=delimiter) if r]
+    if not rows:
+        return [], None
+    column = match_column(rows[0], BARCODE_HEADER_KEYS)
+    if has_header is None:
+        has_header = column is not None and looks_like_header(rows)
+    header = None
+    if has_header:
+        header, rows = rows[0], rows[1:]
+    column = column if has_header and column is not None else 0
+    return [r[column] if len(r) > column else '' for r in rows], header
+
+def import_barcodes(codes, username, branch, pending=(), chunk_size=DEFAULT_CHUNK_SIZE, progress=None,
+                    header=None):
+    """
+    codes: raw barcode values; pending: barcodes already in the session's pending list.
+    header: the header row parse_barcodes() skipped, if any (reported in the summary).
+    progress(done, total) is called after every chunk.
+    Returns (summary, error); summary counts every input row exactly once.
+    """
+    try:
+        s = pd.Series(list(codes), dtype=object).map(normalize)
+        blank = s == ''
+        in_file = s.duplicated() & ~blank
+        candidates = s[~blank & ~in_file]
+        in_pending = candidates.isin(set(pending))
+        candidates = candidates[~in_pending]
+
+        in_db, err = db.check_duplicate_barcodes(candidates.tolist())
+        if err:
+            return None, err
+        already = candidates.isin(in_db)
+        survivors = candidates[~already].tolist()
+
+        summary = {
+            'rows': len(s),
+            'blank': int(blank.sum()),
+            'in_file_duplicates': int(in_file.sum()),
+            'pending_duplicates': int(in_pending.sum()),
+            'already_in_db': int(already.sum()),
+            'inserted': 0,
+            'failed': 0,
+            'already_in_db_codes': candidates[already].tolist(),
+            'errors': [],
+            'header': header,
+        }
+        for start in range(0, len(survivors), chunk_size):
+            chunk = survivors[start:start + chunk_size]
+            results, err = db.insert_scan_batch_results(
+                [{'barcode': b, 'username': username, 'branch': branch} for b in chunk])
+            if err:
+                summary['failed'] += len(chunk)
+                summary['errors'].append(err)
+            else:
+                for r in results:
+                    if r['status'] == 'inserted':
+                        summary['inserted'] += 1
+                    else:
+                        # Inserted by someone else since the check above
+                        summary['already_in_db'] += 1
+                        summary['already_in_db_codes'].append(r['barcode'])
+            if progress:
+                progress(min(start + chunk_size, len(survivors)), len(survivors))
+        return summary, None
+    except Exception as e:
+        return None, str(e)
+
+def import_file(path, username, branch, chunk_size=DEFAULT_CHUNK_SIZE, has_header=None):
+    with open(path, 'rb') as f:
+        codes, header = parse_barcodes(f.read(), has_header=has_header)
+    return import_barcodes(codes, username, branch, chunk_size=chunk_size, header=header)
+
+def describe(summary):
+    parts = [f"Inserted {summary['inserted']} of {summary['rows']} rows."]
+    if summary.get('header'):
+        parts.append(f"Skipped header row '{', '.join(summary['header'])}'.")
+    if summary['already_in_db']:
+        parts.append(f"{summary['already_in_db']} already in the database.")
+    if summary['in_file_duplicates']:
+        parts.append(f"{summary['in_file_duplicates']} repeated within the file.")
+    if summary['pending_duplicates']:
+        parts.append(f"{summary['pending_duplicates']} already in the pending list.")
+    if summary['blank']:
+        parts.append(f"{summary['blank']} blank.")
+    if summary['failed']:
+        parts.append(f"{summary['failed']} failed to insert.")
+    return " ".join(parts)
@@ -0,0 +1,133 @@
+"""
+Columnar snapshot of the scans table.
+
+With SCANS_STORAGE=columnar, compaction folds scans.csv (which then only
+holds the delta since the last compaction) and its tombstones into one .npy
+file per column:
+
+    scans_snapshot/CURRENT            -> name of the live version directory
+    scans_snapshot/v<N>/scan_id.npy   int64
+    scans_snapshot/v<N>/barcode.npy   UTF-8 bytes (fixed width)
+    scans_snapshot/v<N>/created_by.npy + created_by.json    categorical codes + labels
+    scans_snapshot/v<N>/branch_code.npy + branch_code.json  categorical codes + labels
+    scans_snapshot/v<N>/created_date.npy  datetime64[s]
+
+Columns are memory-mapped on load and callers ask only for the columns they
+need (duplicate checks read just scan_id and barcode). A new version is
+written beside the old one and CURRENT is swapped atomically, so readers
+never see a half-written snapshot. The version CURRENT pointed to before is
+kept until the next write, so a reader that has just read the old pointer
+can still load it.
+"""
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+SNAPSHOT_DIR = 'scans_snapshot'
+COLUMNS = ['scan_id', 'barcode', 'created_by', 'branch_code', 'created_date']
+CATEGORICAL_COLUMNS = ('created_by', 'branch_code')
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+def _fsync_save(path, arr):
+    with open(path, 'wb') as f:
+        np.save(f, arr, allow_pickle=False)
+        f.flush()
+        os.fsync(f.fileno())
+
+def _fsync_json(path, obj):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(obj, f)
+        f.flush()
+        os.fsync(f.fileno())
+
+def current_version(root=SNAPSHOT_DIR):
+    """Name of the live snapshot version, or None if there is no snapshot."""
+    try:
+        with open(os.path.join(root, 'CURRENT'), encoding='utf-8') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def write_snapshot(df, root=SNAPSHOT_DIR):
+    """
+    Writes df (the full live table) as a new snapshot version and makes it current.
+    created_date may be strings in DATE_FORMAT or datetimes.
+    """
+    previous = current_version(root)
+    number = int(previous[1:]) + 1 if previous else 1
+    version = f"v{number:06d}"
+    target = os.path.join(root, version)
+    shutil.rmtree(target, ignore_errors=True)
+    os.makedirs(target)
+
+    _fsync_save(os.path.join(target, 'scan_id.npy'), df['scan_id'].to_numpy(dtype=np.int64))
+    barcodes = [str(b).encode('utf-8') for b in df['barcode']]
+    _fsync_save(os.path.join(target, 'barcode.npy'), np.array(barcodes, dtype=np.bytes_) if barcodes
+                else np.array([], dtype='S1'))
+    for col in CATEGORICAL_COLUMNS:
+        cat = pd.Categorical(df[col].astype(str))
+        _fsync_save(os.path.join(target, f'{col}.npy'), cat.codes.astype(np.int32))
+        _fsync_json(os.path.join(target, f'{col}.json'), [str(c) for c in cat.categories])
+    dates = pd.to_datetime(df['created_date'], format=DATE_FORMAT, errors='coerce') \
+        if not pd.api.types.is_datetime64_any_dtype(df['created_date']) else df['created_date']
+    _fsync_save(os.path.join(target, 'created_date.npy'), dates.to_numpy(dtype='datetime64[s]'))
+    _fsync_json(os.path.join(target, 'meta.json'), {'rows': len(df), 'columns': COLUMNS})
+
+    # Swap the pointer, then drop versions older than the one it replaced
+    tmp_pointer = os.path.join(root, 'CURRENT.tmp')
+    with open(tmp_pointer, 'w', encoding='utf-8') as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_pointer, os.path.join(root, 'CURRENT'))
+    for name in os.listdir(root):
+        if name.startswith('v') and name not in (version, previous):
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+    return version
+
+def read_snapshot(columns=None, root=SNAPSHOT_DIR, version=None, dates_as_text=False):
+    """
+    Loads the requested columns of a snapshot (memory-mapped where possible).
+    Returns None if there is no snapshot. Categorical columns come back as
+    pandas categoricals and created_date as datetime64 unless dates_as_text.
+    """
+    if version is None:
+        version = current_version(root)
+        if version is None:
+            return None
+        try:
+            return _load(columns, os.path.join(root, version), dates_as_text)
+        except FileNotFoundError:
+            # Two snapshots were written since CURRENT was read; once more against the new one
+            return read_snapshot(columns, root, current_version(root) or version, dates_as_text)
+    return _load(columns, os.path.join(root, version), dates_as_text)
+
+def _load(columns, base, dates_as_text):
+    data = {}
+    for col in columns or COLUMNS:
+        arr = np.load(os.path.join(base, f'{col}.npy'), mmap_mode='r')
+        if col == 'barcode':
+            data[col] = pd.Series(np.char.decode(arr, 'utf-8'), dtype=object) if len(arr) else \
+                pd.Series([], dtype=object)
+        elif col in CATEGORICAL_COLUMNS:
+            with open(os.path.join(base, f'{col}.json'), encoding='utf-8') as f:
+                categories = json.load(f)
+            data[col] = pd.Categorical.from_codes(np.asarray(arr), categories=categories)
+        elif col == 'created_date':
+            dates = pd.Series(np.asarray(arr))
+            data[col] = dates.dt.strftime(DATE_FORMAT) if dates_as_text else dates
+        else:
+            data[col] = arr
+    return pd.DataFrame(data)
+
+def max_scan_id(root=SNAPSHOT_DIR):
+    df = read_snapshot(['scan_id'], root=root)
+    if df is None or df.empty:
+        return 0
+    return int(df['scan_id'].max())
+
+def remove_snapshot(root=SNAPSHOT_DIR):
+    shutil.rmtree(root, ignore_errors=True)
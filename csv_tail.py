@@ -0,0 +1,117 @@
+"""
+Helpers for reading append-only CSV files incrementally.
+
+CsvTail remembers how far into a file it has read (and which inode it was
+reading), so callers can parse only the lines appended since last time and
+notice when the file was replaced by compaction.
+"""
+import csv
+import io
+import os
+
+import metrics
+
+class PrefixReader(io.RawIOBase):
+    # Exposes only the first `limit` bytes of a file, so pandas never sees a
+    # half-written last line from a concurrent appender.
+    def __init__(self, f, limit):
+        self.f = f
+        self.remaining = limit
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        n = min(len(b), self.remaining)
+        if n <= 0:
+            return 0
+        data = self.f.read(n)
+        b[:len(data)] = data
+        self.remaining -= len(data)
+        return len(data)
+
+def complete_prefix(f, size):
+    # Length of the file up to and including its last newline
+    pos = size
+    while pos > 0:
+        start = max(0, pos - 4096)
+        f.seek(start)
+        chunk = f.read(pos - start)
+        idx = chunk.rfind(b'\n')
+        if idx != -1:
+            return start + idx + 1
+        pos = start
+    return 0
+
+def file_id(st):
+    return (st.st_dev, st.st_ino)
+
+class CsvTail:
+    """Tracks how far into one append-only CSV file we have read."""
+    def __init__(self, path):
+        self.path = path
+        self.file_id = None
+        self.offset = 0
+        self.mtime = None
+        self.columns = None
+
+    def stat(self):
+        try:
+            return os.stat(self.path)
+        except FileNotFoundError:
+            return None
+
+    def unchanged(self, st):
+        if st is None:
+            return self.file_id is None
+        return (file_id(st) == self.file_id and st.st_size == self.offset
+                and st.st_mtime_ns == self.mtime)
+
+    def replaced(self, st):
+        # True if the file we were tailing is gone, swapped or truncated
+        if self.file_id is None:
+            return False
+        return st is None or file_id(st) != self.file_id or st.st_size < self.offset
+
+    def read_new_rows(self, st):
+        """Parses complete lines appended since the last call."""
+        if st is None:
+            return []
+        with open(self.path, 'rb') as f:
+            end = complete_prefix(f, st.st_size)
+            if end <= self.offset:
+                self.file_id, self.mtime = file_id(st), st.st_mtime_ns
+                return []
+            f.seek(self.offset)
+            text = f.read(end - self.offset).decode('utf-8')
+
+        rows = [r for r in csv.reader(io.StringIO(text)) if r]
+        if self.columns is None and rows:
+            self.columns = rows.pop(0)
+        self.file_id, self.offset, self.mtime = file_id(st), end, st.st_mtime_ns
+        metrics.record_rows('read', len(rows), os.path.basename(self.path))
+        return rows
+
+    def read_all(self, **read_csv_kwargs):
+        """
+        Bulk-loads every complete line with pandas and positions the tail at the end,
+        so later read_new_rows() calls only see what is appended afterwards.
+        Returns None if the file is missing or empty.
+        """
+        import pandas as pd
+        self.file_id, self.offset, self.mtime, self.columns = None, 0, None, None
+        st = self.stat()
+        if st is None:
+            return None
+        if st.st_size == 0:
+            self.file_id, self.mtime = file_id(st), st.st_mtime_ns
+            return None
+        with open(self.path, 'rb') as f:
+            end = complete_prefix(f, st.st_size)
+            f.seek(0)
+            df = pd.read_csv(io.BufferedReader(PrefixReader(f, end)), **read_csv_kwargs)
+        with open(self.path, newline='', encoding='utf-8') as f:
+            self.columns = next(csv.reader(f), None)
+        self.file_id, self.offset, self.mtime = file_id(st), end, st.st_mtime_ns
+        metrics.record_rows('read', len(df), os.path.basename(self.path))
+        return df
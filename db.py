@@ -1,145 +1,374 @@
-import pandas as pd
 import hashlib
 import os
+import io
+import csv
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 
+import aggregates
+import csv_tail
+import metrics
+import user_directory
+
+# pandas/numpy (and the modules built on them: columnar, barcode_index,
+# scans_read_model) are imported inside the functions that need them, so the
+# login path (init_db, validate_db_user, user_has_branch) never loads them.
+
+try:
+    import fcntl
+except ImportError:  # Windows dev boxes: fall back to the in-process lock only
+    fcntl = None
+
 USERS_FILE = 'users.csv'
 SCANS_FILE = 'scans.csv'
+# Persistent scan_id sequence so inserts never need max() over the whole table
+SCANS_SEQ_FILE = 'scans.seq'
+# Deleted scan ids, applied to reads and folded into scans.csv by compact_scans()
+SCANS_TOMBSTONE_FILE = 'scans.deleted'
+# With SCANS_STORAGE=columnar, compaction folds scans.csv into memory-mappable
+# .npy columns here and scans.csv only holds the delta since (see columnar.py)
+SCANS_SNAPSHOT_DIR = 'scans_snapshot'
+SCANS_STORAGE = os.environ.get('SCANS_STORAGE', 'csv')
+# Per-branch / per-user / per-day counts, kept current by the write paths (see aggregates.py)
+SCANS_COUNTS_FILE = aggregates.COUNTS_FILE
 
-def init_db():
-    # Ensure files exist
+SCANS_COLUMNS = ['scan_id', 'barcode', 'created_by', 'branch_code', 'created_date']
+TOMBSTONE_COLUMNS = ['scan_id', 'barcode']
+
+_write_lock = threading.Lock()
+
+@contextmanager
+def _scans_lock():
+    # Streamlit sessions are threads of one process, so the thread lock does most of
+    # the work; the advisory file lock also keeps a second process (or compaction
+    # run from the shell) from interleaving with us.
+    with _write_lock:
+        if fcntl is None:
+            yield
+            return
+        with open(SCANS_FILE + '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _fsync_write(path, data, append):
+    flags = os.O_WRONLY | os.O_CREAT | (os.O_APPEND if append else os.O_TRUNC)
+    fd = os.open(path, flags, 0o644)
+    try:
+        view = memoryview(data)
+        while view:
+            written = os.write(fd, view)
+            view = view[written:]
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def _append_rows(path, columns, rows):
+    """
+    Appends rows to a CSV file in a single write() followed by fsync.
+    Writes the header first if the file is new or empty.
+    """
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator='\n')
+
+    size = os.path.getsize(path) if os.path.exists(path) else 0
+    if size == 0:
+        writer.writerow(columns)
+    else:
+        # A crashed writer may have left a partial last line; start on a fresh one
+        with open(path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b'\n':
+                buf.write('\n')
+
+    for row in rows:
+        writer.writerow([row[c] for c in columns])
+    _fsync_write(path, buf.getvalue().encode('utf-8'), append=True)
+    metrics.record_rows('written', len(rows), os.path.basename(path))
+
+def _replace_file(path, data):
+    # Write to a temp file and rename so readers never see a half-written file
+    tmp_path = path + '.tmp'
+    _fsync_write(tmp_path, data, append=False)
+    os.replace(tmp_path, path)
+
+def _reserve_scan_ids(count):
+    """
+    Reserves `count` consecutive scan ids and returns the first one.
+    The sequence is persisted before the rows are appended, so a crash can leave a
+    gap in the ids but never hands out the same id twice.
+    """
+    last_id = None
+    if os.path.exists(SCANS_SEQ_FILE):
+        with open(SCANS_SEQ_FILE) as f:
+            content = f.read().strip()
+        if content:
+            last_id = int(content)
+
+    if last_id is None:
+        # One-time bootstrap from an existing snapshot / scans.csv
+        import columnar
+        import pandas as pd
+        last_id = columnar.max_scan_id(SCANS_SNAPSHOT_DIR)
+        if os.path.exists(SCANS_FILE):
+            ids = pd.read_csv(SCANS_FILE, usecols=['scan_id'])['scan_id']
+            if not ids.empty and not pd.isna(ids.max()):
+                last_id = max(last_id, int(ids.max()))
+
+    _replace_file(SCANS_SEQ_FILE, f"{last_id + count}\n".encode())
+    return last_id + 1
+
+def _read_tombstones(path=None):
+    # Deleted scan ids in a tombstone file (scans.deleted, or a partition's)
+    path = path or SCANS_TOMBSTONE_FILE
+    if not os.path.exists(path):
+        return set()
+    with open(path, 'rb') as f:
+        # Complete lines only, like csv_tail: a crash mid-append can leave half a row
+        end = csv_tail.complete_prefix(f, os.fstat(f.fileno()).st_size)
+        f.seek(0)
+        text = f.read(end).decode('utf-8', errors='replace')
+    reader = csv.reader(io.StringIO(text))
+    next(reader, None)
+    deleted = set()
+    for row in reader:
+        # ...and a torn row that a later append finished off is skipped, not fatal
+        if len(row) < len(TOMBSTONE_COLUMNS) or not row[0].isdigit():
+            continue
+        deleted.add(int(row[0]))
+    return deleted
+
+def _load_scans(usecols=None):
+    # Live rows only: snapshot (if any) + scans.csv, minus anything tombstoned
+    # since the last compaction
+    import columnar
+    import pandas as pd
+    if usecols is not None and 'scan_id' not in usecols:
+        usecols = ['scan_id'] + list(usecols)
+    df = pd.read_csv(SCANS_FILE, usecols=usecols, dtype={'barcode': str})
+    snapshot = columnar.read_snapshot(usecols, root=SCANS_SNAPSHOT_DIR, dates_as_text=True)
+    if snapshot is not None:
+        snapshot = snapshot.astype({c: object for c in columnar.CATEGORICAL_COLUMNS if c in snapshot})
+        df = pd.concat([snapshot, df], ignore_index=True)
+        # A compaction interrupted between the snapshot swap and the delta reset
+        # leaves rows in both; keep one copy
+        df = df.drop_duplicates(subset='scan_id', keep='last')
+        # An empty delta parses as object columns, which concat would spread to
+        # scan_id; keep it int64 like the csv and sqlite backends
+        df['scan_id'] = df['scan_id'].astype('int64')
+    metrics.record_rows('read', len(df), 'scans')
+    deleted = _read_tombstones()
+    if deleted:
+        df = df[~df['scan_id'].isin(deleted)]
+    return df
+
+def _barcode_index():
+    # Shared across all sessions in the process; refreshes from the file offset
+    import barcode_index
+    return barcode_index.get_index(SCANS_FILE, SCANS_TOMBSTONE_FILE, SCANS_SNAPSHOT_DIR)
+
+def _read_model():
+    import scans_read_model
+    return scans_read_model.get_read_model(SCANS_FILE, SCANS_TOMBSTONE_FILE, SCANS_SNAPSHOT_DIR)
+
+def _counts_watermark():
+    import columnar
+    sizes = [os.path.getsize(p) if os.path.exists(p) else 0 for p in (SCANS_FILE, SCANS_TOMBSTONE_FILE)]
+    return sizes + [columnar.current_version(SCANS_SNAPSHOT_DIR)]
+
+def _recount():
+    # Counts straight from the table; callers hold _scans_lock()
+    df = _load_scans(['created_by', 'branch_code', 'created_date']) if os.path.exists(SCANS_FILE) else None
+    return aggregates.counts_from_frame(df)
+
+def _counts_behind(counts_file):
+    return counts_file.get() is None or counts_file.watermark() != _counts_watermark()
+
+def _update_counts(rows, sign, watermark_before):
+    # Called under _scans_lock() right after the rows (or tombstones) were appended
+    try:
+        counts_file = aggregates.get_counts_file(SCANS_COUNTS_FILE)
+        if counts_file.get() is None or counts_file.watermark() != watermark_before:
+            # Missed an update (crash, older writer): recount, which already includes `rows`
+            counts_file.save(_recount(), _counts_watermark())
+        else:
+            counts_file.append(aggregates.delta_from_rows(rows, sign), _counts_watermark())
+    except Exception as e:
+        # Counts are derived data and must not fail the write. The journal's watermark
+        # is now behind the table, so get_scan_counts recounts until a write succeeds
+        print(f"Scan counts update failed: {e}")
+        metrics.inc('scan_counts_errors_total')
+
+def _init_users_file():
     if not os.path.exists(USERS_FILE):
         print(f"Creating {USERS_FILE}...")
-        df = pd.DataFrame(columns=['username', 'password', 'branches'])
-        # Add default admin (pass: admin)
-        df.loc[0] = ['admin', hashlib.md5('admin'.encode()).hexdigest(), 'HeadOffice']
-        df.to_csv(USERS_FILE, index=False)
-        
+        with open(USERS_FILE, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f, lineterminator='\n')
+            writer.writerow(['username', 'password', 'branches'])
+            # Add default admin (pass: admin)
+            writer.writerow(['admin', hashlib.md5('admin'.encode()).hexdigest(), 'HeadOffice'])
+
+def init_db():
+    # Ensure files exist (plain csv module: runs before login, so no pandas here)
+    _init_users_file()
     if not os.path.exists(SCANS_FILE):
         print(f"Creating {SCANS_FILE}...")
-        df = pd.DataFrame(columns=['scan_id', 'barcode', 'created_by', 'branch_code', 'created_date'])
-        df.to_csv(SCANS_FILE, index=False)
+        with open(SCANS_FILE, 'w', newline='', encoding='utf-8') as f:
+            csv.writer(f, lineterminator='\n').writerow(SCANS_COLUMNS)
 
 def validate_db_user(username, password):
     try:
         if not os.path.exists(USERS_FILE):
             return None, "User DB missing"
             
-        df = pd.read_csv(USERS_FILE)
+        # Cached directory keyed by username; only re-reads users.csv when it changes
+        user = user_directory.get_directory(USERS_FILE).get(username)
         
         # MD5 hash
         md5_hash = hashlib.md5(password.encode()).hexdigest()
         
-        # Check user
-        user_row = df[(df['username'] == username) & (df['password'] == md5_hash)]
-        
-        if user_row.empty:
+        if user is None or user.password != md5_hash:
             return None, "Invalid credentials"
             
-        # Get branches
-        branches_str = str(user_row.iloc[0]['branches'])
-        branches = branches_str.split('|') if branches_str and branches_str != 'nan' else []
-        
-        return {'username': username, 'branches': branches}, None
+        return {'username': username, 'branches': list(user.branches)}, None
         
     except Exception as e:
         return None, f"Login error: {e}"
 
+def user_has_branch(username, branch):
+    """Returns (has_branch, error); has_branch is None if it could not be checked."""
+    try:
+        return user_directory.get_directory(USERS_FILE).user_has_branch(username, branch), None
+    except FileNotFoundError:
+        return False, None
+    except Exception as e:
+        return None, str(e)
+
 def check_duplicate_barcode(barcode):
     try:
         if not os.path.exists(SCANS_FILE):
             return False, None
             
-        df = pd.read_csv(SCANS_FILE)
-        if barcode in df['barcode'].astype(str).values:
+        if _barcode_index().contains(barcode):
              return True, None
         return False, None
     except Exception as e:
         return False, str(e)
 
+def check_duplicate_barcodes(barcodes):
+    """
+    Bulk version of check_duplicate_barcode: one index refresh for the whole list.
+    Returns (set of barcodes already in the DB, error).
+    """
+    try:
+        if not os.path.exists(SCANS_FILE):
+            return set(), None
+            
+        index = _barcode_index()
+        index.refresh()
+        return {b for b in barcodes if index.contains(b, refresh=False)}, None
+    except Exception as e:
+        return set(), str(e)
+
 def insert_scan(barcode, username, branch):
     try:
-        # Check duplicate again
-        is_dup, _ = check_duplicate_barcode(barcode)
-        if is_dup:
-             return False, "Duplicate barcode"
+        with _scans_lock():
+            # Check duplicate again, under the write lock this time
+            is_dup, err = check_duplicate_barcode(barcode)
+            if err:
+                return False, err
+            if is_dup:
+                 return False, "Duplicate barcode"
 
-        if os.path.exists(SCANS_FILE):
-            df = pd.read_csv(SCANS_FILE)
-        else:
-            df = pd.DataFrame(columns=['scan_id', 'barcode', 'created_by', 'branch_code', 'created_date'])
+            new_row = {
+                'scan_id': _reserve_scan_ids(1),
+                'barcode': barcode,
+                'created_by': username,
+                'branch_code': branch,
+                'created_date': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            }
             
-        if not df.empty and 'scan_id' in df.columns:
-            new_id = int(df['scan_id'].max()) + 1
-        else:
-            new_id = 1
-        new_row = {
-            'scan_id': new_id,
-            'barcode': barcode,
-            'created_by': username,
-            'branch_code': branch,
-            'created_date': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        }
-        
-        # Append
-        df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
-        df.to_csv(SCANS_FILE, index=False)
+            # Append only the new row
+            watermark = _counts_watermark()
+            _append_rows(SCANS_FILE, SCANS_COLUMNS, [new_row])
+            _update_counts([new_row], 1, watermark)
         
         return True, "Scanned Successfully"
     except Exception as e:
         return False, str(e)
 
-def insert_scan_batch(scans):
+def insert_scan_batch_results(scans):
     """
     scans: list of dictionaries {'barcode': b, 'username': u, 'branch': br}
+    Returns (results, error) where results has one entry per input scan, in order:
+    {'barcode': b, 'status': 'inserted' | 'duplicate_db' | 'duplicate_batch', 'scan_id': id}
     """
     try:
-        if os.path.exists(SCANS_FILE):
-            df = pd.read_csv(SCANS_FILE)
-        else:
-            df = pd.DataFrame(columns=['scan_id', 'barcode', 'created_by', 'branch_code', 'created_date'])
+        with _scans_lock():
+            index = _barcode_index()
+            index.refresh()
             
-        new_rows = []
-        if not df.empty and 'scan_id' in df.columns:
-            # Safely get max ID, handle bad data with errors='coerce' to be safe, though not critical if we manage file well
-            current_id = df['scan_id'].max()
-            if pd.isna(current_id): current_id = 0
-        else:
-            current_id = 0
-        
-        existing_barcodes = set(df['barcode'].astype(str).values)
-        
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
-        count = 0
-        for s in scans:
-            if s['barcode'] in existing_barcodes:
-                continue # Skip duplicates
-                
-            current_id += 1
-            new_rows.append({
-                'scan_id': current_id,
-                'barcode': s['barcode'],
-                'created_by': s['username'],
-                'branch_code': s['branch'],
-                'created_date': timestamp
-            })
-            existing_barcodes.add(s['barcode'])
-            count += 1
+            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             
-        if new_rows:
-            df = pd.concat([df, pd.DataFrame(new_rows)], ignore_index=True)
-            df.to_csv(SCANS_FILE, index=False)
+            results = []
+            new_rows = []
+            batch_barcodes = {}
+            for s in scans:
+                barcode = s['barcode']
+                if barcode in batch_barcodes:
+                    results.append({'barcode': barcode, 'status': 'duplicate_batch', 'scan_id': None})
+                    continue
+                if index.contains(barcode, refresh=False):
+                    results.append({'barcode': barcode, 'status': 'duplicate_db',
+                                    'scan_id': index.scan_id_for(barcode)})
+                    continue
+                    
+                row = {
+                    'barcode': barcode,
+                    'created_by': s['username'],
+                    'branch_code': s['branch'],
+                    'created_date': timestamp
+                }
+                new_rows.append(row)
+                batch_barcodes[barcode] = row
+                results.append({'barcode': barcode, 'status': 'inserted', 'scan_id': None})
+                
+            if new_rows:
+                first_id = _reserve_scan_ids(len(new_rows))
+                for offset, row in enumerate(new_rows):
+                    row['scan_id'] = first_id + offset
+                watermark = _counts_watermark()
+                _append_rows(SCANS_FILE, SCANS_COLUMNS, new_rows)
+                _update_counts(new_rows, 1, watermark)
+                index.refresh()
+
+            for result in results:
+                if result['status'] != 'duplicate_db':
+                    result['scan_id'] = batch_barcodes[result['barcode']]['scan_id']
             
-        return True, f"Successfully inserted {count} records."
+        return results, None
     except Exception as e:
-        return False, str(e)
+        return None, str(e)
+
+def insert_scan_batch(scans):
+    """
+    scans: list of dictionaries {'barcode': b, 'username': u, 'branch': br}
+    """
+    results, err = insert_scan_batch_results(scans)
+    if err:
+        return False, err
+    count = sum(1 for r in results if r['status'] == 'inserted')
+    return True, f"Successfully inserted {count} records."
 
 def get_all_scans():
+    import pandas as pd
     try:
         if not os.path.exists(SCANS_FILE):
             return pd.DataFrame(), "No scans found"
-        df = pd.read_csv(SCANS_FILE)
+        df = _load_scans()
         # Sort by date desc if possible
         if 'created_date' in df.columns:
             df = df.sort_values(by='created_date', ascending=False)
@@ -147,20 +376,163 @@ def get_all_scans():
     except Exception as e:
         return None, str(e)
 
-def delete_scan(scan_id):
+def query_scans(page=1, page_size=50, branch=None, user=None, date_from=None, date_to=None,
+                barcode_prefix=None, sort_by='created_date', ascending=False):
+    """
+    One page of scans from the shared read model, filtered and sorted server-side.
+    branch may be a code or a list of codes; date_from/date_to are dates or datetimes.
+    Returns (page_df, total_matching_rows, error).
+    """
+    import pandas as pd
     try:
         if not os.path.exists(SCANS_FILE):
-             return False, "File not found"
+            return pd.DataFrame(columns=SCANS_COLUMNS), 0, "No scans found"
+        model = _read_model()
+        page_df, total = model.query(page=page, page_size=page_size, branch=branch, user=user,
+                                     date_from=date_from, date_to=date_to,
+                                     barcode_prefix=barcode_prefix, sort_by=sort_by,
+                                     ascending=ascending)
+        return page_df, total, None
+    except Exception as e:
+        return None, 0, str(e)
+
+def delete_scans(scan_ids):
+    """
+    Deletes any number of scans with one lookup and one tombstone append.
+    Returns (results, error) with one entry per requested id, in order:
+    {'scan_id': id, 'status': 'deleted' | 'not_found'}
+    """
+    try:
+        if not os.path.exists(SCANS_FILE):
+             return None, "File not found"
              
-        df = pd.read_csv(SCANS_FILE)
-        
-        # Check if ID exists
-        if scan_id not in df['scan_id'].values:
-            return False, "ID not found"
+        scan_ids = [int(i) for i in scan_ids]
+        with _scans_lock():
+            live = _read_model().frame()
             
-        # Filter out
-        df = df[df['scan_id'] != scan_id]
-        df.to_csv(SCANS_FILE, index=False)
-        return True, "Deleted successfully"
+            # Check which IDs exist (and have not been deleted already)
+            found = live[live['scan_id'].isin(scan_ids)]
+            rows = {int(r['scan_id']): r for r in found.to_dict('records')}
+            
+            results = []
+            tombstones = []
+            for scan_id in scan_ids:
+                if scan_id in rows:
+                    row = rows.pop(scan_id)
+                    tombstones.append({'scan_id': scan_id, 'barcode': row['barcode'], 'row': row})
+                    results.append({'scan_id': scan_id, 'status': 'deleted'})
+                else:
+                    results.append({'scan_id': scan_id, 'status': 'not_found'})
+                    
+            # Record tombstones; the rows themselves are dropped by compact_scans()
+            if tombstones:
+                watermark = _counts_watermark()
+                _append_rows(SCANS_TOMBSTONE_FILE, TOMBSTONE_COLUMNS, tombstones)
+                _update_counts([t['row'] for t in tombstones], -1, watermark)
+        return results, None
+    except Exception as e:
+        return None, str(e)
+
+def delete_scan(scan_id):
+    results, err = delete_scans([scan_id])
+    if err:
+        return False, err
+    if results[0]['status'] != 'deleted':
+        return False, "ID not found"
+    return True, "Deleted successfully"
+
+def compact_scans():
+    """
+    Folds tombstones (and, in columnar mode, the scans.csv delta) into the base
+    storage and clears the tombstone log. Meant to run offline (e.g.
+    `python manage.py compact` after a stock-take), not on the request path.
+    """
+    try:
+        if not os.path.exists(SCANS_FILE):
+            return False, "File not found"
+
+        import columnar
+        with _scans_lock():
+            deleted = len(_read_tombstones())
+            df = _load_scans()
+
+            if SCANS_STORAGE == 'columnar':
+                # Snapshot first, then reset the delta to just the header
+                columnar.write_snapshot(df, root=SCANS_SNAPSHOT_DIR)
+                _replace_file(SCANS_FILE, (",".join(SCANS_COLUMNS) + "\n").encode('utf-8'))
+            else:
+                _replace_file(SCANS_FILE, df[SCANS_COLUMNS].to_csv(index=False).encode('utf-8'))
+                columnar.remove_snapshot(SCANS_SNAPSHOT_DIR)
+            if os.path.exists(SCANS_TOMBSTONE_FILE):
+                os.remove(SCANS_TOMBSTONE_FILE)
+            aggregates.get_counts_file(SCANS_COUNTS_FILE).save(aggregates.counts_from_frame(df),
+                                                               _counts_watermark())
+        return True, f"Compacted {len(df) + deleted} rows down to {len(df)}."
+    except Exception as e:
+        return False, str(e)
+
+def get_scan_counts(branch=None):
+    """
+    Live scan counts: {'total', 'by_branch', 'by_user', 'by_day', 'by_branch_user',
+    'by_branch_day'}; with branch, the same shape for that branch only.
+    Reads the maintained counts; only if they were never built or are behind the
+    table (a write could not update them) are they recounted from the table.
+    Treat the result as read-only. Returns (counts, error); if the recount could
+    not be saved, the counts come with an error saying so.
+    """
+    try:
+        counts_file = aggregates.get_counts_file(SCANS_COUNTS_FILE)
+        warning = None
+        if _counts_behind(counts_file):
+            # Checked again under the lock: a write in progress also looks behind
+            with _scans_lock():
+                if _counts_behind(counts_file):
+                    counts = _recount()
+                    try:
+                        counts_file.save(counts, _counts_watermark())
+                    except Exception as e:
+                        metrics.inc('scan_counts_errors_total')
+                        warning = f"Scan counts recomputed from the table; saving them failed: {e}"
+                else:
+                    counts = counts_file.get()
+        else:
+            counts = counts_file.get()
+        return (aggregates.for_branch(counts, branch) if branch else counts), warning
+    except Exception as e:
+        return None, str(e)
+
+def rebuild_scan_counts():
+    """Recomputes the counts from the scans table."""
+    try:
+        with _scans_lock():
+            counts = _recount()
+            aggregates.get_counts_file(SCANS_COUNTS_FILE).save(counts, _counts_watermark())
+        return True, f"Rebuilt counts for {counts['total']} scans."
     except Exception as e:
         return False, str(e)
+
+# Storage backend. The CSV files above stay the default; DB_BACKEND=sqlite serves
+# the same API from SQLite instead (see db_sqlite.py) and DB_BACKEND=partitioned
+# splits scans by branch and month (see db_partitioned.py).
+DB_BACKEND = os.environ.get('DB_BACKEND', 'csv')
+
+if DB_BACKEND == 'sqlite':
+    from db_sqlite import (init_db, validate_db_user, user_has_branch,
+                           check_duplicate_barcode, check_duplicate_barcodes,
+                           insert_scan, insert_scan_batch, insert_scan_batch_results,
+                           get_all_scans, query_scans, delete_scan, delete_scans,
+                           compact_scans, get_scan_counts, rebuild_scan_counts)
+elif DB_BACKEND == 'partitioned':
+    # Users stay in users.csv; only the scans functions move
+    from db_partitioned import (init_db, check_duplicate_barcode, check_duplicate_barcodes,
+                                insert_scan, insert_scan_batch, insert_scan_batch_results,
+                                get_all_scans, query_scans, delete_scan, delete_scans,
+                                compact_scans, get_scan_counts, rebuild_scan_counts)
+
+# Call counts and latency histograms for every public function, whichever backend
+# serves it (see metrics.py); a call made from inside another one is not counted again
+for _name in ('init_db', 'validate_db_user', 'user_has_branch', 'check_duplicate_barcode',
+              'check_duplicate_barcodes', 'insert_scan', 'insert_scan_batch',
+              'insert_scan_batch_results', 'get_all_scans', 'query_scans', 'delete_scan',
+              'delete_scans', 'compact_scans', 'get_scan_counts', 'rebuild_scan_counts'):
+    globals()[_name] = metrics.instrument(_name)(globals()[_name])
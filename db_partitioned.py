@@ -0,0 +1,602 @@
+"""
+Scans storage partitioned by branch and month; enable with DB_BACKEND=partitioned.
+Same functions and return values as db.py (users stay in users.csv).
+
+    scans_partitioned/index.csv                  global barcode -> partition log
+    scans_partitioned/seq                        global scan_id sequence
+    scans_partitioned/<BRANCH>/<YYYY-MM>/scans.csv      append-only rows
+    scans_partitioned/<BRANCH>/<YYYY-MM>/scans.deleted  tombstones
+    scans_partitioned/.archive/<BRANCH>/<YYYY-MM>.csv.gz archived months
+
+index.csv is an append-only log of (barcode, scan_id, partition, op) with op
+'+' on insert and '-' on delete; every process tails it into a dict, so
+barcodes stay unique across the whole company without reading any
+partition. An insert appends to the index and to its own branch's current
+month only; a branch-scoped read or delete touches only that branch's
+partitions. Archived months keep their index entries, so their barcodes
+still count as duplicates. Branch directories never start with a dot (see
+_safe_component), so no branch can collide with .archive.
+"""
+import csv
+import gzip
+import io
+import os
+import re
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+
+import aggregates
+import csv_tail
+import db
+import metrics
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+ROOT = os.environ.get('PARTITION_ROOT', 'scans_partitioned')
+INDEX_COLUMNS = ['barcode', 'scan_id', 'partition', 'op']
+ARCHIVE_DIR = '.archive'
+LEGACY_ARCHIVE_DIR = 'archive'  # shared its namespace with a branch called ARCHIVE
+READ_WORKERS = int(os.environ.get('PARTITION_READ_WORKERS', '0')) or min(8, os.cpu_count() or 1)
+
+def _path(*parts):
+    return os.path.join(ROOT, *parts)
+
+def _safe_component(value):
+    # Branch codes end up in paths; keep them to a boring character set
+    return re.sub(r'[^A-Za-z0-9_-]', '_', str(value or 'unknown'))
+
+def partition_id(branch, created_date):
+    return f"{_safe_component(branch)}/{str(created_date)[:7]}"
+
+def _partition_branch(pid):
+    return pid.split('/', 1)[0]
+
+_write_lock = threading.Lock()
+
+@contextmanager
+def _lock():
+    # Same scheme as db._scans_lock: thread lock plus an advisory file lock
+    with _write_lock:
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(ROOT, exist_ok=True)
+        with open(_path('.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+class GlobalIndex:
+    """barcode -> (scan_id, partition) for every live scan, kept current by tailing index.csv."""
+    def __init__(self, path):
+        self.tail = csv_tail.CsvTail(path)
+        self._by_barcode = {}
+        self._by_id = {}
+        self._max_id = 0  # highest id in the log, deleted ones included
+        self._lock = threading.Lock()
+
+    def _apply(self, rows):
+        for row in rows:
+            if len(row) < 4:
+                continue
+            barcode, scan_id, pid, op = row[0], int(row[1]), row[2], row[3]
+            self._max_id = max(self._max_id, scan_id)
+            if op == '+':
+                self._by_barcode[barcode] = (scan_id, pid)
+                self._by_id[scan_id] = barcode
+            elif self._by_id.get(scan_id) == barcode:
+                del self._by_barcode[barcode]
+                del self._by_id[scan_id]
+
+    def refresh(self):
+        with self._lock:
+            st = self.tail.stat()
+            if self.tail.replaced(st):
+                self.tail = csv_tail.CsvTail(self.tail.path)
+                self._by_barcode, self._by_id, self._max_id = {}, {}, 0
+                st = self.tail.stat()
+            if not self.tail.unchanged(st):
+                self._apply(self.tail.read_new_rows(st))
+
+    def get(self, barcode):
+        return self._by_barcode.get(barcode)
+
+    def barcode_for_id(self, scan_id):
+        return self._by_id.get(scan_id)
+
+    def max_scan_id(self):
+        return self._max_id
+
+    def live_entries(self):
+        return [(b, scan_id, pid) for b, (scan_id, pid) in self._by_barcode.items()]
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def _index():
+    key = os.path.abspath(_path('index.csv'))
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = GlobalIndex(_path('index.csv'))
+    index.refresh()
+    return index
+
+def _reserve_ids(index, count):
+    # Persisted before any row is written, like db._reserve_scan_ids
+    seq_path = _path('seq')
+    last_id = None
+    if os.path.exists(seq_path):
+        with open(seq_path) as f:
+            content = f.read().strip()
+        if content:
+            last_id = int(content)
+    if last_id is None:
+        # One-time bootstrap. Compaction drops deleted ids from the index, so
+        # the partitions and archives are checked too
+        last_id = index.max_scan_id()
+        for frame in (_read_many(list_partitions()), _read_many(list_archived(), reader=_read_archived)):
+            if not frame.empty:
+                last_id = max(last_id, int(frame['scan_id'].max()))
+    db._replace_file(seq_path, f"{last_id + count}\n".encode())
+    return last_id + 1
+
+def list_partitions(branch=None, month_from=None, month_to=None):
+    """Live (not archived) partition ids, optionally for some branches and a month range."""
+    if not os.path.isdir(ROOT):
+        return []
+    if branch:
+        branches = [branch] if isinstance(branch, str) else list(branch)
+        branch_dirs = sorted({_safe_component(b) for b in branches})
+    else:
+        branch_dirs = sorted(d for d in os.listdir(ROOT) if not d.startswith('.') and os.path.isdir(_path(d)))
+    pids = []
+    for branch_dir in branch_dirs:
+        if not os.path.isdir(_path(branch_dir)):
+            continue
+        for month in sorted(os.listdir(_path(branch_dir))):
+            if (month_from and month < month_from) or (month_to and month > month_to):
+                continue
+            pids.append(f"{branch_dir}/{month}")
+    return pids
+
+def list_archived(branch=None):
+    root = _path(ARCHIVE_DIR)
+    if not os.path.isdir(root):
+        return []
+    branch_dirs = [_safe_component(branch)] if branch else sorted(os.listdir(root))
+    return [f"{b}/{name[:-len('.csv.gz')]}" for b in branch_dirs if os.path.isdir(os.path.join(root, b))
+            for name in sorted(os.listdir(os.path.join(root, b))) if name.endswith('.csv.gz')]
+
+_frames = {}  # partition dir -> (signature, live rows); partitions only change by appends
+_typed_frames = {}  # partition dir -> (signature, live rows typed for query_scans)
+_frames_lock = threading.Lock()
+
+def _signature(*paths):
+    sig = []
+    for p in paths:
+        try:
+            st = os.stat(p)
+            sig.append((st.st_ino, st.st_size, st.st_mtime_ns))
+        except FileNotFoundError:
+            sig.append(None)
+    return tuple(sig)
+
+def _read_partition(pid):
+    """Live rows of one partition (tombstones applied). Treat the result as read-only."""
+    import pandas as pd
+    scans_path, tomb_path = _path(pid, 'scans.csv'), _path(pid, 'scans.deleted')
+    key = os.path.abspath(_path(pid))
+    sig = _signature(scans_path, tomb_path)
+    with _frames_lock:
+        cached = _frames.get(key)
+    if cached and cached[0] == sig:
+        return cached[1]
+    if sig[0] is None:
+        df = pd.DataFrame(columns=db.SCANS_COLUMNS)
+    else:
+        df = pd.read_csv(scans_path, dtype={'barcode': str})
+        metrics.record_rows('read', len(df), 'partition')
+    if sig[1] is not None:
+        df = df[~df['scan_id'].isin(db._read_tombstones(tomb_path))]
+    with _frames_lock:
+        _frames[key] = (sig, df)
+    return df
+
+def _typed_partition(pid):
+    """_read_partition's rows as scans_read_model typed frame, cached on the same signature."""
+    import scans_read_model
+    key = os.path.abspath(_path(pid))
+    sig = _signature(_path(pid, 'scans.csv'), _path(pid, 'scans.deleted'))
+    with _frames_lock:
+        cached = _typed_frames.get(key)
+    if cached and cached[0] == sig:
+        return cached[1]
+    df = scans_read_model._typed(_read_partition(pid))
+    with _frames_lock:
+        _typed_frames[key] = (sig, df)
+    return df
+
+def _read_archived(pid):
+    import pandas as pd
+    branch_dir, month = pid.split('/', 1)
+    return pd.read_csv(_path(ARCHIVE_DIR, branch_dir, f"{month}.csv.gz"), dtype={'barcode': str})
+
+def _read_many(pids, reader=_read_partition, workers=READ_WORKERS):
+    import pandas as pd
+    if not pids:
+        return pd.DataFrame(columns=db.SCANS_COLUMNS)
+    if workers > 1 and len(pids) > 1:
+        # pandas' C parser releases the GIL, so threads overlap the parsing
+        with ThreadPoolExecutor(max_workers=min(workers, len(pids))) as pool:
+            frames = list(pool.map(reader, pids))
+    else:
+        frames = [reader(pid) for pid in pids]
+    frames = [f for f in frames if not f.empty]
+    if not frames:
+        return pd.DataFrame(columns=db.SCANS_COLUMNS)
+    return pd.concat(frames, ignore_index=True)
+
+# ---- counts (same shape and watermark scheme as db.py; see aggregates.py) ----
+
+def _counts_file():
+    return aggregates.get_counts_file(_path('counts.json'))
+
+def _counts_watermark():
+    # Every insert and delete appends to the index, so its size covers both
+    path = _path('index.csv')
+    return [os.path.getsize(path) if os.path.exists(path) else 0]
+
+def _all_rows_for_counts():
+    import pandas as pd
+    live = _read_many(list_partitions())
+    archived = _read_many(list_archived(), reader=_read_archived)
+    return pd.concat([live, archived], ignore_index=True)
+
+def _counts_behind(counts_file):
+    return counts_file.get() is None or counts_file.watermark() != _counts_watermark()
+
+def _update_counts(rows, sign, watermark_before):
+    try:
+        counts_file = _counts_file()
+        if counts_file.get() is None or counts_file.watermark() != watermark_before:
+            counts_file.save(aggregates.counts_from_frame(_all_rows_for_counts()), _counts_watermark())
+        else:
+            counts_file.append(aggregates.delta_from_rows(rows, sign), _counts_watermark())
+    except Exception as e:
+        # As in db._update_counts: the write stands, get_scan_counts recounts meanwhile
+        print(f"Scan counts update failed: {e}")
+        metrics.inc('scan_counts_errors_total')
+
+# ---- public API ----
+
+def migrate_from_csv():
+    """One-shot split of the single-file store (scans.csv + snapshot/tombstones) into partitions."""
+    try:
+        with _lock():
+            if os.path.exists(_path('index.csv')):
+                return False, "Partitioned store already initialised"
+            if not os.path.exists(db.SCANS_FILE):
+                return False, f"{db.SCANS_FILE} not found"
+            df = db._load_scans().sort_values('scan_id')
+            df = df.drop_duplicates(subset='barcode', keep='first')
+            df['partition'] = [partition_id(b, d) for b, d in zip(df['branch_code'], df['created_date'])]
+            for pid, part in df.groupby('partition'):
+                os.makedirs(_path(pid), exist_ok=True)
+                db._append_rows(_path(pid, 'scans.csv'), db.SCANS_COLUMNS, part.to_dict('records'))
+            index_rows = [{'barcode': b, 'scan_id': int(i), 'partition': p, 'op': '+'}
+                          for b, i, p in zip(df['barcode'], df['scan_id'], df['partition'])]
+            db._append_rows(_path('index.csv'), INDEX_COLUMNS, index_rows)
+            last_id = int(df['scan_id'].max()) if len(df) else 0
+            db._replace_file(_path('seq'), f"{last_id}\n".encode())
+            _counts_file().save(aggregates.counts_from_frame(df), _counts_watermark())
+        return True, f"Migrated {len(df)} scans into {df['partition'].nunique()} partitions."
+    except Exception as e:
+        return False, str(e)
+
+def _move_legacy_archive():
+    # Archives used to live in archive/, where a branch of that name would also go;
+    # a branch directory holds month directories, an archive directory .csv.gz files
+    legacy = _path(LEGACY_ARCHIVE_DIR)
+    if os.path.isdir(legacy) and not os.path.exists(_path(ARCHIVE_DIR)) and any(
+            name.endswith('.csv.gz') for _, _, names in os.walk(legacy) for name in names):
+        os.replace(legacy, _path(ARCHIVE_DIR))
+
+def init_db():
+    db._init_users_file()
+    _move_legacy_archive()
+    if not os.path.exists(_path('index.csv')):
+        os.makedirs(ROOT, exist_ok=True)
+        if os.path.exists(db.SCANS_FILE):
+            print(f"Migrating {db.SCANS_FILE} into {ROOT}/...")
+            success, msg = migrate_from_csv()
+            print(msg)
+        else:
+            with open(_path('index.csv'), 'w', newline='', encoding='utf-8') as f:
+                csv.writer(f, lineterminator='\n').writerow(INDEX_COLUMNS)
+
+def check_duplicate_barcode(barcode):
+    try:
+        return _index().get(str(barcode)) is not None, None
+    except Exception as e:
+        return False, str(e)
+
+def check_duplicate_barcodes(barcodes):
+    try:
+        index = _index()
+        return {b for b in barcodes if index.get(str(b)) is not None}, None
+    except Exception as e:
+        return set(), str(e)
+
+def insert_scan_batch_results(scans):
+    """
+    scans: list of dictionaries {'barcode': b, 'username': u, 'branch': br}
+    Returns (results, error); see db.insert_scan_batch_results.
+    """
+    try:
+        with _lock():
+            index = _index()
+            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            results, new_rows, batch = [], [], {}
+            for s in scans:
+                barcode = str(s['barcode'])
+                if barcode in batch:
+                    results.append({'barcode': barcode, 'status': 'duplicate_batch', 'scan_id': None})
+                    continue
+                existing = index.get(barcode)
+                if existing is not None:
+                    results.append({'barcode': barcode, 'status': 'duplicate_db', 'scan_id': existing[0]})
+                    continue
+                row = {'barcode': barcode, 'created_by': s['username'], 'branch_code': s['branch'],
+                       'created_date': timestamp}
+                new_rows.append(row)
+                batch[barcode] = row
+                results.append({'barcode': barcode, 'status': 'inserted', 'scan_id': None})
+
+            if new_rows:
+                first_id = _reserve_ids(index, len(new_rows))
+                by_partition = {}
+                for offset, row in enumerate(new_rows):
+                    row['scan_id'] = first_id + offset
+                    by_partition.setdefault(partition_id(row['branch_code'], timestamp), []).append(row)
+                watermark = _counts_watermark()
+                # Index first: a crash after it can only over-report a duplicate, never allow one
+                db._append_rows(_path('index.csv'), INDEX_COLUMNS,
+                                [{'barcode': r['barcode'], 'scan_id': r['scan_id'], 'partition': pid, 'op': '+'}
+                                 for pid, rows in by_partition.items() for r in rows])
+                for pid, rows in by_partition.items():
+                    os.makedirs(_path(pid), exist_ok=True)
+                    db._append_rows(_path(pid, 'scans.csv'), db.SCANS_COLUMNS, rows)
+                _update_counts(new_rows, 1, watermark)
+                index.refresh()
+
+            for result in results:
+                if result['status'] != 'duplicate_db':
+                    result['scan_id'] = batch[result['barcode']]['scan_id']
+        return results, None
+    except Exception as e:
+        return None, str(e)
+
+def insert_scan_batch(scans):
+    results, err = insert_scan_batch_results(scans)
+    if err:
+        return False, err
+    count = sum(1 for r in results if r['status'] == 'inserted')
+    return True, f"Successfully inserted {count} records."
+
+def insert_scan(barcode, username, branch):
+    results, err = insert_scan_batch_results([{'barcode': barcode, 'username': username, 'branch': branch}])
+    if err:
+        return False, err
+    if results[0]['status'] != 'inserted':
+        return False, "Duplicate barcode"
+    return True, "Scanned Successfully"
+
+def get_all_scans(branch=None, include_archived=False, workers=READ_WORKERS):
+    """All scans (optionally one branch / including archived months), partitions read in parallel."""
+    import pandas as pd
+    try:
+        df = _read_many(list_partitions(branch), workers=workers)
+        if include_archived:
+            archived = _read_many(list_archived(branch), reader=_read_archived, workers=workers)
+            df = pd.concat([df, archived], ignore_index=True)
+        if df.empty:
+            return pd.DataFrame(), "No scans found"
+        return df.sort_values(by='created_date', ascending=False), None
+    except Exception as e:
+        return None, str(e)
+
+def query_scans(page=1, page_size=50, branch=None, user=None, date_from=None, date_to=None,
+                barcode_prefix=None, sort_by='created_date', ascending=False):
+    """Returns (page_df, total_matching_rows, error); only partitions that can match are read."""
+    import pandas as pd
+    import scans_read_model
+    try:
+        if sort_by not in scans_read_model.SORTABLE_COLUMNS:
+            return None, 0, f"Cannot sort by {sort_by}"
+        month_from = pd.Timestamp(date_from).strftime("%Y-%m") if date_from is not None else None
+        month_to = pd.Timestamp(date_to).strftime("%Y-%m") if date_to is not None else None
+        def matching(pid):
+            # Filtered per partition, so only the matching rows are concatenated and sorted
+            return scans_read_model.filter_scans(_typed_partition(pid), branch=branch, user=user,
+                                                 date_from=date_from, date_to=date_to,
+                                                 barcode_prefix=barcode_prefix)
+        df = _read_many(list_partitions(branch, month_from, month_to), reader=matching)
+        if df.empty:
+            df = scans_read_model._typed(df)
+        df = df.sort_values(sort_by, ascending=ascending, kind='stable')
+        start = max(page - 1, 0) * page_size
+        return df.iloc[start:start + page_size], len(df), None
+    except Exception as e:
+        return None, 0, str(e)
+
+def delete_scans(scan_ids, branch=None):
+    """
+    Returns (results, error); see db.delete_scans. With branch, ids outside that
+    branch are 'not_found' and no other branch's partitions are touched.
+    Scans in archived months cannot be deleted and are reported 'not_found'.
+    """
+    try:
+        scan_ids = [int(i) for i in scan_ids]
+        with _lock():
+            index = _index()
+            by_partition = {}
+            for scan_id in dict.fromkeys(scan_ids):
+                barcode = index.barcode_for_id(scan_id)
+                if barcode is None:
+                    continue
+                pid = index.get(barcode)[1]
+                if branch and _partition_branch(pid) != _safe_component(branch):
+                    continue
+                by_partition.setdefault(pid, []).append(scan_id)
+
+            deleted_rows = []
+            for pid, ids in by_partition.items():
+                if not os.path.isdir(_path(pid)):
+                    continue  # archived
+                live = _read_partition(pid)
+                found = live[live['scan_id'].isin(ids)]
+                if branch:
+                    found = found[found['branch_code'].astype(str) == str(branch)]
+                deleted_rows.extend(dict(r, partition=pid) for r in found.to_dict('records'))
+
+            if deleted_rows:
+                watermark = _counts_watermark()
+                for pid in {r['partition'] for r in deleted_rows}:
+                    db._append_rows(_path(pid, 'scans.deleted'), db.TOMBSTONE_COLUMNS,
+                                    [r for r in deleted_rows if r['partition'] == pid])
+                db._append_rows(_path('index.csv'), INDEX_COLUMNS,
+                                [dict(r, op='-') for r in deleted_rows])
+                _update_counts(deleted_rows, -1, watermark)
+
+        deleted_ids = {int(r['scan_id']) for r in deleted_rows}
+        results = []
+        for scan_id in scan_ids:
+            if scan_id in deleted_ids:
+                deleted_ids.discard(scan_id)
+                results.append({'scan_id': scan_id, 'status': 'deleted'})
+            else:
+                results.append({'scan_id': scan_id, 'status': 'not_found'})
+        return results, None
+    except Exception as e:
+        return None, str(e)
+
+def delete_scan(scan_id, branch=None):
+    results, err = delete_scans([scan_id], branch=branch)
+    if err:
+        return False, err
+    if results[0]['status'] != 'deleted':
+        return False, "ID not found"
+    return True, "Deleted successfully"
+
+def compact_scans(branch=None):
+    """Folds tombstones into their partitions and rewrites the index with live entries only."""
+    try:
+        with _lock():
+            compacted = 0
+            for pid in list_partitions(branch):
+                tomb_path = _path(pid, 'scans.deleted')
+                if not os.path.exists(tomb_path):
+                    continue
+                live = _read_partition(pid)
+                db._replace_file(_path(pid, 'scans.csv'),
+                                 live[db.SCANS_COLUMNS].to_csv(index=False).encode('utf-8'))
+                os.remove(tomb_path)
+                compacted += 1
+            if branch is None:
+                # Drop '-' events and the '+' events they cancel
+                out = io.StringIO()
+                writer = csv.writer(out, lineterminator='\n')
+                writer.writerow(INDEX_COLUMNS)
+                for barcode, scan_id, pid in sorted(_index().live_entries(), key=lambda e: e[1]):
+                    writer.writerow([barcode, scan_id, pid, '+'])
+                db._replace_file(_path('index.csv'), out.getvalue().encode('utf-8'))
+                counts = _counts_file().get()
+                if counts is not None:
+                    _counts_file().save(counts, _counts_watermark())
+        return True, f"Compacted {compacted} partition(s)."
+    except Exception as e:
+        return False, str(e)
+
+def archive_months(before_month, branch=None):
+    """
+    Moves every partition older than before_month ('YYYY-MM') into
+    .archive/<BRANCH>/<YYYY-MM>.csv.gz (tombstones applied), merging with an
+    archive already there. Index entries stay, so archived barcodes are still
+    rejected as duplicates. The current month is still being written to and
+    is never archived.
+    """
+    import pandas as pd
+    try:
+        if not re.fullmatch(r'\d{4}-\d{2}', str(before_month)):
+            return False, f"Expected a month as YYYY-MM, got {before_month!r}"
+        current_month = datetime.now().strftime("%Y-%m")
+        if before_month > current_month:
+            return False, f"Cannot archive {current_month} or later; pass {current_month} at most"
+        archived, rows = 0, 0
+        with _lock():
+            _move_legacy_archive()
+            for pid in list_partitions(branch):
+                branch_dir, month = pid.split('/', 1)
+                if month >= before_month:
+                    continue
+                live = _read_partition(pid)
+                os.makedirs(_path(ARCHIVE_DIR, branch_dir), exist_ok=True)
+                target = _path(ARCHIVE_DIR, branch_dir, f"{month}.csv.gz")
+                merged = live
+                if os.path.exists(target):
+                    # Rows archived earlier keep their index entries; losing them
+                    # would leave barcodes that are duplicates of nothing
+                    merged = pd.concat([_read_archived(pid), live], ignore_index=True)
+                    merged = merged.drop_duplicates(subset='scan_id', keep='last').sort_values('scan_id')
+                with gzip.open(target + '.tmp', 'wt', encoding='utf-8', newline='') as f:
+                    merged[db.SCANS_COLUMNS].to_csv(f, index=False)
+                os.replace(target + '.tmp', target)
+                shutil.rmtree(_path(pid))
+                with _frames_lock:
+                    _frames.pop(os.path.abspath(_path(pid)), None)
+                    _typed_frames.pop(os.path.abspath(_path(pid)), None)
+                archived += 1
+                rows += len(live)
+        return True, f"Archived {archived} partition(s), {rows} scans."
+    except Exception as e:
+        return False, str(e)
+
+def get_scan_counts(branch=None):
+    """Returns (counts, error); see db.get_scan_counts."""
+    try:
+        counts_file = _counts_file()
+        warning = None
+        if _counts_behind(counts_file):
+            with _lock():
+                if _counts_behind(counts_file):
+                    counts = aggregates.counts_from_frame(_all_rows_for_counts())
+                    try:
+                        counts_file.save(counts, _counts_watermark())
+                    except Exception as e:
+                        metrics.inc('scan_counts_errors_total')
+                        warning = f"Scan counts recomputed from the table; saving them failed: {e}"
+                else:
+                    counts = counts_file.get()
+        else:
+            counts = counts_file.get()
+        return (aggregates.for_branch(counts, branch) if branch else counts), warning
+    except Exception as e:
+        return None, str(e)
+
+def rebuild_scan_counts():
+    try:
+        with _lock():
+            counts = aggregates.counts_from_frame(_all_rows_for_counts())
+            _counts_file().save(counts, _counts_watermark())
+        return True, f"Rebuilt counts for {counts['total']} scans."
+    except Exception as e:
+        return False, str(e)
@@ -0,0 +1,397 @@
+"""
+SQLite storage backend. Same functions and return values as db.py; enable it
+with DB_BACKEND=sqlite.
+
+The database runs in WAL mode so readers never block the writer, and the
+UNIQUE index on barcode makes duplicate rejection part of the insert itself
+instead of a separate read-then-write.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+import metrics
+
+DB_FILE = os.environ.get('SQLITE_DB_FILE', 'stock.db')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    password TEXT NOT NULL,
+    branches TEXT
+);
+CREATE TABLE IF NOT EXISTS scans (
+    scan_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    barcode TEXT NOT NULL,
+    created_by TEXT,
+    branch_code TEXT,
+    created_date TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_scans_barcode ON scans(barcode);
+CREATE INDEX IF NOT EXISTS idx_scans_branch_code ON scans(branch_code);
+CREATE INDEX IF NOT EXISTS idx_scans_created_date ON scans(created_date);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS scan_counts (
+    dim TEXT NOT NULL,
+    branch TEXT NOT NULL,
+    key TEXT NOT NULL,
+    n INTEGER NOT NULL,
+    PRIMARY KEY (dim, branch, key)
+);
+"""
+
+# Counts maintained inside the inserting/deleting transaction (see aggregates.py
+# for the shape get_scan_counts returns)
+COUNT_DIMENSIONS = (
+    ('total', "''", "''"),
+    ('branch', "{r}.branch_code", "''"),
+    ('user', "''", "{r}.created_by"),
+    ('day', "''", "substr({r}.created_date, 1, 10)"),
+    ('branch_user', "{r}.branch_code", "{r}.created_by"),
+    ('branch_day', "{r}.branch_code", "substr({r}.created_date, 1, 10)"),
+)
+
+def _count_triggers():
+    upserts = "\n".join(
+        f"    INSERT INTO scan_counts (dim, branch, key, n) VALUES "
+        f"('{dim}', IFNULL({branch.format(r='NEW')}, ''), IFNULL({key.format(r='NEW')}, ''), 1) "
+        f"ON CONFLICT (dim, branch, key) DO UPDATE SET n = n + 1;"
+        for dim, branch, key in COUNT_DIMENSIONS)
+    decrements = "\n".join(
+        f"    UPDATE scan_counts SET n = n - 1 WHERE dim = '{dim}' "
+        f"AND branch = IFNULL({branch.format(r='OLD')}, '') AND key = IFNULL({key.format(r='OLD')}, '');"
+        for dim, branch, key in COUNT_DIMENSIONS)
+    return (f"CREATE TRIGGER IF NOT EXISTS trg_scans_count_insert AFTER INSERT ON scans BEGIN\n{upserts}\nEND;\n"
+            f"CREATE TRIGGER IF NOT EXISTS trg_scans_count_delete AFTER DELETE ON scans BEGIN\n{decrements}\n"
+            f"    DELETE FROM scan_counts WHERE n <= 0;\nEND;\n")
+
+_local = threading.local()
+
+def _connect():
+    # One connection per thread; sqlite3 connections must not be shared across threads
+    path = os.path.abspath(DB_FILE)
+    conn = getattr(_local, 'conn', None)
+    if conn is None or getattr(_local, 'path', None) != path:
+        conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        _local.conn, _local.path = conn, path
+    return conn
+
+def _branches(branches_str):
+    branches_str = str(branches_str) if branches_str is not None else ''
+    return branches_str.split('|') if branches_str and branches_str != 'nan' else []
+
+def migrate_from_csv(users_file=None, scans_file=None):
+    """
+    One-shot import of users.csv and scans.csv (minus tombstoned rows).
+    Existing scan_ids are kept; duplicate barcodes in the CSV keep their first row.
+    """
+    import db
+    import pandas as pd
+    users_file = users_file or db.USERS_FILE
+    scans_file = scans_file or db.SCANS_FILE
+    try:
+        conn = _connect()
+        conn.executescript(SCHEMA)
+        done = conn.execute("SELECT value FROM meta WHERE key = 'migrated_from_csv'").fetchone()
+        if done:
+            return False, f"Already migrated on {done[0]}"
+
+        users, scans = [], []
+        if os.path.exists(users_file):
+            df = pd.read_csv(users_file, dtype=str)
+            users = list(df[['username', 'password', 'branches']].itertuples(index=False, name=None))
+        if os.path.exists(scans_file):
+            df = db._load_scans() if scans_file == db.SCANS_FILE else pd.read_csv(scans_file, dtype={'barcode': str})
+            df = df.sort_values('scan_id')
+            scans = [(int(r.scan_id), r.barcode, r.created_by, r.branch_code, r.created_date)
+                     for r in df.itertuples(index=False)]
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("INSERT OR IGNORE INTO users (username, password, branches) VALUES (?, ?, ?)", users)
+            conn.executemany("INSERT OR IGNORE INTO scans (scan_id, barcode, created_by, branch_code, created_date) "
+                             "VALUES (?, ?, ?, ?, ?)", scans)
+            conn.execute("INSERT INTO meta (key, value) VALUES ('migrated_from_csv', ?)",
+                         (datetime.now().strftime("%Y-%m-%d %H:%M:%S"),))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return True, f"Migrated {len(users)} users and {len(scans)} scans."
+    except Exception as e:
+        return False, str(e)
+
+def init_db():
+    conn = _connect()
+    conn.executescript(SCHEMA)
+    conn.executescript(_count_triggers())
+    if not conn.execute("SELECT 1 FROM meta WHERE key = 'scan_counts_built'").fetchone():
+        # Databases created before the counts table existed
+        rebuild_scan_counts()
+    migrated = conn.execute("SELECT 1 FROM meta WHERE key = 'migrated_from_csv'").fetchone()
+    if not migrated:
+        print(f"Migrating CSV data into {DB_FILE}...")
+        success, msg = migrate_from_csv()
+        print(msg)
+    if not conn.execute("SELECT 1 FROM users LIMIT 1").fetchone():
+        # Add default admin (pass: admin)
+        conn.execute("INSERT INTO users (username, password, branches) VALUES (?, ?, ?)",
+                     ('admin', hashlib.md5('admin'.encode()).hexdigest(), 'HeadOffice'))
+
+def validate_db_user(username, password):
+    try:
+        md5_hash = hashlib.md5(password.encode()).hexdigest()
+        row = _connect().execute("SELECT branches FROM users WHERE username = ? AND password = ?",
+                                 (username, md5_hash)).fetchone()
+        if row is None:
+            return None, "Invalid credentials"
+        return {'username': username, 'branches': _branches(row[0])}, None
+    except Exception as e:
+        return None, f"Login error: {e}"
+
+def user_has_branch(username, branch):
+    """Returns (has_branch, error); has_branch is None if it could not be checked."""
+    try:
+        row = _connect().execute("SELECT branches FROM users WHERE username = ?", (username,)).fetchone()
+        return row is not None and branch in _branches(row[0]), None
+    except Exception as e:
+        return None, str(e)
+
+def check_duplicate_barcode(barcode):
+    try:
+        row = _connect().execute("SELECT 1 FROM scans WHERE barcode = ?", (str(barcode),)).fetchone()
+        return row is not None, None
+    except Exception as e:
+        return False, str(e)
+
+def check_duplicate_barcodes(barcodes):
+    """Returns (set of barcodes already in the DB, error)."""
+    try:
+        conn = _connect()
+        barcodes = [str(b) for b in barcodes]
+        found = set()
+        # Stay under SQLite's bound-parameter limit
+        for start in range(0, len(barcodes), 500):
+            chunk = barcodes[start:start + 500]
+            placeholders = ", ".join("?" * len(chunk))
+            rows = conn.execute(f"SELECT barcode FROM scans WHERE barcode IN ({placeholders})", chunk)
+            found.update(row[0] for row in rows)
+        return found, None
+    except Exception as e:
+        return set(), str(e)
+
+def insert_scan(barcode, username, branch):
+    try:
+        cur = _connect().execute(
+            "INSERT OR IGNORE INTO scans (barcode, created_by, branch_code, created_date) VALUES (?, ?, ?, ?)",
+            (str(barcode), username, branch, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+        if cur.rowcount == 0:
+            return False, "Duplicate barcode"
+        metrics.record_rows('written', 1, 'sqlite.scans')
+        return True, "Scanned Successfully"
+    except Exception as e:
+        return False, str(e)
+
+def insert_scan_batch_results(scans):
+    """
+    scans: list of dictionaries {'barcode': b, 'username': u, 'branch': br}
+    Returns (results, error); see db.insert_scan_batch_results.
+    """
+    try:
+        conn = _connect()
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        results = []
+        batch_ids = {}
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for s in scans:
+                barcode = str(s['barcode'])
+                if barcode in batch_ids:
+                    results.append({'barcode': barcode, 'status': 'duplicate_batch', 'scan_id': batch_ids[barcode]})
+                    continue
+                # The UNIQUE index rejects barcodes already in the DB
+                cur = conn.execute(
+                    "INSERT OR IGNORE INTO scans (barcode, created_by, branch_code, created_date) VALUES (?, ?, ?, ?)",
+                    (barcode, s['username'], s['branch'], timestamp))
+                if cur.rowcount == 0:
+                    row = conn.execute("SELECT scan_id FROM scans WHERE barcode = ?", (barcode,)).fetchone()
+                    results.append({'barcode': barcode, 'status': 'duplicate_db', 'scan_id': row[0] if row else None})
+                    continue
+                batch_ids[barcode] = cur.lastrowid
+                results.append({'barcode': barcode, 'status': 'inserted', 'scan_id': cur.lastrowid})
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        metrics.record_rows('written', len(batch_ids), 'sqlite.scans')
+        return results, None
+    except Exception as e:
+        return None, str(e)
+
+def insert_scan_batch(scans):
+    """
+    scans: list of dictionaries {'barcode': b, 'username': u, 'branch': br}
+    """
+    results, err = insert_scan_batch_results(scans)
+    if err:
+        return False, err
+    count = sum(1 for r in results if r['status'] == 'inserted')
+    return True, f"Successfully inserted {count} records."
+
+def get_all_scans():
+    import pandas as pd
+    try:
+        df = pd.read_sql_query(
+            "SELECT scan_id, barcode, created_by, branch_code, created_date FROM scans ORDER BY created_date DESC",
+            _connect())
+        metrics.record_rows('read', len(df), 'sqlite.scans')
+        return df, None
+    except Exception as e:
+        return None, str(e)
+
+def query_scans(page=1, page_size=50, branch=None, user=None, date_from=None, date_to=None,
+                barcode_prefix=None, sort_by='created_date', ascending=False):
+    """Returns (page_df, total_matching_rows, error); see db.query_scans."""
+    import pandas as pd
+    try:
+        if sort_by not in ('created_date', 'scan_id', 'barcode', 'branch_code', 'created_by'):
+            return None, 0, f"Cannot sort by {sort_by}"
+        where, params = [], []
+        if branch:
+            branches = [branch] if isinstance(branch, str) else list(branch)
+            where.append(f"branch_code IN ({', '.join('?' * len(branches))})")
+            params.extend(branches)
+        if user:
+            where.append("created_by = ?")
+            params.append(user)
+        if date_from is not None:
+            where.append("created_date >= ?")
+            params.append(pd.Timestamp(date_from).strftime("%Y-%m-%d %H:%M:%S"))
+        if date_to is not None:
+            end = pd.Timestamp(date_to)
+            if end == end.normalize():
+                end += pd.Timedelta(days=1)
+            where.append("created_date < ?")
+            params.append(end.strftime("%Y-%m-%d %H:%M:%S"))
+        if barcode_prefix:
+            # Range scan on the barcode index rather than LIKE
+            where.append("barcode >= ? AND barcode < ?")
+            params.extend([barcode_prefix, barcode_prefix + '\uffff'])
+        where_sql = f"WHERE {' AND '.join(where)}" if where else ""
+
+        conn = _connect()
+        total = conn.execute(f"SELECT COUNT(*) FROM scans {where_sql}", params).fetchone()[0]
+        df = pd.read_sql_query(
+            f"SELECT scan_id, barcode, created_by, branch_code, created_date FROM scans {where_sql} "
+            f"ORDER BY {sort_by} {'ASC' if ascending else 'DESC'} LIMIT ? OFFSET ?",
+            conn, params=params + [page_size, max(page - 1, 0) * page_size])
+        df['created_date'] = pd.to_datetime(df['created_date'], format="%Y-%m-%d %H:%M:%S", errors='coerce')
+        metrics.record_rows('read', len(df), 'sqlite.scans')
+        return df, total, None
+    except Exception as e:
+        return None, 0, str(e)
+
+def delete_scans(scan_ids):
+    """Returns (results, error); see db.delete_scans."""
+    try:
+        scan_ids = [int(i) for i in scan_ids]
+        conn = _connect()
+        existing = set()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for start in range(0, len(scan_ids), 500):
+                chunk = scan_ids[start:start + 500]
+                placeholders = ", ".join("?" * len(chunk))
+                existing.update(row[0] for row in conn.execute(
+                    f"SELECT scan_id FROM scans WHERE scan_id IN ({placeholders})", chunk))
+                conn.execute(f"DELETE FROM scans WHERE scan_id IN ({placeholders})", chunk)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        results = []
+        for scan_id in scan_ids:
+            status = 'deleted' if scan_id in existing else 'not_found'
+            existing.discard(scan_id)
+            results.append({'scan_id': scan_id, 'status': status})
+        metrics.record_rows('written', sum(1 for r in results if r['status'] == 'deleted'), 'sqlite.scans')
+        return results, None
+    except Exception as e:
+        return None, str(e)
+
+def delete_scan(scan_id):
+    results, err = delete_scans([scan_id])
+    if err:
+        return False, err
+    if results[0]['status'] != 'deleted':
+        return False, "ID not found"
+    return True, "Deleted successfully"
+
+def compact_scans():
+    try:
+        conn = _connect()
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.execute("VACUUM")
+        return True, "Checkpointed WAL and vacuumed database."
+    except Exception as e:
+        return False, str(e)
+
+def _rebuild_counts_sql():
+    statements = ["DELETE FROM scan_counts"]
+    for dim, branch, key in COUNT_DIMENSIONS:
+        branch_sql, key_sql = branch.format(r='scans'), key.format(r='scans')
+        statements.append(
+            f"INSERT INTO scan_counts (dim, branch, key, n) SELECT '{dim}', IFNULL({branch_sql}, ''), "
+            f"IFNULL({key_sql}, ''), COUNT(*) FROM scans GROUP BY 2, 3 HAVING COUNT(*) > 0")
+    return statements
+
+def rebuild_scan_counts():
+    try:
+        conn = _connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for statement in _rebuild_counts_sql():
+                conn.execute(statement)
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('scan_counts_built', ?)",
+                         (datetime.now().strftime("%Y-%m-%d %H:%M:%S"),))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        total = conn.execute("SELECT n FROM scan_counts WHERE dim = 'total'").fetchone()
+        return True, f"Rebuilt counts for {total[0] if total else 0} scans."
+    except Exception as e:
+        return False, str(e)
+
+def get_scan_counts(branch=None):
+    """Returns (counts, error); see db.get_scan_counts."""
+    import aggregates
+    try:
+        counts = aggregates.empty_counts()
+        if branch:
+            rows = _connect().execute(
+                "SELECT dim, branch, key, n FROM scan_counts WHERE branch = ?", (branch,)).fetchall()
+        else:
+            rows = _connect().execute("SELECT dim, branch, key, n FROM scan_counts").fetchall()
+        for dim, row_branch, key, n in rows:
+            if dim == 'total':
+                counts['total'] = n
+            elif dim == 'branch':
+                counts['by_branch'][row_branch] = n
+            elif dim in ('user', 'day'):
+                counts[f'by_{dim}'][key] = n
+            else:
+                counts[f'by_{dim}'].setdefault(row_branch, {})[key] = n
+        if branch:
+            counts = aggregates.for_branch(counts, branch)
+        return counts, None
+    except Exception as e:
+        return None, str(e)
@@ -0,0 +1,76 @@
+"""
+Bounded LRU of decode results keyed by a hash of the photo bytes.
+
+Streamlit reruns main_app on every widget interaction while st.camera_input
+still holds the last photo; with this cache those reruns reuse the earlier
+result instead of running imdecode + pyzbar + OpenCV again.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_TTL_SECONDS = 15 * 60
+
+def image_key(image_bytes):
+    return hashlib.blake2b(image_bytes, digest_size=20).hexdigest()
+
+class DecodeCache:
+    """Thread-safe LRU with size and TTL eviction, shared across sessions."""
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # key -> (stored_at, result)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] > self.ttl_seconds:
+                del self._entries[key]
+                self.evictions += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, result):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_decode(self, image_bytes, decode_fn, variant=''):
+        """
+        Returns the cached result for these bytes, or calls decode_fn(image_bytes)
+        and caches what it returns. `variant` separates results of different decode
+        modes for the same photo (e.g. 'multi'). Results are shared, so treat them
+        as read-only.
+        """
+        key = image_key(image_bytes) + variant
+        result = self.get(key)
+        if result is None:
+            result = decode_fn(image_bytes)
+            if not getattr(result, 'retryable', False):
+                self.put(key, result)
+        return result
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
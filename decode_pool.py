@@ -0,0 +1,288 @@
+"""
+Process pool for photo decodes, shared by every Streamlit session.
+
+imdecode + pyzbar + OpenCV are CPU-bound and partly hold the GIL, so decodes
+run in worker processes (each with its own DecoderEngine) instead of on the
+session's script thread, and throughput scales with the cores on the host.
+
+  - Sessions submit image bytes and get a Future of a DecodeResult.
+  - Jobs wait in a bounded queue; when it is full, submit() blocks for up
+    to submit_timeout and then answers "busy" instead of queueing more work
+    than the workers can finish (backpressure).
+  - A job running longer than job_timeout has its worker killed and
+    replaced; the job answers with a timeout result.
+  - Queue depth, busy workers, timeouts and restarts go to metrics.py.
+
+Busy and timeout results have retryable=True so DecodeCache does not keep them.
+
+Usage (benchmark against a photo):
+    python decode_pool.py photo.jpg --jobs 200 --workers 4
+"""
+import multiprocessing
+import multiprocessing.connection
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future
+
+import metrics
+
+def _usable_cpus():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+DEFAULT_WORKERS = int(os.environ.get('DECODE_WORKERS', '0')) or _usable_cpus()
+DEFAULT_MAX_QUEUE = int(os.environ.get('DECODE_QUEUE_SIZE', '64'))
+DEFAULT_JOB_TIMEOUT = float(os.environ.get('DECODE_JOB_TIMEOUT', '10'))
+DEFAULT_SUBMIT_TIMEOUT = 2.0
+# 'spawn' keeps the children clear of the server's threads and locks
+START_METHOD = os.environ.get('DECODE_START_METHOD', 'spawn')
+
+def _worker_main(conn, engine_options):
+    import cv2
+    import decoder
+    # Parallelism comes from the processes; OpenCV's own threads would oversubscribe
+    cv2.setNumThreads(1)
+    engine = decoder.DecoderEngine(**engine_options)
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            break
+        if job is None:
+            break
+        job_id, image_bytes, multi = job
+        try:
+            result = engine.decode(image_bytes, multi=multi)
+        except Exception as e:
+            result = decoder.DecodeResult()
+            result.debug.append(f"Decode error: {e}")
+        conn.send((job_id, result))
+
+def _failed_result(message):
+    import decoder
+    result = decoder.DecodeResult()
+    result.debug.append(message)
+    result.retryable = True
+    return result
+
+class _Worker:
+    def __init__(self, ctx, engine_options):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn, engine_options),
+                                   name="decode-worker", daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.job = None       # (job_id, future) while busy
+        self.deadline = None
+
+    def kill(self):
+        self.process.kill()
+        self.process.join(1)
+        self.conn.close()
+
+class DecodePool:
+    """engine_options: keyword arguments for each worker's DecoderEngine (ladder, budget_ms, ...)."""
+    def __init__(self, workers=DEFAULT_WORKERS, max_queue=DEFAULT_MAX_QUEUE,
+                 job_timeout=DEFAULT_JOB_TIMEOUT, start_method=START_METHOD, engine_options=None):
+        self.job_timeout = job_timeout
+        self._engine_options = dict(engine_options or {})
+        self._ctx = multiprocessing.get_context(start_method)
+        self._pending = queue.Queue(maxsize=max_queue)
+        self._wake_r, self._wake_w = self._ctx.Pipe(duplex=False)
+        self._wake_lock = threading.Lock()
+        self._workers = [_Worker(self._ctx, self._engine_options) for _ in range(max(1, workers))]
+        self._next_id = 0
+        self._closed = False
+        self.completed = 0
+        self.timeouts = 0
+        self.restarts = 0
+        self.rejected = 0
+        self._thread = threading.Thread(target=self._run, name="decode-pool", daemon=True)
+        self._thread.start()
+        metrics.set_gauge('decode_pool_workers', len(self._workers))
+
+    def submit(self, image_bytes, multi=False, submit_timeout=DEFAULT_SUBMIT_TIMEOUT):
+        """Returns a Future of a DecodeResult; never raises for a full queue."""
+        future = Future()
+        if self._closed:
+            future.set_result(_failed_result("Decoder pool is shut down"))
+            return future
+        try:
+            self._pending.put((bytes(image_bytes), multi, future), timeout=submit_timeout)
+        except queue.Full:
+            self.rejected += 1
+            metrics.inc('decode_pool_rejected_total')
+            future.set_result(_failed_result("Decoder is busy, please retake the photo"))
+            return future
+        metrics.set_gauge('decode_queue_depth', self._pending.qsize())
+        self._wake()
+        return future
+
+    def decode(self, image_bytes, multi=False):
+        """Blocking submit; waits at most for the queue plus one job timeout."""
+        future = self.submit(image_bytes, multi=multi)
+        try:
+            return future.result(timeout=DEFAULT_SUBMIT_TIMEOUT + self.job_timeout * 2 + 60)
+        except Exception as e:
+            return _failed_result(f"Decoder pool error: {e}")
+
+    def _wake(self):
+        with self._wake_lock:
+            self._wake_w.send_bytes(b'')
+
+    def _dispatch(self):
+        for worker in self._workers:
+            if worker.job is not None:
+                continue
+            try:
+                image_bytes, multi, future = self._pending.get_nowait()
+            except queue.Empty:
+                break
+            if not future.set_running_or_notify_cancel():
+                continue
+            self._next_id += 1
+            try:
+                worker.conn.send((self._next_id, image_bytes, multi))
+            except (OSError, ValueError) as e:
+                future.set_result(_failed_result(f"Decode worker unavailable: {e}"))
+                self._replace(worker)
+                continue
+            worker.job = (self._next_id, future)
+            worker.deadline = time.monotonic() + self.job_timeout
+
+    def _replace(self, worker):
+        worker.kill()
+        self._workers[self._workers.index(worker)] = _Worker(self._ctx, self._engine_options)
+        self.restarts += 1
+        metrics.inc('decode_pool_restarts_total')
+
+    def _finish(self, worker, result):
+        # The worker's own registry is not visible here; carry its timings over
+        for stage, ms in result.stage_timings:
+            metrics.observe('decode_stage_ms', ms, stage=stage)
+        for name, ms in result.timings:
+            if name != 'imdecode':
+                metrics.observe('decode_rung_ms', ms, strategy=name)
+        metrics.inc('decode_frames_total', outcome=result.strategy or 'not_found')
+        # Only now is the job released: if anything above raised, _run fails it
+        _, future = worker.job
+        worker.job, worker.deadline = None, None
+        self.completed += 1
+        future.set_result(result)
+
+    def _fail_busy(self, error):
+        # Whatever broke the result loop, the jobs in flight get an answer now
+        # instead of waiting out their timeout, and their workers are replaced
+        for worker in [w for w in self._workers if w.job is not None]:
+            _, future = worker.job
+            worker.job, worker.deadline = None, None
+            if not future.done():
+                future.set_result(_failed_result(f"Decoder pool error: {error}, please retake the photo"))
+            try:
+                self._replace(worker)
+            except Exception as e:
+                print(f"Decode worker restart failed: {e}")
+
+    def _run(self):
+        while not self._closed:
+            try:
+                self._poll()
+            except Exception as e:
+                metrics.inc('decode_pool_errors_total')
+                self._fail_busy(e)
+
+    def _poll(self):
+        self._dispatch()
+        busy = [w for w in self._workers if w.job is not None]
+        metrics.set_gauge('decode_pool_busy', len(busy))
+        metrics.set_gauge('decode_queue_depth', self._pending.qsize())
+        timeout = None
+        if busy:
+            timeout = max(0.0, min(w.deadline for w in busy) - time.monotonic())
+        ready = multiprocessing.connection.wait([self._wake_r] + [w.conn for w in busy], timeout)
+        for conn in ready:
+            if conn is self._wake_r:
+                while self._wake_r.poll():
+                    self._wake_r.recv_bytes()
+                continue
+            worker = next(w for w in busy if w.conn is conn)
+            try:
+                job_id, result = conn.recv()
+            except (EOFError, OSError):
+                # Worker died mid-job (segfault in a native decoder, OOM kill)
+                _, future = worker.job
+                future.set_result(_failed_result("Decode worker crashed, please retake the photo"))
+                self._replace(worker)
+                continue
+            self._finish(worker, result)
+
+        now = time.monotonic()
+        for worker in [w for w in self._workers if w.job is not None and w.deadline <= now]:
+            _, future = worker.job
+            self.timeouts += 1
+            metrics.inc('decode_pool_timeouts_total')
+            future.set_result(_failed_result(
+                f"Decode timed out after {self.job_timeout:.0f} s, please retake the photo"))
+            self._replace(worker)
+
+    def stats(self):
+        return {
+            'workers': len(self._workers),
+            'busy': sum(1 for w in self._workers if w.job is not None),
+            'queued': self._pending.qsize(),
+            'completed': self.completed,
+            'timeouts': self.timeouts,
+            'restarts': self.restarts,
+            'rejected': self.rejected,
+        }
+
+    def shutdown(self):
+        self._closed = True
+        self._wake()
+        self._thread.join(5)
+        while True:
+            try:
+                _, _, future = self._pending.get_nowait()
+            except queue.Empty:
+                break
+            future.set_result(_failed_result("Decoder pool is shut down"))
+        for worker in self._workers:
+            try:
+                worker.conn.send(None)
+            except (OSError, ValueError):
+                pass
+            worker.process.join(1)
+            if worker.process.is_alive():
+                worker.kill()
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Decode one photo many times through the pool.")
+    parser.add_argument('photo')
+    parser.add_argument('--jobs', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('--multi', action='store_true')
+    args = parser.parse_args(argv)
+
+    with open(args.photo, 'rb') as f:
+        image_bytes = f.read()
+    pool = DecodePool(workers=args.workers, max_queue=args.jobs)
+    pool.decode(image_bytes, multi=args.multi)  # wait for the workers to start
+    started = time.perf_counter()
+    futures = [pool.submit(image_bytes, multi=args.multi) for _ in range(args.jobs)]
+    results = [f.result() for f in futures]
+    elapsed = time.perf_counter() - started
+    found = sum(1 for r in results if r.data)
+    print(f"{args.jobs} decodes in {elapsed:.2f} s ({args.jobs / elapsed:.1f}/s), "
+          f"{found} found, {args.workers} workers")
+    print(pool.stats())
+    pool.shutdown()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
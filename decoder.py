@@ -0,0 +1,293 @@
+"""
+Barcode/QR decoder engine used by the camera scan path.
+
+The engine keeps its detectors initialised between calls and walks a ladder
+of cheap-to-expensive strategies (downscale, full-res grayscale, centre crop,
+adaptive threshold, rotation, colour OpenCV). Each rung tries pyzbar first
+(1D barcodes) and OpenCV's QR detector second. Decoding stops at the first
+rung that finds a code (multi mode keeps going and merges what every rung
+reads) or once the per-frame latency budget is spent; a rung whose cost,
+estimated from the pixels it would process, would overshoot the budget is
+skipped rather than started. The engine remembers what each rung cost per
+pixel on earlier frames, since some (adaptive threshold on a crowded shelf)
+cost far more than their size suggests. The result records which rung won
+and how long every rung took.
+Per-stage latencies (imdecode, cvtColor, pyzbar, QRCodeDetector) and rung
+timings also go to the process metrics registry (metrics.py), and are kept on
+the result so decode_pool can record them in the parent process.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import cv2
+import numpy as np
+
+import metrics
+
+DEFAULT_BUDGET_MS = float(os.environ.get('DECODE_BUDGET_MS', '250'))
+# Phone photos are often 12MP+; barcodes are still readable at this size
+DEFAULT_MAX_SIDE = 1280
+DEFAULT_ROI_FRACTION = 0.6
+# A skipped rung's learned cost shrinks by this much, so it is retried now and then
+RATE_DECAY = 0.9
+
+DEFAULT_LADDER = (
+    'downscale',
+    'gray_full',
+    'roi_center',
+    'adaptive_threshold',
+    'rotate',
+    'color_opencv',
+)
+
+class DecodeResult:
+    def __init__(self):
+        self.codes = []      # list of (data, symbology), in the order found
+        self.strategy = None # ladder rung that produced the codes
+        self.timings = []    # list of (stage, ms): imdecode and one per rung
+        self.stage_timings = [] # list of (stage, ms): imdecode, cvtColor, pyzbar, QRCodeDetector
+        self.debug = []
+        self.budget_exhausted = False
+        self.retryable = False # pool busy / timed out: worth retrying, not caching
+
+    @property
+    def data(self):
+        return self.codes[0][0] if self.codes else None
+
+    @property
+    def symbology(self):
+        return self.codes[0][1] if self.codes else None
+
+    @property
+    def total_ms(self):
+        return sum(ms for _, ms in self.timings)
+
+def _resize_max_side(img, max_side):
+    h, w = img.shape[:2]
+    scale = max_side / float(max(h, w))
+    if scale >= 1:
+        return img
+    return cv2.resize(img, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+
+@contextmanager
+def _stage(result, stage):
+    # metrics.timer that also keeps the timing on the result
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        ms = (time.perf_counter() - t0) * 1000
+        metrics.observe('decode_stage_ms', ms, stage=stage)
+        result.stage_timings.append((stage, ms))
+
+def _to_gray(img, result):
+    if img.ndim == 2:
+        return img
+    with _stage(result, 'cvtColor'):
+        return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+class DecoderEngine:
+    """
+    Reusable decoder; create one per process (main.py keeps it in st.cache_resource).
+    Safe to share between sessions: OpenCV detectors are kept per thread.
+    """
+    def __init__(self, ladder=DEFAULT_LADDER, budget_ms=DEFAULT_BUDGET_MS,
+                 max_side=DEFAULT_MAX_SIDE, roi_fraction=DEFAULT_ROI_FRACTION):
+        self.ladder = tuple(ladder)
+        self.budget_ms = budget_ms
+        self.max_side = max_side
+        self.roi_fraction = roi_fraction
+        self._local = threading.local()
+        self._rates = {}  # (rung, multi) -> ms per pixel on earlier frames
+        self._rates_lock = threading.Lock()
+        try:
+            from pyzbar.pyzbar import decode as pyzbar_decode
+            self._pyzbar = pyzbar_decode
+        except ImportError:
+            self._pyzbar = None
+
+    def _qr_detector(self):
+        detector = getattr(self._local, 'qr', None)
+        if detector is None:
+            detector = self._local.qr = cv2.QRCodeDetector()
+        return detector
+
+    def _rung_pixels(self, name, img):
+        # How many pixels a rung hands to the decoders; their cost grows with it
+        h, w = img.shape[:2]
+        if name in ('gray_full', 'color_opencv'):
+            return h * w
+        if name == 'roi_center':
+            return h * w * self.roi_fraction ** 2
+        scale = min(1.0, self.max_side / float(max(h, w)))
+        return h * w * scale * scale
+
+    def _learned_rate(self, name, multi):
+        with self._rates_lock:
+            return self._rates.get((name, multi), 0.0)
+
+    def _learn_rate(self, name, multi, rate=None):
+        # rate=None: the rung was skipped, so its learned cost decays
+        with self._rates_lock:
+            learned = self._rates.get((name, multi), 0.0)
+            if rate is None:
+                self._rates[(name, multi)] = learned * RATE_DECAY
+            else:
+                self._rates[(name, multi)] = rate if not learned else (learned + rate) / 2
+
+    # Each strategy maps the decoded BGR image to the image the decoders should see
+    def _prepare(self, name, img, cache, result):
+        if name == 'downscale':
+            small = _resize_max_side(img, self.max_side)
+            cache['small_gray'] = _to_gray(small, result)
+            return cache['small_gray']
+        if name == 'gray_full':
+            return _to_gray(img, result)
+        if name == 'roi_center':
+            h, w = img.shape[:2]
+            dh, dw = int(h * (1 - self.roi_fraction) / 2), int(w * (1 - self.roi_fraction) / 2)
+            return _to_gray(img[dh:h - dh, dw:w - dw], result)
+        if name == 'adaptive_threshold':
+            gray = cache.get('small_gray')
+            if gray is None:
+                gray = _to_gray(_resize_max_side(img, self.max_side), result)
+            return cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                         cv2.THRESH_BINARY, 31, 10)
+        if name == 'rotate':
+            gray = cache.get('small_gray')
+            if gray is None:
+                gray = _to_gray(_resize_max_side(img, self.max_side), result)
+            return cv2.rotate(gray, cv2.ROTATE_90_CLOCKWISE)
+        if name == 'color_opencv':
+            # OpenCV sometimes likes the colour image better than gray
+            return img
+        raise ValueError(f"Unknown decode strategy: {name}")
+
+    def _run_decoders(self, name, img, result, multi):
+        codes = []
+        if self._pyzbar is not None and name != 'color_opencv':
+            try:
+                with _stage(result, 'pyzbar'):
+                    found = self._pyzbar(img)
+                for obj in found:
+                    codes.append((obj.data.decode("utf-8"), obj.type))
+            except Exception as e:
+                result.debug.append(f"{name}: Pyzbar Error: {e}")
+            if codes and not multi:
+                return codes[:1]
+
+        try:
+            with _stage(result, 'QRCodeDetector'):
+                if multi:
+                    ok, values, _, _ = self._qr_detector().detectAndDecodeMulti(img)
+                    if ok:
+                        codes.extend((val, 'QRCODE') for val in values if val)
+                else:
+                    val, _, _ = self._qr_detector().detectAndDecode(img)
+                    if val:
+                        codes.append((val, 'QRCODE'))
+        except cv2.error as e:
+            result.debug.append(f"{name}: CV2 Error: {e}")
+
+        # The same label can be read by both decoders; keep the first reading
+        distinct = {}
+        for data, symbology in codes:
+            distinct.setdefault(data, symbology)
+        return list(distinct.items())
+
+    def _run_rung(self, name, img, cache, result, multi):
+        t0 = time.perf_counter()
+        try:
+            codes = self._run_decoders(name, self._prepare(name, img, cache, result), result, multi)
+        except cv2.error as e:
+            codes = []
+            result.debug.append(f"{name}: CV2 Error: {e}")
+        rung_ms = (time.perf_counter() - t0) * 1000
+        self._learn_rate(name, multi, rung_ms / max(self._rung_pixels(name, img), 1))
+        result.timings.append((name, rung_ms))
+        metrics.observe('decode_rung_ms', rung_ms, strategy=name)
+        return codes, rung_ms
+
+    def warm_up(self, img, multi=False):
+        """
+        Runs every rung that works on the downscaled image once, without a budget,
+        so cost estimates start from real timings instead of from the first frames
+        someone waits on. Full-resolution rungs are left out (seconds on a 12MP
+        photo). Returns the DecodeResult of the run.
+        """
+        result = DecodeResult()
+        cache = {}
+        reduced = self._rung_pixels('downscale', img)
+        for name in self.ladder:
+            if self._rung_pixels(name, img) <= reduced:
+                self._run_rung(name, img, cache, result, multi)
+        return result
+
+    def decode_image(self, img, result=None, multi=False):
+        """
+        Runs the strategy ladder on an already-decoded BGR (or gray) image.
+        With multi=True every distinct code in the frame is returned (shelf and
+        pallet photos): both decoders run on every rung the budget allows and
+        the codes are merged (by data and symbology); strategy is the first
+        rung that found one.
+        """
+        result = result or DecodeResult()
+        if self._pyzbar is None:
+            result.debug.append("Pyzbar: Library not installed")
+
+        started = time.perf_counter()
+        cache = {}
+        ms_per_pixel = 0.0  # slowest rate seen so far in this call
+        for rung, name in enumerate(self.ladder):
+            pixels = self._rung_pixels(name, img)
+            # The first rung always runs; later ones only while budget remains
+            spent_ms = (time.perf_counter() - started) * 1000
+            if rung and self.budget_ms is not None:
+                if spent_ms >= self.budget_ms:
+                    result.budget_exhausted = True
+                    result.debug.append(f"Budget of {self.budget_ms:.0f} ms used up before '{name}'")
+                    break
+                # A full-resolution rung on a 12MP photo can take seconds once started
+                estimate_ms = max(ms_per_pixel, self._learned_rate(name, multi)) * pixels
+                if spent_ms + estimate_ms > self.budget_ms:
+                    result.budget_exhausted = True
+                    result.debug.append(f"{name}: skipped, ~{estimate_ms:.0f} ms would overrun the budget")
+                    self._learn_rate(name, multi)
+                    continue
+
+            codes, rung_ms = self._run_rung(name, img, cache, result, multi)
+            ms_per_pixel = max(ms_per_pixel, rung_ms / max(pixels, 1))
+
+            if multi:
+                # Small labels only show up at full resolution, so keep climbing the
+                # ladder and collect what each rung adds until the budget runs out
+                new_codes = [c for c in codes if c not in result.codes]
+                if new_codes:
+                    result.codes.extend(new_codes)
+                    result.strategy = result.strategy or name
+                else:
+                    result.debug.append(f"{name}: No new code found")
+                continue
+            if codes:
+                result.codes = codes
+                result.strategy = name
+                break
+            result.debug.append(f"{name}: No code found")
+        metrics.inc('decode_frames_total', outcome=result.strategy or 'not_found')
+        return result
+
+    def decode(self, image_bytes, multi=False):
+        """Decodes encoded image bytes (JPEG/PNG from st.camera_input)."""
+        result = DecodeResult()
+        t0 = time.perf_counter()
+        img = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+        imdecode_ms = (time.perf_counter() - t0) * 1000
+        result.timings.append(('imdecode', imdecode_ms))
+        result.stage_timings.append(('imdecode', imdecode_ms))
+        metrics.observe('decode_stage_ms', imdecode_ms, stage='imdecode')
+        if img is None:
+            result.debug.append("Could not decode image data")
+            return result
+        return self.decode_image(img, result, multi=multi)
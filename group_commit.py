@@ -0,0 +1,121 @@
+"""
+Group-commit writer for scan batches.
+
+Every "Submit All to Database" goes through one background thread instead of
+each session doing its own write. Whatever has queued up while the previous
+commit was running is merged into a single db.insert_scan_batch_results call,
+so N concurrent submits cost one duplicate pass and one write instead of N.
+"""
+import queue
+import threading
+from concurrent.futures import Future
+
+import db
+
+# Status for a barcode that another session submitted in the same group commit
+DUPLICATE_CONCURRENT = 'duplicate_concurrent'
+
+class GroupCommitWriter:
+    """
+    Shared writer; create one per process (main.py keeps it in st.cache_resource).
+
+    submit() returns a Future resolving to (results, error), where results has
+    one dict per submitted scan: {'barcode', 'status', 'scan_id'} and status is
+    'inserted', 'duplicate_db', 'duplicate_batch' (repeated within the caller's
+    own batch) or 'duplicate_concurrent' (another session's batch got it first).
+    """
+    def __init__(self, max_rows=5000, linger=0.005):
+        self.max_rows = max_rows
+        # Short wait after the first batch arrives so near-simultaneous submits share a commit
+        self.linger = linger
+        self._queue = queue.Queue()
+        self._closed = False
+        self.commits = 0
+        self.batches = 0
+        self._thread = threading.Thread(target=self._run, name="scan-group-commit", daemon=True)
+        self._thread.start()
+
+    def submit(self, scans):
+        future = Future()
+        if self._closed:
+            future.set_result((None, "Writer is closed"))
+            return future
+        if not scans:
+            future.set_result(([], None))
+            return future
+        self._queue.put((list(scans), future))
+        return future
+
+    def insert(self, scans, timeout=None):
+        """Blocking convenience wrapper around submit()."""
+        return self.submit(scans).result(timeout)
+
+    def close(self):
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+
+    def _collect(self, first):
+        jobs = [first]
+        rows = len(first[0])
+        try:
+            item = self._queue.get(timeout=self.linger)
+            while item is not None:
+                jobs.append(item)
+                rows += len(item[0])
+                if rows >= self.max_rows:
+                    break
+                item = self._queue.get_nowait()
+            if item is None:
+                self._queue.put(None)  # re-post the shutdown marker for _run
+        except queue.Empty:
+            pass
+        return jobs
+
+    def _commit(self, jobs):
+        combined, owners = [], []
+        for job_no, (scans, _) in enumerate(jobs):
+            combined.extend(scans)
+            owners.extend([job_no] * len(scans))
+
+        results, err = db.insert_scan_batch_results(combined)
+        self.commits += 1
+        self.batches += len(jobs)
+        if err:
+            for _, future in jobs:
+                future.set_result((None, err))
+            return
+
+        # The backend reports every repeat as 'duplicate_batch'; tell callers whether
+        # the first copy was theirs or came from another session's batch.
+        first_owner = {}
+        per_job = [[] for _ in jobs]
+        for owner, result in zip(owners, results):
+            if result['status'] == 'inserted':
+                first_owner[result['barcode']] = owner
+            elif result['status'] == 'duplicate_batch' and first_owner.get(result['barcode'], owner) != owner:
+                result = dict(result, status=DUPLICATE_CONCURRENT)
+            per_job[owner].append(result)
+
+        for (_, future), job_results in zip(jobs, per_job):
+            future.set_result((job_results, None))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            jobs = self._collect(item)
+            try:
+                self._commit(jobs)
+            except Exception as e:
+                for _, future in jobs:
+                    if not future.done():
+                        future.set_result((None, str(e)))
+
+def summarize(results):
+    """Counts per status, e.g. {'inserted': 10, 'duplicate_db': 2}."""
+    counts = {}
+    for result in results:
+        counts[result['status']] = counts.get(result['status'], 0) + 1
+    return counts
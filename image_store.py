@@ -0,0 +1,157 @@
+"""
+Background store for scanned photos.
+
+Photos are content-addressed (sha256 of the bytes) and sharded by branch and
+date:
+
+    scanned_images/<branch>/<YYYY-MM-DD>/<sha256[:2]>/<sha256>.jpg
+
+save() only hashes the bytes and queues the write, so the scan is
+acknowledged without waiting on disk. Once scans are submitted, link()
+records scan_id -> image path in scanned_images/manifest.csv.
+"""
+import csv
+import hashlib
+import os
+import queue
+import re
+import threading
+from collections import deque
+from datetime import datetime
+
+import metrics
+
+IMAGES_DIR = 'scanned_images'
+MANIFEST_NAME = 'manifest.csv'
+MANIFEST_COLUMNS = ['scan_id', 'barcode', 'branch_code', 'image_path', 'created_date']
+# Set e.g. THUMBNAIL_SIDE=640 to also keep a small re-encoded copy of each photo
+THUMBNAIL_SIDE = int(os.environ.get('THUMBNAIL_SIDE', '0')) or None
+
+def _safe_component(value):
+    # Branch codes end up in paths; keep them to a boring character set
+    return re.sub(r'[^A-Za-z0-9_-]', '_', str(value or 'unknown'))
+
+class ImageStore:
+    def __init__(self, root=IMAGES_DIR, max_queue=256, thumbnail_side=THUMBNAIL_SIDE):
+        self.root = root
+        self.thumbnail_side = thumbnail_side
+        self.manifest_path = os.path.join(root, MANIFEST_NAME)
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._known_dirs = set()
+        self.written = 0
+        self.deduplicated = 0
+        self.overflow = 0
+        self.errors = deque(maxlen=100)
+        self._manifest_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="image-store", daemon=True)
+        self._thread.start()
+
+    def path_for(self, image_bytes, branch, when=None):
+        digest = hashlib.sha256(image_bytes).hexdigest()
+        day = (when or datetime.now()).strftime("%Y-%m-%d")
+        return os.path.join(self.root, _safe_component(branch), day, digest[:2], f"{digest}.jpg")
+
+    def save(self, image_bytes, branch):
+        """
+        Queues a photo for writing and returns the path it will have.
+        If the queue is full the write happens inline rather than dropping the photo.
+        """
+        path = self.path_for(image_bytes, branch)
+        try:
+            self._queue.put_nowait(('image', path, image_bytes))
+        except queue.Full:
+            self.overflow += 1
+            metrics.inc('image_queue_overflow_total')
+            self._write_image(path, image_bytes)
+        return path
+
+    def link(self, links):
+        """links: list of dicts {'scan_id', 'barcode', 'branch_code', 'image_path'}"""
+        if not links:
+            return
+        created = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        rows = [dict(link, created_date=created) for link in links]
+        try:
+            self._queue.put_nowait(('manifest', None, rows))
+        except queue.Full:
+            self.overflow += 1
+            self._write_manifest(rows)
+
+    def flush(self):
+        """Blocks until everything queued so far is on disk."""
+        self._queue.join()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def stats(self):
+        return {
+            'queued': self._queue.qsize(),
+            'written': self.written,
+            'deduplicated': self.deduplicated,
+            'overflow': self.overflow,
+            'errors': len(self.errors),
+        }
+
+    def _ensure_dir(self, directory):
+        if directory not in self._known_dirs:
+            os.makedirs(directory, exist_ok=True)
+            self._known_dirs.add(directory)
+
+    def _write_image(self, path, image_bytes):
+        if os.path.exists(path):
+            # Same bytes already stored (content-addressed)
+            self.deduplicated += 1
+            return
+        with metrics.timer('image_write_ms'):
+            self._ensure_dir(os.path.dirname(path))
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(image_bytes)
+            os.replace(tmp_path, path)
+        self.written += 1
+        metrics.inc('image_bytes_written_total', len(image_bytes))
+        if self.thumbnail_side:
+            self._write_thumbnail(path, image_bytes)
+
+    def _write_thumbnail(self, path, image_bytes):
+        import cv2
+        import numpy as np
+        img = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+        if img is None:
+            return
+        h, w = img.shape[:2]
+        scale = self.thumbnail_side / float(max(h, w))
+        if scale < 1:
+            img = cv2.resize(img, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+        ok, buf = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 80])
+        if ok:
+            with open(path[:-len('.jpg')] + '.thumb.jpg', 'wb') as f:
+                f.write(buf.tobytes())
+
+    def _write_manifest(self, rows):
+        self._ensure_dir(self.root)
+        with self._manifest_lock:
+            new_file = not os.path.exists(self.manifest_path)
+            with open(self.manifest_path, 'a', newline='', encoding='utf-8') as f:
+                writer = csv.DictWriter(f, fieldnames=MANIFEST_COLUMNS, extrasaction='ignore')
+                if new_file:
+                    writer.writeheader()
+                writer.writerows(rows)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    break
+                kind, path, payload = item
+                if kind == 'image':
+                    self._write_image(path, payload)
+                else:
+                    self._write_manifest(payload)
+            except Exception as e:
+                self.errors.append(str(e))
+            finally:
+                self._queue.task_done()
@@ -0,0 +1,259 @@
+"""
+Headless ingest API for handheld scanners, run next to the Streamlit app.
+
+A minimal asyncio HTTP/1.1 server (keep-alive, no framework) so a scan
+costs one small request instead of a full Streamlit rerun:
+
+    POST /scans     {"branch": "BARM", "barcodes": ["...", ...]}
+                    or {"branch": "BARM", "barcode": "..."}
+                    or text/plain, one barcode per line, with ?branch=BARM
+    GET  /health
+    GET  /metrics   Prometheus text (see metrics.py)
+
+Requests other than /health authenticate with HTTP Basic against
+db.validate_db_user and may only post to branches the user has. Every request's barcodes go to the
+shared group-commit writer, so concurrent requests from many scanners are
+merged into one duplicate check and one write. The response lists a result
+per barcode in request order:
+
+    {"results": [{"barcode": "...", "status": "inserted", "scan_id": 42}, ...],
+     "summary": {"inserted": 1}}
+
+It listens on localhost unless told otherwise (--host / INGEST_HOST);
+scanners on the shop network need --host 0.0.0.0.
+
+Usage:
+    python ingest_api.py --port 8502
+    python ingest_api.py --host 0.0.0.0 --port 8502
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import sys
+from urllib.parse import parse_qs, urlsplit
+
+import db
+import group_commit
+import metrics
+
+DEFAULT_HOST = os.environ.get('INGEST_HOST', '127.0.0.1')
+DEFAULT_PORT = int(os.environ.get('INGEST_PORT', '8502'))
+MAX_BODY_BYTES = 1024 * 1024
+MAX_BARCODES = 5000
+KEEPALIVE_TIMEOUT = 30
+MAX_HEADER_BYTES = 16 * 1024
+
+REASONS = {200: 'OK', 400: 'Bad Request', 401: 'Unauthorized', 403: 'Forbidden', 404: 'Not Found',
+           405: 'Method Not Allowed', 408: 'Request Timeout', 411: 'Length Required',
+           413: 'Payload Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+class HttpError(Exception):
+    def __init__(self, status, message, headers=()):
+        super().__init__(message)
+        self.status = status
+        self.headers = list(headers)
+
+class Request:
+    def __init__(self, method, target, version, headers, body):
+        self.method = method
+        parts = urlsplit(target)
+        self.path = parts.path
+        self.query = {k: v[-1] for k, v in parse_qs(parts.query).items()}
+        self.version = version
+        self.headers = headers
+        self.body = body
+
+    @property
+    def keep_alive(self):
+        connection = self.headers.get('connection', '').lower()
+        if self.version == 'HTTP/1.0':
+            return connection == 'keep-alive'
+        return connection != 'close'
+
+async def read_request(reader):
+    """Parses one request; returns None on a clean EOF between requests."""
+    try:
+        head = await reader.readuntil(b'\r\n\r\n')
+    except asyncio.IncompleteReadError as e:
+        if not e.partial:
+            return None
+        raise HttpError(400, "Incomplete request")
+    except asyncio.LimitOverrunError:
+        raise HttpError(413, "Headers too large")
+
+    lines = head.decode('latin-1').split('\r\n')
+    try:
+        method, target, version = lines[0].split(' ', 2)
+    except ValueError:
+        raise HttpError(400, "Malformed request line")
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+    if 'chunked' in headers.get('transfer-encoding', '').lower():
+        raise HttpError(411, "Chunked bodies are not supported; send Content-Length")
+    try:
+        length = int(headers.get('content-length', '0'))
+    except ValueError:
+        raise HttpError(400, "Bad Content-Length")
+    if length < 0:
+        raise HttpError(400, "Bad Content-Length")
+    if length > MAX_BODY_BYTES:
+        raise HttpError(413, f"Body larger than {MAX_BODY_BYTES} bytes")
+    body = await reader.readexactly(length) if length else b''
+    return Request(method, target, version, headers, body)
+
+def encode_response(status, payload, keep_alive, headers=(), content_type='application/json'):
+    body = payload if isinstance(payload, bytes) else json.dumps(payload).encode('utf-8')
+    lines = [f"HTTP/1.1 {status} {REASONS.get(status, '')}",
+             f"Content-Type: {content_type}",
+             f"Content-Length: {len(body)}",
+             f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+    lines.extend(f"{name}: {value}" for name, value in headers)
+    return ("\r\n".join(lines) + "\r\n\r\n").encode('latin-1') + body
+
+def parse_barcodes(request):
+    """Returns (branch, [barcodes]) from a JSON or text/plain body."""
+    content_type = request.headers.get('content-type', '').split(';')[0].strip().lower()
+    branch = request.query.get('branch')
+    if content_type == 'text/plain':
+        barcodes = request.body.decode('utf-8', errors='replace').splitlines()
+    else:
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            raise HttpError(400, "Body is not valid JSON")
+        if not isinstance(data, dict):
+            raise HttpError(400, "Expected a JSON object")
+        branch = data.get('branch', branch)
+        if 'barcodes' in data:
+            barcodes = data['barcodes']
+        elif 'barcode' in data:
+            barcodes = [data['barcode']]
+        else:
+            raise HttpError(400, "Expected 'barcode' or 'barcodes'")
+        if not isinstance(barcodes, list):
+            raise HttpError(400, "'barcodes' must be a list")
+    barcodes = [str(b).strip() for b in barcodes if b is not None and str(b).strip()]
+    if not branch:
+        raise HttpError(400, "Missing branch")
+    if not barcodes:
+        raise HttpError(400, "No barcodes")
+    if len(barcodes) > MAX_BARCODES:
+        raise HttpError(413, f"At most {MAX_BARCODES} barcodes per request")
+    return str(branch), barcodes
+
+class IngestServer:
+    def __init__(self, writer=None, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        self.writer = writer or group_commit.GroupCommitWriter()
+        self.host = host
+        self.port = port
+        self.server = None
+        self.requests = 0
+
+    def authenticate(self, request, cache):
+        header = request.headers.get('authorization', '')
+        if header in cache:
+            return cache[header]
+        challenge = [('WWW-Authenticate', 'Basic realm="stock-scan"')]
+        if not header.lower().startswith('basic '):
+            raise HttpError(401, "Basic authentication required", challenge)
+        try:
+            username, _, password = base64.b64decode(header[6:]).decode('utf-8').partition(':')
+        except (ValueError, UnicodeDecodeError):
+            raise HttpError(401, "Malformed credentials", challenge)
+        user, err = db.validate_db_user(username, password)
+        if err:
+            metrics.inc('ingest_auth_failures_total')
+            raise HttpError(401, err, challenge)
+        # Scanners send the same header on every request of a connection
+        cache.clear()
+        cache[header] = user
+        return user
+
+    async def post_scans(self, request, auth_cache):
+        user = self.authenticate(request, auth_cache)
+        branch, barcodes = parse_barcodes(request)
+        if branch not in user['branches']:
+            raise HttpError(403, f"User {user['username']} has no access to branch {branch}")
+        scans = [{'barcode': b, 'username': user['username'], 'branch': branch} for b in barcodes]
+        results, err = await asyncio.wrap_future(self.writer.submit(scans))
+        if err:
+            raise HttpError(503, err)
+        metrics.inc('ingest_barcodes_total', len(barcodes))
+        return 200, {'results': results, 'summary': group_commit.summarize(results)}
+
+    async def dispatch(self, request, auth_cache):
+        if request.path == '/scans':
+            if request.method != 'POST':
+                raise HttpError(405, "Use POST", [('Allow', 'POST')])
+            return await self.post_scans(request, auth_cache)
+        if request.path == '/health':
+            return 200, {'status': 'ok', 'commits': self.writer.commits, 'batches': self.writer.batches}
+        if request.path == '/metrics':
+            self.authenticate(request, auth_cache)
+            return 200, metrics.render_prometheus().encode('utf-8')
+        raise HttpError(404, f"No route for {request.path}")
+
+    async def handle(self, reader, writer):
+        auth_cache = {}
+        try:
+            while True:
+                keep_alive = False
+                try:
+                    request = await asyncio.wait_for(read_request(reader), KEEPALIVE_TIMEOUT)
+                    if request is None:
+                        break
+                    keep_alive = request.keep_alive
+                    with metrics.timer('ingest_request_ms', path=request.path):
+                        status, payload = await self.dispatch(request, auth_cache)
+                    content_type = 'text/plain; version=0.0.4' if isinstance(payload, bytes) \
+                        else 'application/json'
+                    writer.write(encode_response(status, payload, keep_alive, content_type=content_type))
+                except HttpError as e:
+                    metrics.inc('ingest_errors_total', status=e.status)
+                    writer.write(encode_response(e.status, {'error': str(e)}, keep_alive, e.headers))
+                except asyncio.TimeoutError:
+                    break
+                except Exception as e:
+                    metrics.inc('ingest_errors_total', status=500)
+                    writer.write(encode_response(500, {'error': str(e)}, False))
+                    keep_alive = False
+                self.requests += 1
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, self.host, self.port, limit=MAX_HEADER_BYTES)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.server
+
+    async def serve_forever(self):
+        await self.start()
+        print(f"Ingest API listening on {self.host}:{self.port}")
+        async with self.server:
+            await self.server.serve_forever()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless scan ingest API")
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    args = parser.parse_args(argv)
+    db.init_db()
+    try:
+        asyncio.run(IngestServer(host=args.host, port=args.port).serve_forever())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
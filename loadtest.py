@@ -0,0 +1,491 @@
+"""
+Load test: many concurrent stock-taking sessions against the storage and decode layers.
+
+Each simulated session replays what main_app does for one clerk by calling
+the db, group_commit and decoder functions main.py calls, directly; neither
+main.py nor Streamlit is run:
+
+    login          db.validate_db_user
+    branch_select  db.user_has_branch
+    manual_entry   db.check_duplicate_barcode
+    camera_upload  decode of a synthetic QR photo + db.check_duplicate_barcode
+    submit         GroupCommitWriter.insert (the shared writer main.py uses)
+    progress       db.get_scan_counts for the session's branch
+    admin_view     db.query_scans + db.get_scan_counts (every --admin-every'th session)
+
+Sessions are threads, as Streamlit runs them; --processes spreads them over
+several server processes sharing the same files. It measures the layers that
+limit capacity (file locks, writes, decodes); Streamlit's script reruns,
+session state, websocket and rendering cost are not part of the numbers.
+
+Barcodes are unique per session, except that --contested of them are drawn
+from a small shared pool, so sessions race to insert the same battery. After
+the run the scans table is checked against what sessions were told:
+
+    lost        acknowledged as inserted but not in the table
+    duplicated  in the table more than once
+    phantom     in the table but never acknowledged
+    double_ack  acknowledged as inserted to more than one session
+
+Runs in a scratch directory seeded with users and --seed-rows scans; set
+DB_BACKEND / SCANS_STORAGE as usual to test another storage mode. Seeding
+rewrites users.csv, so a --workdir that already has files in it is refused
+unless --force is given (existing scans are then kept and added to).
+
+Usage:
+    python loadtest.py --sessions 50 --scans 20
+    python loadtest.py --sessions 200 --processes 4 --think-ms 300 --out loadtest.json
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import platform
+import queue
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+
+import numpy as np
+
+DRIVER = "db/group_commit/decoder functions called directly (not main.py, not Streamlit)"
+ACTIONS = ('login', 'branch_select', 'manual_entry', 'camera_upload', 'submit', 'progress', 'admin_view')
+IMAGE_SIZE = (640, 480)
+# How long a process waits at the start line for the others before giving up
+BARRIER_TIMEOUT = 600
+
+def percentiles(samples):
+    arr = np.asarray(samples, dtype=float) * 1000
+    if not len(arr):
+        return {'n': 0}
+    return {
+        'n': len(arr),
+        'p50_ms': round(float(np.percentile(arr, 50)), 2),
+        'p90_ms': round(float(np.percentile(arr, 90)), 2),
+        'p99_ms': round(float(np.percentile(arr, 99)), 2),
+        'max_ms': round(float(arr.max()), 2),
+    }
+
+class ResourceSampler:
+    """
+    Samples this process's RSS every interval. CPU comes from os.times() at the
+    ends and includes child processes (decode workers) that exited in between.
+    """
+    def __init__(self, interval=0.25):
+        self.interval = interval
+        self.rss_mb = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="loadtest-sampler", daemon=True)
+
+    @staticmethod
+    def current_rss_mb():
+        try:
+            with open('/proc/self/statm') as f:
+                return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+        except (OSError, ValueError):
+            import bench
+            return bench.peak_rss_mb()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.rss_mb.append(self.current_rss_mb())
+
+    def __enter__(self):
+        self._times = os.times()
+        self._started = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        end = os.times()
+        self.wall_s = time.perf_counter() - self._started
+        self.cpu_s = sum(e - s for e, s in zip(end[:4], self._times[:4]))
+
+    def report(self):
+        import bench
+        samples = self.rss_mb or [self.current_rss_mb()]
+        return {
+            'cpu_s': round(self.cpu_s, 2),
+            'cpu_pct': round(self.cpu_s / self.wall_s * 100, 1) if self.wall_s else None,
+            'avg_rss_mb': round(sum(samples) / len(samples), 1),
+            'peak_rss_mb': round(bench.peak_rss_mb(), 1),
+        }
+
+class Session:
+    def __init__(self, index, username, password, config, shared_codes, decode, writer):
+        self.index = index
+        self.username = username
+        self.password = password
+        self.config = config
+        self.shared_codes = shared_codes
+        self.decode = decode
+        self.writer = writer
+        self.latencies = defaultdict(list)
+        self.errors = Counter()
+        self.acknowledged = []  # barcodes this session was told were inserted
+        self.statuses = Counter()
+        rng = random.Random(config['seed'] * 100003 + index)
+        self.rng = rng
+        self.plan = []
+        for i in range(config['scans']):
+            if rng.random() < config['contested']:
+                code = rng.choice(shared_codes)
+            else:
+                code = f"{config['prefix']}-S{index:04d}-{i:04d}"
+            self.plan.append((code, rng.random() < config['camera_ratio']))
+        self.images = {}
+
+    def prepare_images(self):
+        # Rendered before the clock starts so the load generator does not compete with the server
+        import bench
+        rng = np.random.default_rng(self.index)
+        for code, camera in self.plan:
+            if camera and code not in self.images:
+                self.images[code], _ = bench.synthetic_image('qr', *IMAGE_SIZE, 8, rng, code)
+
+    def timed(self, action, fn, *args):
+        t0 = time.perf_counter()
+        try:
+            result = fn(*args)
+        except Exception as e:
+            self.latencies[action].append(time.perf_counter() - t0)
+            self.errors[f"{action}: {type(e).__name__}: {e}"] += 1
+            return None
+        self.latencies[action].append(time.perf_counter() - t0)
+        return result
+
+    def think(self):
+        if self.config['think_ms']:
+            time.sleep(self.rng.uniform(0.5, 1.5) * self.config['think_ms'] / 1000)
+
+    def run(self):
+        import db
+        user, err = self.timed('login', db.validate_db_user, self.username, self.password) or (None, 'no result')
+        if err:
+            self.errors[f"login: {err}"] += 1
+            return
+        branch = user['branches'][0]
+        has_branch, err = self.timed('branch_select', db.user_has_branch, self.username, branch) or (None, 'no result')
+        if err:
+            self.errors[f"branch_select: {err}"] += 1
+        elif not has_branch:
+            self.errors["branch_select: user lacks branch"] += 1
+        self.think()
+
+        pending = []
+        for code, camera in self.plan:
+            if camera:
+                result = self.timed('camera_upload', self._camera, code)
+                if result is None:
+                    continue
+            else:
+                result = self.timed('manual_entry', db.check_duplicate_barcode, code)
+            is_dup, err = result
+            if err:
+                self.errors[f"duplicate check: {err}"] += 1
+            elif not is_dup and code not in pending:
+                pending.append(code)
+            if len(pending) >= self.config['batch']:
+                self._submit(pending, branch)
+                pending = []
+            self.think()
+        if pending:
+            self._submit(pending, branch)
+
+        self.timed('progress', db.get_scan_counts, branch)
+        if self.config['admin_every'] and self.index % self.config['admin_every'] == 0:
+            self.timed('admin_view', self._admin_view)
+
+    def _camera(self, code):
+        import db
+        result = self.decode(self.images[code])
+        if result.data != code:
+            # A clerk would retake the photo; this scan is dropped
+            self.errors["camera_upload: decoded value differs"] += 1
+            return None
+        return db.check_duplicate_barcode(code)
+
+    def _submit(self, codes, branch):
+        scans = [{'barcode': c, 'username': self.username, 'branch': branch} for c in codes]
+        outcome = self.timed('submit', self.writer.insert, scans)
+        if outcome is None:
+            return
+        results, err = outcome
+        if err:
+            self.errors[f"submit: {err}"] += 1
+            return
+        for r in results:
+            self.statuses[r['status']] += 1
+            if r['status'] == 'inserted':
+                self.acknowledged.append(r['barcode'])
+
+    def _admin_view(self):
+        import db
+        _, _, err = db.query_scans(page=1, page_size=50)
+        if err:
+            raise RuntimeError(err)
+        db.get_scan_counts()
+
+def run_process(workdir, config, session_indices, credentials, barrier=None):
+    """Runs a share of the sessions in this process; returns its raw results."""
+    os.chdir(workdir)
+    import db
+    import group_commit
+    db.init_db()
+
+    if config['decode_workers']:
+        import decode_pool
+        pool = decode_pool.DecodePool(workers=config['decode_workers'])
+        decode = pool.decode
+    else:
+        import decoder
+        engine = decoder.DecoderEngine()
+        decode = engine.decode
+    writer = group_commit.GroupCommitWriter()
+
+    shared_codes = [f"{config['prefix']}-SHARED-{k:04d}" for k in range(config['shared_pool'])]
+    sessions = [Session(i, *credentials[i % len(credentials)], config, shared_codes, decode, writer)
+                for i in session_indices]
+    for s in sessions:
+        s.prepare_images()
+    # Warm the shared caches (directory, index, decoder) outside the measurement
+    db.validate_db_user(*credentials[0])
+    db.check_duplicate_barcode(shared_codes[0])
+    if barrier is not None:
+        barrier.wait()
+
+    threads = [threading.Thread(target=s.run, name=f"session-{s.index}") for s in sessions]
+    with ResourceSampler() as sampler:
+        started = time.perf_counter()
+        for t in threads:
+            t.start()
+            if config['ramp_s']:
+                time.sleep(config['ramp_s'] / len(threads))
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - started
+        writer.close()
+        if config['decode_workers']:
+            pool.shutdown()
+
+    latencies = defaultdict(list)
+    errors, statuses = Counter(), Counter()
+    acknowledged = []
+    for s in sessions:
+        for action, samples in s.latencies.items():
+            latencies[action].extend(samples)
+        errors.update(s.errors)
+        statuses.update(s.statuses)
+        acknowledged.extend(s.acknowledged)
+    return {
+        'pid': os.getpid(),
+        'sessions': len(sessions),
+        'elapsed_s': elapsed,
+        'latencies': dict(latencies),
+        'errors': dict(errors),
+        'statuses': dict(statuses),
+        'acknowledged': acknowledged,
+        'resources': sampler.report(),
+    }
+
+def _process_entry(workdir, config, session_indices, credentials, barrier, results):
+    try:
+        results.put(run_process(workdir, config, session_indices, credentials, barrier))
+    except threading.BrokenBarrierError:
+        results.put({'pid': os.getpid(), 'failed': "gave up at the start line (another process failed or stalled)"})
+    except Exception as e:
+        # Release the others from the start line instead of leaving them waiting for us
+        barrier.abort()
+        results.put({'pid': os.getpid(), 'failed': f"{type(e).__name__}: {e}"})
+
+def collect_results(procs, results, poll_s=1.0):
+    """One result per process; a process that died without reporting counts as failed."""
+    outcomes = []
+    while len(outcomes) < len(procs):
+        try:
+            outcomes.append(results.get(timeout=poll_s))
+        except queue.Empty:
+            if any(p.is_alive() for p in procs):
+                continue
+            # Everyone has exited; whatever they sent is in the pipe by now
+            try:
+                outcomes.append(results.get(timeout=poll_s))
+            except queue.Empty:
+                reported = {o['pid'] for o in outcomes}
+                outcomes.extend({'pid': p.pid, 'failed': f"exited with code {p.exitcode} without a report"}
+                                for p in procs if p.pid not in reported)
+    return outcomes
+
+def table_barcodes(prefix):
+    """Every stored row's (scan_id, barcode) for this run, straight from the storage backend."""
+    import db
+    if db.DB_BACKEND == 'csv' and db.SCANS_STORAGE == 'csv':
+        # Raw scans.csv, so a row written twice shows up twice (minus tombstoned ids)
+        deleted = set()
+        if os.path.exists(db.SCANS_TOMBSTONE_FILE):
+            with open(db.SCANS_TOMBSTONE_FILE, newline='', encoding='utf-8') as f:
+                deleted = {row['scan_id'] for row in csv.DictReader(f)}
+        with open(db.SCANS_FILE, newline='', encoding='utf-8') as f:
+            return [(row['scan_id'], row['barcode']) for row in csv.DictReader(f)
+                    if row['barcode'].startswith(prefix) and row['scan_id'] not in deleted]
+    df, err = db.get_all_scans()
+    if err and df is None:
+        raise RuntimeError(err)
+    df = df[df['barcode'].astype(str).str.startswith(prefix)]
+    return list(zip(df['scan_id'].astype(str), df['barcode'].astype(str)))
+
+def verify(prefix, acknowledged):
+    rows = table_barcodes(prefix)
+    stored = Counter(barcode for _, barcode in rows)
+    acked = Counter(acknowledged)
+    return {
+        'rows_written': len(rows),
+        'acknowledged': len(acknowledged),
+        'lost': sorted(b for b in acked if b not in stored),
+        'duplicated': sorted(b for b, n in stored.items() if n > 1),
+        'phantom': sorted(b for b in stored if b not in acked),
+        'double_ack': sorted(b for b, n in acked.items() if n > 1),
+        'duplicate_scan_ids': sorted(i for i, n in Counter(i for i, _ in rows).items() if n > 1),
+    }
+
+def seed(workdir, sessions, seed_rows):
+    import bench
+    os.chdir(workdir)
+    rng = np.random.default_rng(0)
+    credentials, branches = bench.generate_users('users.csv', n_users=max(sessions, 1), rng=rng)
+    if seed_rows:
+        bench.generate_scans('scans.csv', seed_rows, branches, rng=rng)
+    return credentials
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=20)
+    parser.add_argument('--processes', type=int, default=1, help="server processes sharing the files")
+    parser.add_argument('--scans', type=int, default=20, help="barcodes per session")
+    parser.add_argument('--batch', type=int, default=10, help="pending scans per submit")
+    parser.add_argument('--camera-ratio', type=float, default=0.3, help="share of scans made from photos")
+    parser.add_argument('--contested', type=float, default=0.05,
+                        help="share of scans drawn from a pool shared by all sessions")
+    parser.add_argument('--shared-pool', type=int, default=50)
+    parser.add_argument('--think-ms', type=float, default=0, help="mean pause between a clerk's actions")
+    parser.add_argument('--ramp-s', type=float, default=0, help="spread session starts over this many seconds")
+    parser.add_argument('--admin-every', type=int, default=10, help="every n-th session also opens the admin view")
+    parser.add_argument('--decode-workers', type=int, default=0, help="use a decode_pool of this size (0: inline)")
+    parser.add_argument('--seed-rows', type=int, default=10000, help="scans in the table before the run")
+    parser.add_argument('--workdir', help="run here instead of a fresh temp dir (kept afterwards)")
+    parser.add_argument('--force', action='store_true', help="use --workdir even if it is not empty")
+    parser.add_argument('--out', help="write the report as JSON")
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    here = os.getcwd()
+    if args.workdir and os.path.isdir(args.workdir) and os.listdir(args.workdir) and not args.force:
+        print(f"{args.workdir} is not empty; seeding would overwrite its users.csv. "
+              f"Pass --force to use it anyway.")
+        return 2
+    workdir = os.path.abspath(args.workdir) if args.workdir else tempfile.mkdtemp(prefix="loadtest_")
+    os.makedirs(workdir, exist_ok=True)
+    config = {
+        'prefix': f"LT{int(time.time())}",
+        'seed': 1,
+        'scans': args.scans,
+        'batch': args.batch,
+        'camera_ratio': args.camera_ratio,
+        'contested': args.contested,
+        'shared_pool': max(1, args.shared_pool),
+        'think_ms': args.think_ms,
+        'ramp_s': args.ramp_s,
+        'admin_every': args.admin_every,
+        'decode_workers': args.decode_workers,
+    }
+    try:
+        credentials = seed(workdir, args.sessions, 0 if args.workdir and os.path.exists(
+            os.path.join(workdir, 'scans.csv')) else args.seed_rows)
+        print(f"{args.sessions} sessions x {args.scans} scans in {args.processes} process(es), workdir {workdir}")
+        print(f"driver: {DRIVER}")
+
+        shares = [list(range(args.sessions))[p::args.processes] for p in range(args.processes)]
+        if args.processes == 1:
+            outcomes = [run_process(workdir, config, shares[0], credentials)]
+        else:
+            ctx = multiprocessing.get_context('spawn')
+            barrier, results = ctx.Barrier(args.processes, timeout=BARRIER_TIMEOUT), ctx.Queue()
+            procs = [ctx.Process(target=_process_entry, args=(workdir, config, share, credentials, barrier, results))
+                     for share in shares]
+            for p in procs:
+                p.start()
+            outcomes = collect_results(procs, results)
+            for p in procs:
+                p.join()
+        failed = [o['failed'] for o in outcomes if 'failed' in o]
+        outcomes = [o for o in outcomes if 'failed' not in o]
+
+        latencies = defaultdict(list)
+        errors, statuses = Counter(), Counter()
+        acknowledged = []
+        for o in outcomes:
+            for action, samples in o['latencies'].items():
+                latencies[action].extend(samples)
+            errors.update(o['errors'])
+            statuses.update(o['statuses'])
+            acknowledged.extend(o['acknowledged'])
+        elapsed = max((o['elapsed_s'] for o in outcomes), default=0)
+        integrity = verify(config['prefix'], acknowledged)
+
+        import db
+        report = {
+            'started': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'python': platform.python_version(),
+            'cpu_count': os.cpu_count(),
+            'driver': DRIVER,
+            'db_backend': db.DB_BACKEND,
+            'scans_storage': db.SCANS_STORAGE,
+            'config': dict(config, sessions=args.sessions, processes=args.processes, seed_rows=args.seed_rows),
+            'elapsed_s': round(elapsed, 2),
+            'submitted_scans_per_s': round(sum(statuses.values()) / elapsed, 1) if elapsed else None,
+            'actions': {a: percentiles(latencies[a]) for a in ACTIONS if latencies.get(a)},
+            'submit_statuses': dict(statuses),
+            'errors': dict(errors),
+            'failed_processes': failed,
+            'integrity': {k: (len(v) if isinstance(v, list) else v) for k, v in integrity.items()},
+            'integrity_examples': {k: v[:20] for k, v in integrity.items() if isinstance(v, list) and v},
+            'resources': [o['resources'] for o in outcomes],
+        }
+    finally:
+        os.chdir(here)
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"\n{'action':<15}{'n':>7}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for action, stats in report['actions'].items():
+        print(f"{action:<15}{stats['n']:>7}{stats['p50_ms']:>10}{stats['p90_ms']:>10}"
+              f"{stats['p99_ms']:>10}{stats['max_ms']:>10}")
+    print(f"\n{report['elapsed_s']} s, {report['submitted_scans_per_s']} submitted scans/s, "
+          f"statuses {report['submit_statuses']}")
+    for i, r in enumerate(report['resources']):
+        print(f"process {i}: cpu {r['cpu_s']} s ({r['cpu_pct']}%), rss avg {r['avg_rss_mb']} MB, "
+              f"peak {r['peak_rss_mb']} MB")
+    print("integrity: " + ", ".join(f"{k} {v}" for k, v in report['integrity'].items()))
+    for message, n in sorted(report['errors'].items(), key=lambda kv: -kv[1])[:10]:
+        print(f"error x{n}: {message}")
+    for message in failed:
+        print(f"process failed: {message}")
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.out}")
+
+    bad = report['integrity']
+    return 1 if failed or bad['lost'] or bad['duplicated'] or bad['phantom'] or bad['double_ack'] \
+        or bad['duplicate_scan_ids'] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
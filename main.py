@@ -1,5 +1,7 @@
 import streamlit as st
 import db
+import metrics
+import os
 import time
 
 st.set_page_config(page_title="Battery Stock Taking", page_icon="🔋", layout="wide")
@@ -22,6 +24,53 @@ def setup_database():
 
 setup_database()
 
+# Optional exporters for the in-process metrics: METRICS_PORT serves /metrics in
+# Prometheus text format (on localhost; set METRICS_HOST=0.0.0.0 to expose it),
+# METRICS_DUMP_FILE rewrites a .prom file periodically.
+@st.cache_resource
+def start_metrics_exporters():
+    if os.environ.get('METRICS_PORT'):
+        metrics.start_http_server(int(os.environ['METRICS_PORT']),
+                                  host=os.environ.get('METRICS_HOST', '127.0.0.1'))
+    if os.environ.get('METRICS_DUMP_FILE'):
+        metrics.start_file_dumper(os.environ['METRICS_DUMP_FILE'])
+
+start_metrics_exporters()
+
+# Decoder engine with its detectors initialised once per process (see decoder.py)
+@st.cache_resource
+def get_decoder():
+    import decoder
+    return decoder.DecoderEngine()
+
+# Worker processes for photo decodes, shared by all sessions (see decode_pool.py).
+# DECODE_WORKERS sets the count (default: one per core); 0 decodes in-process.
+@st.cache_resource
+def get_decode_pool():
+    import decode_pool
+    if os.environ.get('DECODE_WORKERS', '').strip() == '0':
+        return None
+    return decode_pool.DecodePool()
+
+def decode_photo(image_bytes, multi):
+    pool = get_decode_pool()
+    if pool is None:
+        return get_decoder().decode(image_bytes, multi=multi)
+    return pool.decode(image_bytes, multi=multi)
+
+# Decode results memoized by photo hash, so reruns with the same photo cost nothing
+@st.cache_resource
+def get_decode_cache():
+    import decode_cache
+    return decode_cache.DecodeCache()
+
+# One background writer per process: concurrent submits from all sessions are
+# coalesced into a single write (see group_commit.py).
+@st.cache_resource
+def get_scan_writer():
+    import group_commit
+    return group_commit.GroupCommitWriter()
+
 def login_page():
     st.title("🔋 Battery Stock Login")
     
@@ -46,13 +95,208 @@ def login_page():
                     time.sleep(0.5)
                     st.rerun()
 
-import cv2
-import numpy as np
-import pandas as pd
+# The login page never touches OpenCV or pandas. Once a user is in, import the
+# decode stack and DataFrame tooling on a background thread so the first scan
+# and the first admin query don't pay for it.
+@st.cache_resource
+def start_prewarm():
+    import threading
+
+    def warm():
+        with metrics.timer('prewarm_ms'):
+            import pandas
+            import decoder
+            import barcode_index
+            import scans_read_model
+            try:
+                import pyzbar.pyzbar
+            except ImportError:
+                pass
+
+    threading.Thread(target=warm, name="prewarm", daemon=True).start()
+
+# Photos are written by a background thread into a sharded, content-addressed layout
+@st.cache_resource
+def get_image_store():
+    import image_store
+    return image_store.ImageStore()
+
+def save_scan_image(image_data):
+    # Returns the path the photo will be stored at, or None if it could not be queued
+    try:
+        return get_image_store().save(image_data, st.session_state.selected_branch)
+    except Exception as e:
+        st.error(f"Failed to save image: {e}")
+        return None
+
+def add_codes_to_pending(codes, user, image_data=None, images_by_code=None):
+    """
+    Bulk version of the single-scan flow for multi-code photos and video scans: one
+    pass over the pending list and one DB duplicate check for every code.
+    images_by_code (video) maps each code to the frame it was first seen in.
+    """
+    codes = list(dict.fromkeys(codes))
+    pending = {item['barcode'] for item in st.session_state.scanned_items}
+    fresh = [c for c in codes if c not in pending]
+    
+    in_db, err = db.check_duplicate_barcodes(fresh)
+    if err:
+        st.error(f"Error checking DB: {err}")
+        return [], None
+    added = [c for c in fresh if c not in in_db]
+    
+    photo_path = save_scan_image(image_data) if added and image_data else None
+    for code in added:
+        # Each entry gets the image it was read from: its own video frame, else this
+        # call's photo, never the previous code's frame
+        frame = images_by_code.get(code) if images_by_code else None
+        image_path = save_scan_image(frame) if frame else photo_path
+        st.session_state.scanned_items.append({
+            'barcode': code,
+            'username': user['username'],
+            'branch': st.session_state.selected_branch,
+            'status': 'Pending',
+            'image_path': image_path
+        })
+    
+    summary = [f"Added {len(added)} code(s) to list."]
+    if len(codes) > len(fresh):
+        summary.append(f"{len(codes) - len(fresh)} already in the pending list.")
+    if in_db:
+        summary.append(f"Already in Database: {', '.join(sorted(in_db))}.")
+    return added, " ".join(summary)
+
+def scan_video(video_bytes=None, suffix=None, device=None):
+    """
+    Runs the continuous scanner over an uploaded clip (or a server-side camera
+    device) and returns (codes in order first seen, {code: frame jpeg}).
+    """
+    import tempfile
+    import video_scan
+    scanner = video_scan.VideoScanner()
+    codes, images_by_code = [], {}
+    progress = st.empty()
+    tmp_path = None
+    try:
+        if video_bytes is not None:
+            # cv2.VideoCapture needs a real file
+            with tempfile.NamedTemporaryFile(suffix=suffix or '.mp4', delete=False) as f:
+                f.write(video_bytes)
+                tmp_path = f.name
+            frames = scanner.scan(tmp_path)
+        else:
+            frames = scanner.scan(device, max_seconds=20)
+        for index, fresh, frame in frames:
+            jpeg = video_scan.encode_jpeg(frame)
+            for code, _ in fresh:
+                codes.append(code)
+                images_by_code[code] = jpeg
+            progress.info(f"Frame {index}: {len(codes)} code(s) so far, latest {fresh[-1][0]}")
+    except IOError as e:
+        st.error(str(e))
+    finally:
+        if tmp_path:
+            os.remove(tmp_path)
+    stats = scanner.stats()
+    progress.caption(f"{stats['frames']} frames ({stats['skipped_similar']} skipped as unchanged), "
+                     f"{stats['codes']} code(s), {stats['codes_per_s'] or 0} codes/s")
+    return codes, images_by_code
+
+def show_progress_dashboard(user):
+    # Served from the maintained counts (see aggregates.py); never reads the scans table
+    import pandas as pd
+    from datetime import datetime
+    is_admin = user['username'] == 'devp01'
+    branch = None if is_admin else st.session_state.selected_branch
+    counts, err = db.get_scan_counts(branch)
+    if err and counts is None:
+        st.error(f"Could not load counts: {err}")
+        return
+    if err:
+        st.warning(err)
+
+    today = datetime.now().strftime("%Y-%m-%d")
+    c1, c2, c3 = st.columns(3)
+    c1.metric("Scanned" if is_admin else f"Scanned in {branch}", counts['total'])
+    c2.metric("Today", counts['by_day'].get(today, 0))
+    c3.metric("Branches" if is_admin else "Users", len(counts['by_branch'] if is_admin else counts['by_user']))
+
+    if is_admin and counts['by_branch']:
+        st.caption("Per branch")
+        st.bar_chart(pd.Series(counts['by_branch'], name="scans").sort_values(ascending=False))
+    if counts['by_day']:
+        st.caption("Per day")
+        st.bar_chart(pd.Series(counts['by_day'], name="scans").sort_index())
+    if counts['by_user']:
+        st.caption("Per user")
+        per_user = pd.DataFrame({'user': list(counts['by_user']), 'scans': list(counts['by_user'].values())})
+        st.dataframe(per_user.sort_values('scans', ascending=False), hide_index=True, use_container_width=True)
+    if is_admin and st.button("Rebuild counts", help="Recount from the scans table"):
+        success, msg = db.rebuild_scan_counts()
+        if success:
+            st.success(msg)
+        else:
+            st.error(msg)
+
+# Header handling for uploaded lists: detect it, or let the user say
+HEADER_CHOICES = {"Detect": None, "Yes": True, "No": False}
+
+# Rows per detail table sent to the browser; the zip export always has everything
+RECONCILE_DISPLAY_ROWS = 2000
+
+def show_reconciliation():
+    # Expected stock (ERP export) against the scans table, see reconcile.py
+    import reconcile
+    st.subheader("📋 Admin: Reconcile with Expected Stock")
+    expected_file = st.file_uploader("Expected stock file (barcode, branch)", type=["csv", "txt"],
+                                     key="reconcile_file")
+    header_choice = st.radio("First row is a header", HEADER_CHOICES, horizontal=True,
+                             key="reconcile_has_header")
+    if expected_file is not None and st.button("Run Reconciliation"):
+        status = st.empty()
+        result, err = reconcile.reconcile(
+            expected_file, progress=lambda rows: status.caption(f"{rows:,} expected rows processed..."),
+            has_header=HEADER_CHOICES[header_choice],
+        )
+        status.empty()
+        if err:
+            st.error(f"Reconciliation failed: {err}")
+        else:
+            st.session_state.reconcile_result = result
+            st.session_state.reconcile_zips = {}
+
+    result = st.session_state.get('reconcile_result')
+    if not result:
+        return
+    stats = result['stats']
+    st.caption(f"{stats['expected_rows']:,} expected rows ({stats['duplicate_expected']:,} repeated) "
+               f"against {stats['scans']:,} scans in {stats['elapsed_s']} s")
+    if stats.get('header'):
+        st.caption(f"Skipped header row: {', '.join(stats['header'])}")
+    st.dataframe(result['summary'], hide_index=True, use_container_width=True)
+
+    branches = result['summary']['branch_code'].tolist()
+    branch = st.selectbox("Details for branch", ["All branches"] + branches, key="reconcile_branch")
+    branch = None if branch == "All branches" else branch
+    details = reconcile.for_branch(result, branch) if branch else \
+        {name: result[name] for name in ('missing', 'wrong_branch', 'unexpected')}
+    for name, frame in details.items():
+        label = name.replace('_', ' ').capitalize()
+        with st.expander(f"{label} ({len(frame):,})"):
+            if len(frame) > RECONCILE_DISPLAY_ROWS:
+                st.caption(f"Showing the first {RECONCILE_DISPLAY_ROWS:,} rows; download for all of them.")
+            st.dataframe(frame.head(RECONCILE_DISPLAY_ROWS), hide_index=True, use_container_width=True)
+    # Built once per result and branch, not on every rerun the widgets above trigger
+    zips = st.session_state.setdefault('reconcile_zips', {})
+    if branch not in zips:
+        zips[branch] = reconcile.to_zip(result, branch)
+    st.download_button("Download reconciliation (zip of CSVs)", zips[branch],
+                       file_name=f"reconciliation_{branch or 'all'}.zip", mime="application/zip")
 
 def main_app():
     user = st.session_state.user_info
     st.sidebar.title(f"User: {user['username']}")
+    start_prewarm()
     
     # Initialize Session State (specific to main app)
     if 'scanned_items' not in st.session_state:
@@ -75,13 +319,19 @@ def main_app():
         return
 
     # Tabs for different scanning methods
-    tab1, tab2 = st.tabs(["📷 Camera Scan", "#️⃣ Manual Entry"])
+    tab1, tab2, tab3, tab4 = st.tabs(["📷 Camera Scan", "#️⃣ Manual Entry", "🎞 Video Scan", "📊 Progress"])
     
     new_scan = None
+    new_scan_image = None  # the photo new_scan was read from; None for a typed code
+    new_codes = []
     scanned_image_data = None
     
     with tab1:
         st.write("Take a picture of the QR/Barcode")
+        multi_mode = st.checkbox("Multi-code mode (shelf / pallet photo)", key="multi_mode")
+        if st.session_state.last_scan_result:
+            st.info(st.session_state.last_scan_result)
+            st.session_state.last_scan_result = None
         # Dynamic key to reset camera
         camera_image = st.camera_input("Scan Battery", key=f"camera_{st.session_state.camera_key}")
         
@@ -89,42 +339,20 @@ def main_app():
             # Decode image
             bytes_data = camera_image.getvalue()
             scanned_image_data = bytes_data # Store for saving later
-            cv2_img = cv2.imdecode(np.frombuffer(bytes_data, np.uint8), cv2.IMREAD_COLOR)
-            
-            # Convert to grayscale (improves detection)
-            gray_img = cv2.cvtColor(cv2_img, cv2.COLOR_BGR2GRAY)
-            
-            data = None
-            debug_info = []
-
-            # Method 1: Pyzbar (best for 1D Barcodes)
-            try:
-                from pyzbar.pyzbar import decode
-                decoded_objects = decode(gray_img) # Use gray image
-                if decoded_objects:
-                    obj = decoded_objects[0]
-                    data = obj.data.decode("utf-8")
-                    st.success(f"✅ Barcode Detected: {data} ({obj.type})")
-                else:
-                    debug_info.append("Pyzbar: No code found")
-            except ImportError:
-                debug_info.append("Pyzbar: Library not installed")
-            except Exception as e:
-                debug_info.append(f"Pyzbar Error: {e}")
-                
-            # Method 2: OpenCV (best for QR Codes) - Fallback
-            if not data:
-                detector = cv2.QRCodeDetector()
-                # OpenCV sometimes likes the color image, sometimes gray. trying original first.
-                val, _, _ = detector.detectAndDecode(cv2_img)
-                if val:
-                    data = val
-                    st.success(f"✅ QR Detected: {data}")
-                else:
-                     debug_info.append("CV2: No QR found")
-            
-            if data:
-                new_scan = data
+            result = get_decode_cache().get_or_decode(
+                bytes_data,
+                lambda b: decode_photo(b, multi_mode),
+                variant='multi' if multi_mode else ''
+            )
+            data = result.data
+            debug_info = list(result.debug)
+            debug_info.append("Timings: " + ", ".join(f"{name} {ms:.0f} ms" for name, ms in result.timings))
+            if data and multi_mode:
+                st.success(f"✅ Detected {len(result.codes)} code(s) via {result.strategy}")
+                new_codes = [code for code, _ in result.codes]
+            elif data:
+                st.success(f"✅ Barcode Detected: {data} ({result.symbology}, via {result.strategy})")
+                new_scan, new_scan_image = data, bytes_data
             else:
                 st.warning("❌ No code detected.")
                 with st.expander("Debug Info"):
@@ -136,7 +364,71 @@ def main_app():
             barcode = st.text_input("Enter Barcode", key="barcode_input")
             submitted = st.form_submit_button("Add to List")
             if submitted and barcode:
-                new_scan = barcode
+                # Typed in: not linked to whatever photo the camera still shows
+                new_scan, new_scan_image = barcode, None
+
+        # Lists exported from handheld scanners / the ERP go straight to the database
+        with st.expander("📄 Import barcode list (CSV / text)"):
+            list_file = st.file_uploader("Barcode file", type=["csv", "txt"],
+                                         key=f"import_{st.session_state.camera_key}")
+            header_choice = st.radio("First row is a header", HEADER_CHOICES, horizontal=True,
+                                     key="import_has_header")
+            if list_file is not None and st.button("Import to Database"):
+                import bulk_import
+                codes, header = bulk_import.parse_barcodes(list_file.getvalue(),
+                                                           has_header=HEADER_CHOICES[header_choice])
+                bar = st.progress(0.0, text=f"Importing {len(codes)} rows...")
+                summary, err = bulk_import.import_barcodes(
+                    codes, user['username'], st.session_state.selected_branch,
+                    pending=[item['barcode'] for item in st.session_state.scanned_items],
+                    progress=lambda done, total: bar.progress(done / total),
+                    header=header,
+                )
+                bar.empty()
+                if err:
+                    st.error(f"Import failed: {err}")
+                else:
+                    st.success(bulk_import.describe(summary))
+                    for error in summary['errors']:
+                        st.error(error)
+                    if summary['already_in_db_codes']:
+                        st.download_button("Download codes already in the database",
+                                           "\n".join(summary['already_in_db_codes']) + "\n",
+                                           file_name="already_in_db.txt", mime="text/plain")
+
+    with tab3:
+        # Continuous mode: every new code in the clip goes straight to the pending list
+        st.write("Record a slow sweep along the rack, then upload it")
+        video_file = st.file_uploader("Rack video", type=["mp4", "mov", "avi", "webm", "mkv"],
+                                      key=f"video_{st.session_state.camera_key}")
+        device = os.environ.get('VIDEO_DEVICE')
+        run_file = video_file is not None and st.button("Scan video")
+        run_device = bool(device) and st.button(f"Scan from camera {device} for 20 s")
+        if run_file or run_device:
+            new_codes, images_by_code = scan_video(
+                video_file.getvalue() if run_file else None,
+                os.path.splitext(video_file.name)[1] if run_file else None,
+                int(device) if device and device.isdigit() else device,
+            )
+            if new_codes:
+                added, summary = add_codes_to_pending(new_codes, user, images_by_code=images_by_code)
+                st.session_state.last_scan_result = summary
+                st.session_state.camera_key += 1
+                st.rerun()
+            else:
+                st.warning("❌ No codes found in the video.")
+
+    with tab4:
+        show_progress_dashboard(user)
+
+    # Processing every code from a multi-code photo at once
+    if new_codes:
+        added, summary = add_codes_to_pending(new_codes, user, scanned_image_data)
+        if summary:
+            # RESET CAMERA for the next photo; no pause, the summary is shown after the rerun
+            st.session_state.last_scan_result = summary
+            st.session_state.camera_key += 1
+            st.rerun()
 
     # Processing a new scan (from either source)
     if new_scan:
@@ -152,31 +444,20 @@ def main_app():
             elif err:
                 st.error(f"Error checking DB: {err}")
             else:
-                # SAVE IMAGE IF EXISTS
-                if scanned_image_data:
-                    try:
-                        import os
-                        if not os.path.exists("scanned_images"):
-                            os.makedirs("scanned_images")
-                        
-                        timestamp_str = time.strftime("%Y%m%d_%H%M%S")
-                        filename = f"scanned_images/{new_scan}_{timestamp_str}.jpg"
-                        with open(filename, "wb") as f:
-                            f.write(scanned_image_data)
-                        # st.info(f"Image saved: {filename}")
-                    except Exception as e:
-                        st.error(f"Failed to save image: {e}")
+                # SAVE IMAGE IF EXISTS (queued, the write happens in the background)
+                image_path = save_scan_image(new_scan_image) if new_scan_image else None
 
                 st.session_state.scanned_items.append({
                     'barcode': new_scan,
                     'username': user['username'],
                     'branch': st.session_state.selected_branch,
-                    'status': 'Pending'
+                    'status': 'Pending',
+                    'image_path': image_path
                 })
                 st.success(f"Added {new_scan} to list.")
                 
                 # RESET CAMERA if source was camera
-                if scanned_image_data:
+                if new_scan_image:
                     st.session_state.camera_key += 1
                     time.sleep(0.5) # Short pause to see success message
                     st.rerun()
@@ -186,20 +467,34 @@ def main_app():
     st.subheader("Pending Scans")
     
     if st.session_state.scanned_items:
+        import pandas as pd
         df = pd.DataFrame(st.session_state.scanned_items)
         st.dataframe(df[['barcode', 'branch', 'status']], use_container_width=True)
         
         col1, col2 = st.columns(2)
         with col1:
             if st.button("Submit All to Database", type="primary"):
-                success, msg = db.insert_scan_batch(st.session_state.scanned_items)
-                if success:
-                    st.success(msg)
+                results, err = get_scan_writer().insert(st.session_state.scanned_items)
+                if err:
+                    st.error(f"Batch Insert Failed: {err}")
+                else:
+                    # Link the stored photos to their new scan_ids
+                    pending = {item['barcode']: item for item in st.session_state.scanned_items}
+                    get_image_store().link([
+                        {'scan_id': r['scan_id'], 'barcode': r['barcode'],
+                         'branch_code': pending[r['barcode']]['branch'],
+                         'image_path': pending[r['barcode']]['image_path']}
+                        for r in results
+                        if r['status'] == 'inserted' and pending[r['barcode']].get('image_path')
+                    ])
+                    inserted = [r['barcode'] for r in results if r['status'] == 'inserted']
+                    skipped = [r['barcode'] for r in results if r['status'] != 'inserted']
+                    st.success(f"Successfully inserted {len(inserted)} records.")
+                    if skipped:
+                        st.warning(f"Skipped {len(skipped)} duplicate(s): {', '.join(skipped)}")
                     st.session_state.scanned_items = [] # Clear list
                     time.sleep(1)
                     st.rerun()
-                else:
-                    st.error(f"Batch Insert Failed: {msg}")
         
         with col2:
             if st.button("Clear List"):
@@ -217,14 +512,69 @@ def main_app():
 
     # Admin View for devp01
     if user['username'] == 'devp01':
+        cache_stats = get_decode_cache().stats()
+        st.sidebar.caption(
+            f"Decode cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses "
+            f"({cache_stats['hit_rate']:.0%}), {cache_stats['entries']} entries"
+        )
+        pool = get_decode_pool()
+        if pool is not None:
+            pool_stats = pool.stats()
+            st.sidebar.caption(
+                f"Decode pool: {pool_stats['busy']}/{pool_stats['workers']} busy, {pool_stats['queued']} queued, "
+                f"{pool_stats['timeouts']} timeouts, {pool_stats['rejected']} rejected"
+            )
+        with st.sidebar.expander("📈 Metrics"):
+            st.caption("Latency in ms (row histograms in rows); percentiles are bucket upper bounds.")
+            st.dataframe(metrics.summary_rows(), hide_index=True, use_container_width=True)
+            st.dataframe(metrics.counter_rows(), hide_index=True, use_container_width=True)
+            st.download_button("Download (Prometheus text)", metrics.render_prometheus(),
+                               file_name="metrics.prom", mime="text/plain")
+
+        st.divider()
+        show_reconciliation()
+
         st.divider()
         st.subheader("🛠 Admin: Manage Scans")
         
-        all_scans, err = db.get_all_scans()
+        # Filters and sorting run server-side; only one page of rows reaches the editor
+        f1, f2, f3, f4, f5 = st.columns(5)
+        with f1:
+            branch_filter = st.text_input("Branch", key="admin_branch").strip().upper()
+        with f2:
+            user_filter = st.text_input("User", key="admin_user").strip()
+        with f3:
+            prefix_filter = st.text_input("Barcode starts with", key="admin_prefix").strip()
+        with f4:
+            date_from = st.date_input("From", value=None, key="admin_from")
+        with f5:
+            date_to = st.date_input("To", value=None, key="admin_to")
+        
+        s1, s2, s3, s4 = st.columns(4)
+        with s1:
+            sort_by = st.selectbox("Sort by", ['created_date', 'scan_id', 'barcode', 'branch_code', 'created_by'],
+                                   key="admin_sort")
+        with s2:
+            descending = st.checkbox("Descending", value=True, key="admin_desc")
+        with s3:
+            page_size = st.selectbox("Rows per page", [25, 50, 100, 250], index=1, key="admin_page_size")
+        with s4:
+            page = st.number_input("Page", min_value=1, value=1, step=1, key="admin_page")
+        
+        all_scans, total, err = db.query_scans(
+            page=int(page), page_size=page_size,
+            branch=branch_filter or None, user=user_filter or None,
+            date_from=date_from, date_to=date_to, barcode_prefix=prefix_filter or None,
+            sort_by=sort_by, ascending=not descending
+        )
         if err:
              st.error(f"Error loading data: {err}")
         elif not all_scans.empty:
+             pages = max(1, -(-total // page_size))
+             st.caption(f"{total} matching record(s), page {int(page)} of {pages}")
+             
              # Add a selection column
+             all_scans = all_scans.copy()
              all_scans.insert(0, "Select", False)
              
              # Show data editor
@@ -232,7 +582,7 @@ def main_app():
                  all_scans,
                  column_config={
                      "Select": st.column_config.CheckboxColumn(required=True),
-                     "created_date": st.column_config.TextColumn(disabled=True),
+                     "created_date": st.column_config.DatetimeColumn(disabled=True),
                      "scan_id": st.column_config.NumberColumn(disabled=True),
                      "barcode": st.column_config.TextColumn(disabled=True),
                      "created_by": st.column_config.TextColumn(disabled=True),
@@ -248,18 +598,22 @@ def main_app():
              if not selected_rows.empty:
                  st.warning(f"Selected {len(selected_rows)} record(s) for deletion.")
                  if st.button("🗑 Delete Selected", type="primary"):
-                     count = 0
-                     for index, row in selected_rows.iterrows():
-                         db.delete_scan(row['scan_id'])
-                         count += 1
-                     st.success(f"Deleted {count} records.")
-                     time.sleep(1)
-                     st.rerun()
+                     results, err = db.delete_scans(selected_rows['scan_id'].tolist())
+                     if err:
+                         st.error(f"Delete failed: {err}")
+                     else:
+                         count = sum(1 for r in results if r['status'] == 'deleted')
+                         st.success(f"Deleted {count} records.")
+                         if count < len(results):
+                             st.warning(f"{len(results) - count} record(s) were already gone.")
+                         time.sleep(1)
+                         st.rerun()
         else:
              st.info("No records found.")
 
 if __name__ == "__main__":
-    if not st.session_state.logged_in:
-        login_page()
-    else:
-        main_app()
\ No newline at end of file
+    with metrics.timer('streamlit_rerun_ms', page='login' if not st.session_state.logged_in else 'main'):
+        if not st.session_state.logged_in:
+            login_page()
+        else:
+            main_app()
\ No newline at end of file
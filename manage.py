@@ -0,0 +1,95 @@
+"""
+Offline maintenance commands for the stock-taking data files.
+
+Usage:
+    python manage.py compact
+    python manage.py migrate-sqlite
+    python manage.py import-barcodes <file> <username> <branch> [--header]
+    python manage.py rebuild-counts
+    python manage.py migrate-partitioned
+    python manage.py archive <YYYY-MM> [branch]      # partitioned backend: months before YYYY-MM
+    python manage.py reconcile <expected.csv> [out.zip]
+"""
+import sys
+import db
+
+def compact():
+    success, msg = db.compact_scans()
+    print(msg)
+    return 0 if success else 1
+
+def migrate_sqlite():
+    import db_sqlite
+    success, msg = db_sqlite.migrate_from_csv()
+    print(msg)
+    return 0 if success else 1
+
+def import_barcodes(path, username, branch, *options):
+    import bulk_import
+    with open(path, 'rb') as f:
+        data = f.read()
+    codes, header = bulk_import.parse_barcodes(data, has_header=True if '--header' in options else None)
+    # A detected header is only skipped once the operator says so
+    if header and '--header' not in options:
+        row = ', '.join(header)
+        confirmed = sys.stdin.isatty() and \
+            input(f"First row '{row}' looks like a header; skip it? [y/N] ").strip().lower() == 'y'
+        if not confirmed:
+            print(f"Importing first row '{row}' as a barcode (pass --header to skip it)")
+            codes, header = bulk_import.parse_barcodes(data, has_header=False)
+    summary, err = bulk_import.import_barcodes(codes, username, branch, header=header)
+    if err:
+        print(err)
+        return 1
+    print(bulk_import.describe(summary))
+    return 0
+
+def rebuild_counts():
+    success, msg = db.rebuild_scan_counts()
+    print(msg)
+    return 0 if success else 1
+
+def migrate_partitioned():
+    import db_partitioned
+    success, msg = db_partitioned.migrate_from_csv()
+    print(msg)
+    return 0 if success else 1
+
+def archive(before_month, branch=None):
+    import db_partitioned
+    success, msg = db_partitioned.archive_months(before_month, branch=branch)
+    print(msg)
+    return 0 if success else 1
+
+def reconcile(path, out_path='reconciliation.zip'):
+    import reconcile as reconcile_module
+    result, err = reconcile_module.reconcile(path)
+    if err:
+        print(err)
+        return 1
+    if result['stats']['header']:
+        print(f"Skipped header row: {', '.join(result['stats']['header'])}")
+    print(result['summary'].to_string(index=False))
+    with open(out_path, 'wb') as f:
+        f.write(reconcile_module.to_zip(result))
+    print(f"Details written to {out_path} ({result['stats']['elapsed_s']} s)")
+    return 0
+
+COMMANDS = {
+    'compact': compact,
+    'migrate-sqlite': migrate_sqlite,
+    'import-barcodes': import_barcodes,
+    'rebuild-counts': rebuild_counts,
+    'migrate-partitioned': migrate_partitioned,
+    'archive': archive,
+    'reconcile': reconcile,
+}
+
+def main(argv):
+    if len(argv) < 2 or argv[1] not in COMMANDS:
+        print(__doc__.strip())
+        return 2
+    return COMMANDS[argv[1]](*argv[2:])
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
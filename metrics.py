@@ -0,0 +1,281 @@
+"""
+In-process metrics registry for the hot paths (db.py calls, camera decode
+stages, image writes, Streamlit reruns).
+
+Recording never takes a lock: each thread writes into its own shard and
+readers merge the shards. Shards of threads that have exited (Streamlit
+runs every rerun on a fresh thread) are folded into a retired total when
+the registry is read, so memory stays bounded.
+
+Export as Prometheus text with render_prometheus(), serve it with
+start_http_server(port) or write it periodically with start_file_dumper().
+"""
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+# Latency buckets in milliseconds
+MS_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+# Row-count buckets for rows read/written per call
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+class _Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other):
+        for i, c in enumerate(other.counts):
+            self.counts[i] += c
+        self.sum += other.sum
+        self.count += other.count
+
+    def copy(self):
+        h = _Histogram(self.buckets)
+        h.merge(self)
+        return h
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th observation
+        if not self.count:
+            return None
+        target = q * self.count
+        running = 0
+        for i, c in enumerate(self.counts):
+            running += c
+            if running >= target:
+                return self.buckets[i] if i < len(self.buckets) else float('inf')
+        return float('inf')
+
+class _Shard:
+    __slots__ = ('thread', 'counters', 'histograms')
+
+    def __init__(self, thread):
+        self.thread = thread
+        self.counters = {}
+        self.histograms = {}
+
+class Registry:
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []
+        self._shards_lock = threading.Lock()  # only taken on a thread's first record and on reads
+        self._retired = _Shard(None)
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = _Shard(threading.current_thread())
+            with self._shards_lock:
+                self._shards.append(shard)
+        return shard
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        counters = self._shard().counters
+        counters[key] = counters.get(key, 0) + value
+
+    def observe(self, name, value, buckets=MS_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histograms = self._shard().histograms
+        hist = histograms.get(key)
+        if hist is None:
+            hist = histograms[key] = _Histogram(buckets)
+        hist.observe(value)
+
+    def collect(self):
+        """Merged view: (counters, histograms) keyed by (name, labels)."""
+        with self._shards_lock:
+            live = []
+            for shard in self._shards:
+                if shard.thread.is_alive():
+                    live.append(shard)
+                else:
+                    self._fold(self._retired, shard)
+            self._shards = live
+            counters = dict(self._retired.counters)
+            histograms = {k: h.copy() for k, h in self._retired.histograms.items()}
+            for shard in live:
+                self._fold_into(counters, histograms, shard)
+        return counters, histograms
+
+    @staticmethod
+    def _fold_into(counters, histograms, shard):
+        # list() copies guard against the owning thread adding keys meanwhile
+        for key, value in list(shard.counters.items()):
+            counters[key] = counters.get(key, 0) + value
+        for key, hist in list(shard.histograms.items()):
+            if key in histograms:
+                histograms[key].merge(hist)
+            else:
+                histograms[key] = hist.copy()
+
+    def _fold(self, target, shard):
+        self._fold_into(target.counters, target.histograms, shard)
+
+    def reset(self):
+        with self._shards_lock:
+            self._shards = []
+            self._retired = _Shard(None)
+        self._local = threading.local()
+
+REGISTRY = Registry()
+inc = REGISTRY.inc
+observe = REGISTRY.observe
+
+# Gauges hold a last-written value (queue depths, busy workers); a plain dict
+# store is atomic under the GIL, so they need no shards
+_gauges = {}
+
+def set_gauge(name, value, **labels):
+    _gauges[(name, tuple(sorted(labels.items())))] = value
+
+@contextmanager
+def timer(name, **labels):
+    """Records the block's wall time in milliseconds into histogram `name`."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, (time.perf_counter() - t0) * 1000, **labels)
+
+_instrumented = threading.local()
+
+def instrument(name, histogram='db_call_ms', counter='db_calls_total'):
+    """
+    Decorator: call count and latency histogram labelled fn=name.
+    Only the outermost instrumented call on a thread is recorded, so
+    insert_scan -> insert_scan_batch_results counts once, as insert_scan.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if getattr(_instrumented, 'active', False):
+                return fn(*args, **kwargs)
+            _instrumented.active = True
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _instrumented.active = False
+                observe(histogram, (time.perf_counter() - t0) * 1000, fn=name)
+                inc(counter, fn=name)
+        return wrapper
+    return decorator
+
+def record_rows(direction, count, source):
+    """Rows read or written by one storage call: running total plus per-call distribution."""
+    inc(f'db_rows_{direction}_total', count, source=source)
+    observe(f'db_rows_{direction}_per_call', count, buckets=ROW_BUCKETS, source=source)
+
+def _labels_text(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    body = ",".join(f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+                    for k, v in pairs)
+    return "{" + body + "}"
+
+def render_prometheus():
+    """Prometheus text exposition format (version 0.0.4)."""
+    counters, histograms = REGISTRY.collect()
+    lines = []
+    seen = set()
+    for (name, labels), value in sorted(counters.items()):
+        if name not in seen:
+            lines.append(f"# TYPE {name} counter")
+            seen.add(name)
+        lines.append(f"{name}{_labels_text(labels)} {value}")
+    for (name, labels), value in sorted(_gauges.copy().items()):
+        if name not in seen:
+            lines.append(f"# TYPE {name} gauge")
+            seen.add(name)
+        lines.append(f"{name}{_labels_text(labels)} {value}")
+    for (name, labels), hist in sorted(histograms.items()):
+        if name not in seen:
+            lines.append(f"# TYPE {name} histogram")
+            seen.add(name)
+        running = 0
+        for bound, c in zip(list(hist.buckets) + ['+Inf'], hist.counts):
+            running += c
+            lines.append(f"{name}_bucket{_labels_text(labels, [('le', bound)])} {running}")
+        lines.append(f"{name}_sum{_labels_text(labels)} {hist.sum}")
+        lines.append(f"{name}_count{_labels_text(labels)} {hist.count}")
+    return "\n".join(lines) + "\n"
+
+def summary_rows():
+    """One row per histogram series, for the admin metrics panel."""
+    _, histograms = REGISTRY.collect()
+    rows = []
+    for (name, labels), hist in sorted(histograms.items()):
+        rows.append({
+            'metric': name,
+            'labels': ", ".join(f"{k}={v}" for k, v in labels),
+            'count': hist.count,
+            'mean': round(hist.sum / hist.count, 3) if hist.count else None,
+            'p50<=': hist.quantile(0.5),
+            'p95<=': hist.quantile(0.95),
+            'p99<=': hist.quantile(0.99),
+        })
+    return rows
+
+def counter_rows():
+    """Counters and gauges, for the admin metrics panel."""
+    counters, _ = REGISTRY.collect()
+    counters.update(_gauges.copy())
+    return [{'metric': name, 'labels': ", ".join(f"{k}={v}" for k, v in labels), 'value': value}
+            for (name, labels), value in sorted(counters.items())]
+
+def dump(path):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(render_prometheus())
+    os.replace(tmp_path, path)
+
+def start_file_dumper(path, interval_s=15):
+    """Rewrites `path` with the current metrics every interval_s (e.g. for node_exporter's textfile collector)."""
+    def loop():
+        while True:
+            time.sleep(interval_s)
+            try:
+                dump(path)
+            except OSError:
+                pass
+    thread = threading.Thread(target=loop, name="metrics-dump", daemon=True)
+    thread.start()
+    return thread
+
+def start_http_server(port, host='127.0.0.1'):
+    """Serves GET /metrics on a background thread; loopback only unless host says otherwise."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = render_prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
@@ -0,0 +1,209 @@
+"""
+Reconciliation of the scans table against an expected-stock list (ERP export).
+
+The expected file (CSV, columns barcode + branch, millions of rows) is read
+in chunks. Each chunk is hash-joined against the scans table through a
+pandas Index built once from the scanned barcodes (Index.get_indexer), and a
+boolean array marks which scans some expected row has claimed. Per branch
+that gives:
+
+    matched           expected here, scanned here
+    missing           expected here, not scanned anywhere
+    wrong_branch      expected here, scanned at another branch
+    from_other_branch scanned here, expected at another branch
+    unexpected        scanned here, on nobody's expected list
+
+Only branches that appear in the expected file get 'unexpected' rows, so a
+list for one region does not flag every other region's scans.
+"""
+import csv
+import io
+import time
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+import db
+from bulk_import import BARCODE_HEADER_KEYS, looks_like_header, match_column, normalize
+
+DEFAULT_CHUNK_SIZE = 500_000
+BRANCH_HEADER_KEYS = ('branch', 'location', 'store', 'site', 'shop', 'warehouse')
+SUMMARY_COLUMNS = ['expected', 'scanned', 'matched', 'missing', 'wrong_branch', 'from_other_branch', 'unexpected']
+
+def _open_text(source):
+    if isinstance(source, (bytes, bytearray)):
+        return io.StringIO(bytes(source).decode('utf-8-sig', errors='replace'))
+    if hasattr(source, 'read'):
+        data = source.read()
+        return io.StringIO(data.decode('utf-8-sig', errors='replace') if isinstance(data, bytes) else data)
+    return open(source, newline='', encoding='utf-8-sig', errors='replace')
+
+def read_header(head, delimiter, has_header=None):
+    """
+    Returns (barcode column, branch column, header row or None) for the start of
+    an expected file. has_header=None detects the header the same way as
+    bulk_import.parse_barcodes; a column it does not name is the first other one.
+    """
+    rows = [r for r in csv.reader(io.StringIO(head), delimiter=delimiter) if r]
+    if not rows:
+        return 0, 1, None
+    branch_col = match_column(rows[0], BRANCH_HEADER_KEYS)
+    # 'branch_code' contains 'code', so the barcode column is looked for among the others
+    barcode_col = match_column(rows[0], BARCODE_HEADER_KEYS, exclude={branch_col})
+    if has_header is None:
+        has_header = (barcode_col is not None or branch_col is not None) and looks_like_header(rows)
+    if not has_header:
+        return 0, 1, None
+    if barcode_col is None:
+        barcode_col = 0 if branch_col != 0 else 1
+    if branch_col is None:
+        branch_col = 1 if barcode_col == 0 else 0
+    return barcode_col, branch_col, rows[0]
+
+def read_expected(source, chunk_size=DEFAULT_CHUNK_SIZE, has_header=None, info=None):
+    """
+    Yields DataFrames with 'barcode' and 'branch_code' (normalized, blanks dropped).
+    source: a path, bytes, or a file-like object (e.g. a Streamlit upload).
+    A header naming the columns is used if present (see read_header); otherwise
+    column 0 is the barcode and column 1 the branch. The skipped header row, if
+    any, is stored in info['header'].
+    """
+    f = _open_text(source)
+    try:
+        head = f.read(4096)
+        f.seek(0)
+        try:
+            delimiter = csv.Sniffer().sniff(head, delimiters=',;\t|').delimiter
+        except csv.Error:
+            delimiter = ','
+        barcode_col, branch_col, header = read_header(head, delimiter, has_header)
+        skip = 1 if header else 0
+        if info is not None:
+            info['header'] = header
+        reader = pd.read_csv(f, sep=delimiter, header=None, skiprows=skip, usecols=[barcode_col, branch_col],
+                             dtype=object, keep_default_na=False, chunksize=chunk_size)
+        for chunk in reader:
+            # Plain str methods in one pass beat chained .str calls by several times here;
+            # branches repeat, so only their distinct values are cleaned
+            codes, branches = pd.factorize(chunk[branch_col].to_numpy())
+            branches = np.array([str(v).strip().upper() for v in branches], dtype=object)
+            frame = pd.DataFrame({'barcode': [normalize(v) for v in chunk[barcode_col]],
+                                  'branch_code': branches[codes]}, dtype=object)
+            yield frame[(frame['barcode'] != '') & (frame['branch_code'] != '')]
+    finally:
+        f.close()
+
+def reconcile(expected_source, scans=None, chunk_size=DEFAULT_CHUNK_SIZE, progress=None, has_header=None):
+    """
+    scans: a DataFrame with barcode/branch_code (+ created_by/created_date), default db.get_all_scans().
+    progress(rows_done) is called after every chunk; has_header as in read_expected.
+    Returns (result, error); result has 'summary' (one row per branch_code) and the
+    detail frames 'missing', 'wrong_branch' (expected_branch vs scanned_branch) and 'unexpected'.
+    """
+    try:
+        started = time.perf_counter()
+        if scans is None:
+            scans, err = db.get_all_scans()
+            if err and scans is None:
+                return None, err
+        if scans.empty:
+            scans = pd.DataFrame(columns=['barcode', 'branch_code', 'created_by', 'created_date'])
+        # Plain object arrays on both sides: mixing pandas' str dtype with object
+        # values makes every get_indexer call convert the whole chunk first
+        scan_barcodes = pd.Index(scans['barcode'].astype(str).to_numpy(dtype=object), dtype=object)
+        if not scan_barcodes.is_unique:
+            keep = ~scan_barcodes.duplicated()
+            scans, scan_barcodes = scans[keep], scan_barcodes[keep]
+        scan_branches = scans['branch_code'].astype(str).to_numpy(dtype=object)
+        claimed = np.zeros(len(scans), dtype=bool)
+
+        expected_counts, matched_counts = [], []
+        missing, wrong = [], []
+        rows = duplicates = 0
+        info = {}
+        for chunk in read_expected(expected_source, chunk_size, has_header=has_header, info=info):
+            rows += len(chunk)
+            positions = scan_barcodes.get_indexer(chunk['barcode'].to_numpy())
+            # A barcode listed twice in the file (within or across chunks) counts once
+            repeated = chunk['barcode'].duplicated().to_numpy(copy=True)
+            found = positions >= 0
+            repeated[found] |= claimed[positions[found]]
+            duplicates += int(repeated.sum())
+            chunk, positions = chunk[~repeated], positions[~repeated]
+
+            found = positions >= 0
+            claimed[positions[found]] = True
+            expected_counts.append(chunk['branch_code'].value_counts())
+            missing.append(chunk[~found])
+            hits = chunk[found].assign(scanned_branch=scan_branches[positions[found]])
+            same = (hits['branch_code'] == hits['scanned_branch']).to_numpy()
+            matched_counts.append(hits.loc[same, 'branch_code'].value_counts())
+            wrong.append(hits[~same])
+            if progress:
+                progress(rows)
+
+        missing = pd.concat(missing, ignore_index=True) if missing else pd.DataFrame(columns=['barcode', 'branch_code'])
+        # Unscanned barcodes repeated across chunks are only visible once all chunks are in
+        before = len(missing)
+        missing = missing.drop_duplicates('barcode')
+        duplicates += before - len(missing)
+
+        wrong = pd.concat(wrong, ignore_index=True) if wrong else \
+            pd.DataFrame(columns=['barcode', 'branch_code', 'scanned_branch'])
+        wrong = wrong.rename(columns={'branch_code': 'expected_branch'})[['barcode', 'expected_branch', 'scanned_branch']]
+
+        def total(counts):
+            return pd.concat(counts).groupby(level=0).sum() if counts else pd.Series(dtype=int)
+
+        expected_total = total(expected_counts)
+        in_scope = pd.Series(scan_branches).isin(set(expected_total.index)).to_numpy()
+        unexpected_mask = ~claimed & in_scope
+        unexpected = scans[unexpected_mask]
+        unexpected = unexpected[[c for c in ('barcode', 'branch_code', 'created_by', 'created_date', 'scan_id')
+                                 if c in unexpected.columns]].reset_index(drop=True)
+
+        summary = pd.DataFrame({
+            'expected': expected_total,
+            'scanned': pd.Series(scan_branches[in_scope]).value_counts(),
+            'matched': total(matched_counts),
+            'missing': missing['branch_code'].value_counts(),
+            'wrong_branch': wrong['expected_branch'].value_counts(),
+            'from_other_branch': wrong['scanned_branch'].value_counts(),
+            'unexpected': pd.Series(scan_branches[unexpected_mask]).value_counts(),
+        }, columns=SUMMARY_COLUMNS).fillna(0).astype(int)
+        summary.index.name = 'branch_code'
+        summary = summary.sort_index().reset_index()
+
+        return {
+            'summary': summary,
+            'missing': missing.reset_index(drop=True),
+            'wrong_branch': wrong.reset_index(drop=True),
+            'unexpected': unexpected,
+            'stats': {'expected_rows': rows, 'duplicate_expected': duplicates, 'scans': len(scans),
+                      'header': info.get('header'), 'elapsed_s': round(time.perf_counter() - started, 2)},
+        }, None
+    except Exception as e:
+        return None, str(e)
+
+def for_branch(result, branch):
+    """The detail frames restricted to one branch (as seen from that branch)."""
+    return {
+        'missing': result['missing'][result['missing']['branch_code'] == branch],
+        'wrong_branch': result['wrong_branch'][result['wrong_branch']['expected_branch'] == branch],
+        'from_other_branch': result['wrong_branch'][result['wrong_branch']['scanned_branch'] == branch],
+        'unexpected': result['unexpected'][result['unexpected']['branch_code'].astype(str) == branch],
+    }
+
+def to_zip(result, branch=None):
+    """Summary and detail frames as CSV files in one zip archive (bytes), optionally for one branch."""
+    if branch:
+        frames = dict(for_branch(result, branch),
+                      summary=result['summary'][result['summary']['branch_code'] == branch])
+    else:
+        frames = {name: result[name] for name in ('summary', 'missing', 'wrong_branch', 'unexpected')}
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for name, frame in frames.items():
+            zf.writestr(f"{name}.csv", frame.to_csv(index=False))
+    return buf.getvalue()
@@ -0,0 +1,161 @@
+"""
+Shared, typed in-memory view of the scans table for the admin screens.
+
+Rows are held with compact dtypes (int32 ids, categorical branch/user, real
+datetimes) and kept current by tailing scans.csv and scans.deleted, so an
+admin rerun costs a stat() plus a filter over memory rather than a full CSV
+parse. query() filters, sorts and returns one page.
+"""
+import os
+import threading
+
+import pandas as pd
+
+import columnar
+import csv_tail
+
+SORTABLE_COLUMNS = ('created_date', 'scan_id', 'barcode', 'branch_code', 'created_by')
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+def _typed(df):
+    df = df[['scan_id', 'barcode', 'created_by', 'branch_code', 'created_date']].copy()
+    df = df.dropna(subset=['scan_id'])
+    df['scan_id'] = df['scan_id'].astype('int32')
+    df['barcode'] = df['barcode'].astype(str)
+    df['created_by'] = df['created_by'].astype('category')
+    df['branch_code'] = df['branch_code'].astype('category')
+    df['created_date'] = pd.to_datetime(df['created_date'], format=DATE_FORMAT, errors='coerce')
+    return df
+
+def _concat_typed(old, new):
+    for col in ('created_by', 'branch_code'):
+        # Same categories on both sides so concat keeps the categorical dtype
+        cats = old[col].cat.categories.union(new[col].cat.categories)
+        old = old.assign(**{col: old[col].cat.set_categories(cats)})
+        new = new.assign(**{col: new[col].cat.set_categories(cats)})
+    return pd.concat([old, new], ignore_index=True)
+
+def filter_scans(df, branch=None, user=None, date_from=None, date_to=None, barcode_prefix=None):
+    """Applies the admin filters to a typed frame, keeping its order."""
+    mask = pd.Series(True, index=df.index)
+    if branch:
+        branches = [branch] if isinstance(branch, str) else list(branch)
+        mask &= df['branch_code'].isin(branches)
+    if user:
+        mask &= df['created_by'] == user
+    if date_from is not None:
+        mask &= df['created_date'] >= pd.Timestamp(date_from)
+    if date_to is not None:
+        # A bare date means "up to the end of that day"
+        end = pd.Timestamp(date_to)
+        if end == end.normalize():
+            end += pd.Timedelta(days=1)
+        mask &= df['created_date'] < end
+    if barcode_prefix:
+        mask &= df['barcode'].str.startswith(barcode_prefix)
+    return df[mask]
+
+class ScansReadModel:
+    def __init__(self, scans_file, tombstone_file, snapshot_dir=None):
+        self.snapshot_dir = snapshot_dir
+        self.scans = csv_tail.CsvTail(scans_file)
+        self.tombstones = csv_tail.CsvTail(tombstone_file)
+        self._df = None
+        self._new_rows = []
+        self._deleted = set()
+        self._sorted = {}  # (sort_by, ascending) -> frame sorted that way
+        self._lock = threading.Lock()
+
+    def _rebuild(self):
+        # Retry if a compaction swaps the snapshot while we are loading
+        for _ in range(3):
+            self.scans = csv_tail.CsvTail(self.scans.path)
+            self.tombstones = csv_tail.CsvTail(self.tombstones.path)
+            version = columnar.current_version(self.snapshot_dir) if self.snapshot_dir else None
+            df = self.scans.read_all(dtype={'barcode': str})
+            if df is None:
+                df = pd.DataFrame(columns=columnar.COLUMNS)
+            self._df = _typed(df)
+            if version is not None:
+                # Snapshot columns are already typed; only the ids need narrowing
+                base = columnar.read_snapshot(root=self.snapshot_dir, version=version)
+                base['scan_id'] = base['scan_id'].astype('int32')
+                merged = _concat_typed(base, self._df)
+                self._df = merged.drop_duplicates(subset='scan_id', keep='last')
+            if version is None or columnar.current_version(self.snapshot_dir) == version:
+                break
+        self._new_rows = []
+        self._deleted = set()
+        self._sorted = {}
+        self._apply_tombstones(self.tombstones.read_new_rows(self.tombstones.stat()))
+
+    def _apply_tombstones(self, rows):
+        # Same rule as db._read_tombstones: rows torn by a crashed writer are skipped
+        ids = {int(row[0]) for row in rows if len(row) >= 2 and row[0].isdigit()}
+        if ids:
+            self._deleted |= ids
+
+    def refresh(self):
+        with self._lock:
+            scans_st, tomb_st = self.scans.stat(), self.tombstones.stat()
+            if self._df is None or self.scans.replaced(scans_st) or self.tombstones.replaced(tomb_st):
+                self._rebuild()
+                return
+            if not self.scans.unchanged(scans_st):
+                rows = self.scans.read_new_rows(scans_st)
+                if rows:
+                    self._new_rows.append(pd.DataFrame(rows, columns=self.scans.columns))
+            if not self.tombstones.unchanged(tomb_st):
+                self._apply_tombstones(self.tombstones.read_new_rows(tomb_st))
+
+    def _consolidate(self):
+        # Fold appended rows and tombstones into the typed frame; only runs after changes
+        changed = False
+        if self._new_rows:
+            self._df = _concat_typed(self._df, _typed(pd.concat(self._new_rows, ignore_index=True)))
+            self._new_rows = []
+            changed = True
+        if self._deleted:
+            self._df = self._df[~self._df['scan_id'].isin(self._deleted)]
+            self._deleted = set()
+            changed = True
+        if changed:
+            self._sorted = {}
+
+    def frame(self):
+        """The full live table (typed). Treat it as read-only."""
+        self.refresh()
+        with self._lock:
+            self._consolidate()
+            return self._df
+
+    def query(self, page=1, page_size=50, branch=None, user=None, date_from=None, date_to=None,
+              barcode_prefix=None, sort_by='created_date', ascending=False):
+        """Returns (page_df, total_matching_rows)."""
+        if sort_by not in SORTABLE_COLUMNS:
+            raise ValueError(f"Cannot sort by {sort_by}")
+        self.refresh()
+        with self._lock:
+            self._consolidate()
+            key = (sort_by, ascending)
+            df = self._sorted.get(key)
+            if df is None:
+                # Sorted once per data version; filters below keep the order
+                df = self._sorted[key] = self._df.sort_values(sort_by, ascending=ascending, kind='stable')
+
+        matched = filter_scans(df, branch=branch, user=user, date_from=date_from, date_to=date_to,
+                               barcode_prefix=barcode_prefix)
+        start = max(page - 1, 0) * page_size
+        return matched.iloc[start:start + page_size], len(matched)
+
+_models = {}
+_models_lock = threading.Lock()
+
+def get_read_model(scans_file, tombstone_file, snapshot_dir=None):
+    """Returns the shared read model for a scans file, creating it on first use."""
+    key = (os.path.abspath(scans_file), os.path.abspath(tombstone_file), snapshot_dir)
+    with _models_lock:
+        model = _models.get(key)
+        if model is None:
+            model = _models[key] = ScansReadModel(scans_file, tombstone_file, snapshot_dir)
+        return model
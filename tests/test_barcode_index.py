@@ -0,0 +1,19 @@
+import pytest
+
+pytest.importorskip('pandas')
+
+import barcode_index
+
+HEADER = 'scan_id,barcode,created_by,branch_code,created_date\n'
+
+def test_malformed_scan_ids_are_skipped(tmp_path):
+    scans = tmp_path / 'scans.csv'
+    scans.write_text(HEADER + '1,A,u,BR1,2024-01-01 00:00:00\nx1,BAD,u,BR1,2024\n')
+    index = barcode_index.BarcodeIndex(str(scans), str(tmp_path / 'scans.deleted'))
+    assert index.contains('A') and not index.contains('BAD')
+
+    # Appended after the first load, so these go through the tail instead of the bulk read
+    with open(scans, 'a') as f:
+        f.write('2,C,u,BR1,2024-01-01 00:00:00\n3?,D,u,BR1,x\n4,E,u,BR1,2024-01-01 00:00:00\n')
+    assert index.contains('C') and index.contains('E')
+    assert not index.contains('D')
@@ -0,0 +1,19 @@
+import pytest
+
+pytest.importorskip('numpy')
+
+import bench
+
+@pytest.mark.parametrize('result, error', [
+    ((False, None), None),                         # check_duplicate_barcode: not a duplicate
+    ((None, "Invalid credentials"), "Invalid credentials"),
+    ((True, "Successfully inserted 5 records."), None),
+    ((False, "ID not found"), "ID not found"),
+    ((None, 0, "Cannot sort by x"), "Cannot sort by x"),
+])
+def test_call_error(result, error):
+    assert bench.call_error(result) == error
+
+def test_failing_calls_are_counted():
+    stats = bench.summarize(*bench.timed(lambda i: (None, "locked"), 5))
+    assert stats['errors'] == 5 and stats['first_error'] == "locked"
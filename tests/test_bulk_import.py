@@ -0,0 +1,51 @@
+import pytest
+
+pytest.importorskip('pandas')
+
+import bulk_import
+import manage
+import reconcile
+
+@pytest.mark.parametrize('data, codes', [
+    (b'QRCODE-0001\nBAT-0002\nBAT-0003\n', ['QRCODE-0001', 'BAT-0002', 'BAT-0003']),
+    (b'BEAN0001\n7788\n', ['BEAN0001', '7788']),
+    (b'code\ncode\nX1\n', ['code', 'code', 'X1']),
+])
+def test_barcodes_that_look_like_a_header_are_kept(data, codes):
+    assert bulk_import.parse_barcodes(data) == (codes, None)
+
+def test_header_row_is_detected_and_returned():
+    assert bulk_import.parse_barcodes(b'Barcode\n123\n456\n') == (['123', '456'], ['Barcode'])
+    assert bulk_import.parse_barcodes(b'qty;Serial Number\n1;A1\n') == (['A1'], ['qty', 'Serial Number'])
+
+def test_has_header_forces_either_way():
+    assert bulk_import.parse_barcodes(b'BEAN0001\n7788\n', has_header=True) == (['7788'], ['BEAN0001'])
+    assert bulk_import.parse_barcodes(b'Barcode\n123\n', has_header=False) == (['Barcode', '123'], None)
+
+def test_reconcile_header_uses_the_same_rule():
+    assert reconcile.read_header('barcode,branch\n123,BR1\n', ',') == (0, 1, ['barcode', 'branch'])
+    assert reconcile.read_header('CODE-1,BR1\n123,BR1\n', ',') == (0, 1, None)
+
+@pytest.fixture
+def imported(monkeypatch):
+    calls = []
+    def fake_import(codes, username, branch, header=None):
+        calls.append((codes, header))
+        return {'rows': len(codes), 'inserted': len(codes), 'header': header, 'already_in_db': 0,
+                'in_file_duplicates': 0, 'pending_duplicates': 0, 'blank': 0, 'failed': 0}, None
+    monkeypatch.setattr(bulk_import, 'import_barcodes', fake_import)
+    return calls
+
+def test_manage_import_keeps_first_row_without_confirmation(tmp_path, imported, capsys):
+    path = tmp_path / 'list.csv'
+    path.write_bytes(b'Barcode\n123\n')
+    assert manage.import_barcodes(str(path), 'alice', 'BR1') == 0
+    assert imported == [(['Barcode', '123'], None)]
+    assert "Importing first row 'Barcode'" in capsys.readouterr().out
+
+def test_manage_import_header_flag_skips_and_reports(tmp_path, imported, capsys):
+    path = tmp_path / 'list.csv'
+    path.write_bytes(b'Barcode\n123\n')
+    assert manage.import_barcodes(str(path), 'alice', 'BR1', '--header') == 0
+    assert imported == [(['123'], ['Barcode'])]
+    assert "Skipped header row 'Barcode'" in capsys.readouterr().out
@@ -0,0 +1,31 @@
+import os
+
+import pytest
+
+pd = pytest.importorskip('pandas')
+
+import columnar
+
+def frame(ids):
+    return pd.DataFrame({'scan_id': ids, 'barcode': [f"B{i}" for i in ids], 'created_by': 'alice',
+                         'branch_code': 'BR1', 'created_date': '2024-05-01 10:00:00'})
+
+def test_previous_version_survives_one_write(tmp_path):
+    root = str(tmp_path / 'snap')
+    first = columnar.write_snapshot(frame([1, 2]), root=root)
+    second = columnar.write_snapshot(frame([1, 2, 3]), root=root)
+
+    # A reader that read CURRENT just before the swap can still load what it points to
+    assert columnar.read_snapshot(root=root, version=first)['scan_id'].tolist() == [1, 2]
+    assert columnar.read_snapshot(root=root)['scan_id'].tolist() == [1, 2, 3]
+
+    columnar.write_snapshot(frame([1]), root=root)
+    assert sorted(n for n in os.listdir(root) if n.startswith('v')) == [second, 'v000003']
+
+def test_read_retries_when_its_version_is_gone(tmp_path, monkeypatch):
+    root = str(tmp_path / 'snap')
+    columnar.write_snapshot(frame([1]), root=root)
+    columnar.write_snapshot(frame([1, 2]), root=root)
+    versions = iter(['v000001-gone', 'v000002'])
+    monkeypatch.setattr(columnar, 'current_version', lambda root: next(versions))
+    assert columnar.read_snapshot(['scan_id'], root=root)['scan_id'].tolist() == [1, 2]
@@ -0,0 +1,34 @@
+import time
+
+import pytest
+
+pytest.importorskip('cv2')
+
+import decode_pool
+from test_decoder import qr_sheet
+
+import cv2
+
+def test_result_loop_error_fails_the_job_and_restarts_the_worker():
+    image_bytes = cv2.imencode('.png', qr_sheet(['POOL-01'], 400, 300, [200], columns=1))[1].tobytes()
+    pool = decode_pool.DecodePool(workers=1, job_timeout=60)
+    try:
+        assert pool.decode(image_bytes).data == 'POOL-01'
+
+        finish = pool._finish
+        def broken(worker, result):
+            pool._finish = finish
+            raise ValueError("bad message")
+        pool._finish = broken
+
+        started = time.monotonic()
+        result = pool.submit(image_bytes).result(timeout=30)
+        assert result.retryable and 'bad message' in result.debug[0]
+        assert time.monotonic() - started < 30
+        # The job is answered first, its worker replaced right after
+        while pool.stats()['restarts'] == 0 and time.monotonic() - started < 30:
+            time.sleep(0.01)
+        assert pool.stats()['restarts'] == 1
+        assert pool.decode(image_bytes).data == 'POOL-01'
+    finally:
+        pool.shutdown()
@@ -0,0 +1,47 @@
+import pytest
+
+cv2 = pytest.importorskip('cv2')
+np = pytest.importorskip('numpy')
+
+import decoder
+
+def qr_sheet(payloads, width, height, sides, columns=5):
+    """White BGR sheet with one QR code per payload, laid out on a grid."""
+    canvas = np.full((height, width), 255, np.uint8)
+    rows = (len(payloads) + columns - 1) // columns
+    cell_w, cell_h = width // columns, height // rows
+    for i, (payload, side) in enumerate(zip(payloads, sides)):
+        row, col = divmod(i, columns)
+        code = cv2.resize(cv2.QRCodeEncoder.create().encode(payload), (side, side),
+                          interpolation=cv2.INTER_NEAREST)
+        y, x = row * cell_h + (cell_h - side) // 2, col * cell_w + (cell_w - side) // 2
+        canvas[y:y + side, x:x + side] = code
+    return cv2.cvtColor(canvas, cv2.COLOR_GRAY2BGR)
+
+FULL_RESOLUTION = ('gray_full', 'roi_center', 'color_opencv')
+
+def test_large_image_skips_full_resolution_rungs():
+    payloads = [f"BUDGET-{i:02d}" for i in range(15)]
+    img = qr_sheet(payloads, 4000, 3000, [150] * len(payloads))
+    engine = decoder.DecoderEngine(budget_ms=250)
+    warm = engine.warm_up(img, multi=True)
+    assert [name for name, _ in warm.timings] == ['downscale', 'adaptive_threshold', 'rotate']
+
+    result = engine.decode_image(img, multi=True)
+    ran = [name for name, _ in result.timings]
+    # Full-resolution multi decode of this sheet takes seconds: those rungs are
+    # skipped on their estimate, never started and then found to overrun
+    assert ran[0] == 'downscale'
+    assert not set(ran) & set(FULL_RESOLUTION)
+    assert result.budget_exhausted
+
+def test_multi_merges_codes_across_rungs():
+    # Three labels readable after downscaling, twelve that need full resolution
+    payloads = [f"SHELF-{i:02d}" for i in range(15)]
+    img = qr_sheet(payloads, 4000, 3000, [500] * 3 + [130] * 12)
+    engine = decoder.DecoderEngine(ladder=('downscale', 'gray_full'), budget_ms=None)
+    result = engine.decode_image(img, multi=True)
+
+    assert result.strategy == 'downscale'
+    assert sorted(data for data, _ in result.codes) == payloads
+    assert len(set(result.codes)) == len(result.codes)
@@ -0,0 +1,55 @@
+import threading
+
+import pytest
+
+pytest.importorskip('pandas')
+
+import db
+import group_commit
+
+@pytest.fixture
+def writer(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    if db.DB_BACKEND == 'csv':
+        monkeypatch.setattr(db, 'SCANS_STORAGE', 'csv')
+    db.init_db()
+    writer = group_commit.GroupCommitWriter(linger=0.02)
+    yield writer
+    writer.close()
+
+def test_concurrent_inserts_of_one_barcode_are_acknowledged_once(writer):
+    sessions = 16
+    barrier = threading.Barrier(sessions)
+    answers = [None] * sessions
+
+    def session(n):
+        barrier.wait()
+        scans = [{'barcode': 'SHARED', 'username': f"u{n}", 'branch': 'BR1'},
+                 {'barcode': f"OWN{n}", 'username': f"u{n}", 'branch': 'BR1'}]
+        answers[n] = writer.insert(scans, timeout=30)
+
+    threads = [threading.Thread(target=session, args=(n,)) for n in range(sessions)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    shared = []
+    for results, err in answers:
+        assert err is None
+        assert results[1]['status'] == 'inserted'
+        shared.append(results[0])
+    statuses = [r['status'] for r in shared]
+    assert statuses.count('inserted') == 1
+    assert set(statuses) <= {'inserted', group_commit.DUPLICATE_CONCURRENT, 'duplicate_db'}
+    # Every session is pointed at the one row that was kept
+    assert len({r['scan_id'] for r in shared}) == 1
+
+    df, err = db.get_all_scans()
+    assert (df['barcode'].astype(str) == 'SHARED').sum() == 1
+    assert len(df) == sessions + 1
+
+def test_repeat_within_own_batch_stays_duplicate_batch(writer):
+    results, err = writer.insert([{'barcode': 'A', 'username': 'u', 'branch': 'BR1'}] * 2)
+    assert [r['status'] for r in results] == ['inserted', 'duplicate_batch']
+    assert group_commit.summarize(results) == {'inserted': 1, 'duplicate_batch': 1}
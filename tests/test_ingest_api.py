@@ -0,0 +1,27 @@
+import asyncio
+
+import pytest
+
+import ingest_api
+
+def read(raw):
+    async def run():
+        reader = asyncio.StreamReader()
+        reader.feed_data(raw)
+        reader.feed_eof()
+        return await ingest_api.read_request(reader)
+    return asyncio.run(run())
+
+@pytest.mark.parametrize('length', ['-5', 'abc'])
+def test_bad_content_length_is_a_400(length):
+    with pytest.raises(ingest_api.HttpError) as e:
+        read(f"POST /scans HTTP/1.1\r\nContent-Length: {length}\r\n\r\n".encode())
+    assert e.value.status == 400
+
+def test_metrics_needs_authentication():
+    server = ingest_api.IngestServer(writer=object())
+    request = read(b"GET /metrics HTTP/1.1\r\n\r\n")
+    with pytest.raises(ingest_api.HttpError) as e:
+        asyncio.run(server.dispatch(request, {}))
+    assert e.value.status == 401
+    assert server.host == '127.0.0.1'
@@ -0,0 +1,100 @@
+import pytest
+
+pytest.importorskip('pandas')
+
+import db
+import db_partitioned
+import db_sqlite
+
+BACKENDS = ('csv', 'columnar', 'sqlite', 'partitioned')
+
+@pytest.fixture(params=BACKENDS)
+def store(request, tmp_path, monkeypatch):
+    """A backend module with the db.py API, on empty files in a scratch directory."""
+    monkeypatch.chdir(tmp_path)
+    if request.param in ('csv', 'columnar'):
+        if db.DB_BACKEND != 'csv':
+            pytest.skip(f"db.py serves DB_BACKEND={db.DB_BACKEND}")
+        monkeypatch.setattr(db, 'SCANS_STORAGE', request.param)
+        module = db
+    else:
+        module = db_sqlite if request.param == 'sqlite' else db_partitioned
+    module.init_db()
+    return module
+
+def scan(barcode, branch='BR1', user='alice'):
+    return {'barcode': barcode, 'username': user, 'branch': branch}
+
+def statuses(results):
+    return [r['status'] for r in results]
+
+def live(store):
+    df, err = store.get_all_scans()
+    if df is None or df.empty:
+        return {}
+    return dict(zip(df['barcode'].astype(str), df['scan_id'].astype(int)))
+
+def test_insert_duplicate_delete_reinsert_compact(store):
+    results, err = store.insert_scan_batch_results([scan('A'), scan('B', branch='BR2'), scan('A')])
+    assert err is None
+    assert statuses(results) == ['inserted', 'inserted', 'duplicate_batch']
+    ids = {r['barcode']: r['scan_id'] for r in results[:2]}
+    assert store.check_duplicate_barcode('A') == (True, None)
+
+    results, err = store.insert_scan_batch_results([scan('A'), scan('C')])
+    assert statuses(results) == ['duplicate_db', 'inserted']
+    assert results[0]['scan_id'] == ids['A']
+    ids['C'] = results[1]['scan_id']
+
+    results, err = store.delete_scans([ids['A'], 999999])
+    assert err is None
+    assert statuses(results) == ['deleted', 'not_found']
+    assert store.check_duplicate_barcode('A') == (False, None)
+
+    # A deleted barcode can be scanned again, under a new id
+    results, err = store.insert_scan_batch_results([scan('A')])
+    assert statuses(results) == ['inserted']
+    assert results[0]['scan_id'] > max(ids.values())
+    ids['A'] = results[0]['scan_id']
+    assert live(store) == ids
+
+    success, msg = store.compact_scans()
+    assert success, msg
+    assert live(store) == ids
+    assert store.check_duplicate_barcodes(['A', 'B', 'Z']) == ({'A', 'B'}, None)
+
+    # Compaction drops the deleted row; its id must still not come back
+    results, err = store.insert_scan_batch_results([scan('D')])
+    assert results[0]['scan_id'] > max(ids.values())
+
+    counts, err = store.get_scan_counts()
+    assert err is None
+    assert counts['total'] == 4
+    assert counts['by_branch'] == {'BR1': 3, 'BR2': 1}
+    assert store.get_scan_counts('BR2')[0]['by_user'] == {'alice': 1}
+
+def test_counts_follow_inserts_and_deletes(store):
+    rows = [scan(f"N{i}", branch=f"BR{i % 3}", user=f"u{i % 2}") for i in range(30)]
+    results, err = store.insert_scan_batch_results(rows)
+    store.delete_scans([r['scan_id'] for r in results[::4]])
+    counts, err = store.get_scan_counts()
+
+    success, msg = store.rebuild_scan_counts()
+    assert success, msg
+    assert counts == store.get_scan_counts()[0]
+    assert counts['total'] == 30 - len(results[::4])
+
+def test_torn_tombstone_row_is_ignored(store):
+    if store is db_sqlite:
+        pytest.skip("no tombstone files")
+    results, err = store.insert_scan_batch_results([scan('A'), scan('B')])
+    store.delete_scans([results[0]['scan_id']])
+    if store is db:
+        path = db.SCANS_TOMBSTONE_FILE
+    else:
+        path = db_partitioned._path(db_partitioned.list_partitions()[0], 'scans.deleted')
+    with open(path, 'a') as f:
+        f.write(str(results[1]['scan_id']))  # crash mid-append: no newline, no barcode
+
+    assert set(live(store)) == {'B'}
+    assert store.check_duplicate_barcode('B') == (True, None)
@@ -0,0 +1,73 @@
+"""
+In-memory user directory built from users.csv.
+
+Users are keyed by username with branch lists already split into a tuple
+(display order) and a frozenset (membership checks). The file is parsed once
+and only re-read when its mtime or size changes, so a login burst costs one
+stat() and one dict lookup per attempt.
+"""
+import csv
+import os
+import threading
+from collections import namedtuple
+
+UserRecord = namedtuple('UserRecord', ['username', 'password', 'branches', 'branch_set'])
+
+def _split_branches(branches_str):
+    branches_str = (branches_str or '').strip()
+    if not branches_str or branches_str == 'nan':
+        return ()
+    return tuple(b for b in branches_str.split('|') if b)
+
+class UserDirectory:
+    def __init__(self, path):
+        self.path = path
+        self._users = {}
+        self._signature = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        users = {}
+        with open(self.path, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                username = (row.get('username') or '').strip()
+                if not username:
+                    continue
+                branches = _split_branches(row.get('branches'))
+                users[username] = UserRecord(username, (row.get('password') or '').strip(),
+                                             branches, frozenset(branches))
+        return users
+
+    def refresh(self):
+        """Re-reads users.csv if it changed on disk. Raises FileNotFoundError if it is gone."""
+        st = os.stat(self.path)
+        signature = (st.st_ino, st.st_size, st.st_mtime_ns)
+        if signature == self._signature:
+            return
+        with self._lock:
+            if signature != self._signature:
+                self._users = self._load()
+                self._signature = signature
+
+    def get(self, username):
+        self.refresh()
+        return self._users.get(username)
+
+    def user_has_branch(self, username, branch):
+        user = self.get(username)
+        return user is not None and branch in user.branch_set
+
+    def __len__(self):
+        return len(self._users)
+
+_directories = {}
+_directories_lock = threading.Lock()
+
+def get_directory(path):
+    """Returns the shared directory for a users file, creating it on first use."""
+    key = os.path.abspath(path)
+    with _directories_lock:
+        directory = _directories.get(key)
+        if directory is None:
+            directory = _directories[key] = UserDirectory(path)
+        return directory
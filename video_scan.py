@@ -0,0 +1,164 @@
+"""
+Continuous scanning from a stream of video frames.
+
+A clerk sweeps the camera along a rack instead of taking one photo per
+battery. Frames come from cv2.VideoCapture (a device index or a video file;
+an uploaded recording is the stand-in for a live feed). For each frame:
+
+  - a 32x32 grayscale thumbnail is compared with the last decoded frame and
+    the frame is skipped when the mean difference is below a threshold
+    (camera held still => same codes as last time);
+  - otherwise the frame goes through a short decoder ladder in multi mode;
+  - codes already seen within SEEN_TTL seconds of video time are dropped,
+    so each code is reported once however many frames it stays in view.
+
+Usage:
+    python video_scan.py rack.mp4
+    python video_scan.py 0 --seconds 30          # camera device 0
+"""
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+import decoder
+import metrics
+
+# Mean absolute difference (0-255) between thumbnails below which a frame is "the same"
+DEFAULT_DIFF_THRESHOLD = float(os.environ.get('VIDEO_DIFF_THRESHOLD', '4'))
+DEFAULT_SEEN_TTL = float(os.environ.get('VIDEO_SEEN_TTL', '30'))
+# Later frames give more chances, so each frame only gets the cheap rungs
+VIDEO_LADDER = ('downscale', 'roi_center')
+VIDEO_BUDGET_MS = 80
+SIGNATURE_SIDE = 32
+
+def frame_signature(img):
+    gray = img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(gray, (SIGNATURE_SIDE, SIGNATURE_SIDE), interpolation=cv2.INTER_AREA).astype(np.int16)
+
+def frame_difference(a, b):
+    return float(np.abs(a - b).mean())
+
+class SeenCodes:
+    """Codes seen recently, keyed to the video clock so replaying a file behaves like live capture."""
+    def __init__(self, ttl=DEFAULT_SEEN_TTL):
+        self.ttl = ttl
+        self._last_seen = {}
+
+    def check_and_mark(self, code, now):
+        """True if code is new (or its last sighting has expired); always refreshes the sighting."""
+        last = self._last_seen.get(code)
+        self._last_seen[code] = now
+        return last is None or now - last > self.ttl
+
+    def expire(self, now):
+        stale = [c for c, t in self._last_seen.items() if now - t > self.ttl]
+        for c in stale:
+            del self._last_seen[c]
+
+    def __len__(self):
+        return len(self._last_seen)
+
+class VideoScanner:
+    def __init__(self, engine=None, diff_threshold=DEFAULT_DIFF_THRESHOLD, seen_ttl=DEFAULT_SEEN_TTL):
+        self.engine = engine or decoder.DecoderEngine(ladder=VIDEO_LADDER, budget_ms=VIDEO_BUDGET_MS)
+        self.diff_threshold = diff_threshold
+        self.seen = SeenCodes(seen_ttl)
+        self._last_signature = None
+        self.frames = 0
+        self.decoded = 0
+        self.skipped_similar = 0
+        self.codes = 0
+        self.elapsed_s = 0.0
+
+    def process_frame(self, frame, now):
+        """Returns [(code, symbology)] first seen in this frame."""
+        self.frames += 1
+        signature = frame_signature(frame)
+        if self._last_signature is not None and \
+                frame_difference(signature, self._last_signature) < self.diff_threshold:
+            self.skipped_similar += 1
+            metrics.inc('video_frames_total', outcome='skipped_similar')
+            return []
+        self._last_signature = signature
+        self.decoded += 1
+        metrics.inc('video_frames_total', outcome='decoded')
+
+        result = self.engine.decode_image(frame, multi=True)
+        fresh = [(code, symbology) for code, symbology in result.codes
+                 if self.seen.check_and_mark(code, now)]
+        if self.decoded % 100 == 0:
+            self.seen.expire(now)
+        self.codes += len(fresh)
+        return fresh
+
+    def scan(self, source, max_seconds=None, max_frames=None):
+        """
+        Generator over a cv2.VideoCapture source (device index or file path).
+        Yields (frame_index, new_codes, frame) for frames that produced new codes.
+        """
+        capture = cv2.VideoCapture(source)
+        if not capture.isOpened():
+            raise IOError(f"Could not open video source {source!r}")
+        live = isinstance(source, int)
+        started = time.perf_counter()
+        index = 0
+        try:
+            while True:
+                if max_frames is not None and index >= max_frames:
+                    break
+                if max_seconds is not None and time.perf_counter() - started >= max_seconds:
+                    break
+                ok, frame = capture.read()
+                if not ok:
+                    break
+                # Files are timed by their own clock; live feeds by the wall clock
+                now = time.monotonic() if live else capture.get(cv2.CAP_PROP_POS_MSEC) / 1000
+                with metrics.timer('video_frame_ms'):
+                    fresh = self.process_frame(frame, now)
+                if fresh:
+                    yield index, fresh, frame
+                index += 1
+        finally:
+            capture.release()
+            self.elapsed_s += time.perf_counter() - started
+
+    def stats(self):
+        return {
+            'frames': self.frames,
+            'decoded': self.decoded,
+            'skipped_similar': self.skipped_similar,
+            'codes': self.codes,
+            'elapsed_s': round(self.elapsed_s, 2),
+            'frames_per_s': round(self.frames / self.elapsed_s, 1) if self.elapsed_s else None,
+            'codes_per_s': round(self.codes / self.elapsed_s, 2) if self.elapsed_s else None,
+        }
+
+def encode_jpeg(frame, quality=85):
+    ok, buf = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return buf.tobytes() if ok else None
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Scan barcodes/QR codes from a video file or camera device.")
+    parser.add_argument('source', help="video file path or camera device index")
+    parser.add_argument('--seconds', type=float, help="stop after this many seconds")
+    parser.add_argument('--diff-threshold', type=float, default=DEFAULT_DIFF_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    source = int(args.source) if args.source.isdigit() else args.source
+    scanner = VideoScanner(diff_threshold=args.diff_threshold)
+    try:
+        for index, fresh, _ in scanner.scan(source, max_seconds=args.seconds):
+            for code, symbology in fresh:
+                print(f"frame {index}: {code} ({symbology})")
+    except IOError as e:
+        print(e)
+        return 1
+    print(scanner.stats())
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())